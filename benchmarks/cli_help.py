@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Measures how long `python -m pokedex help` spends importing modules,
+using Python's `-X importtime`.
+
+Imports Python makes when it starts up anyway aren't counted.  Each run is a
+new process; the median and fastest totals are reported, along with the
+slowest top-level imports of the fastest run.  Needs Python 3.7.
+"""
+from __future__ import division, print_function
+
+import argparse
+import subprocess
+import sys
+
+
+def import_times(*args):
+    """Runs Python with `-X importtime` and the given arguments, and returns
+    a list of `(module, cumulative seconds, depth)` for every import.
+    """
+    stderr = subprocess.check_output(
+        [sys.executable, '-X', 'importtime'] + list(args),
+        stderr=subprocess.STDOUT)
+
+    times = []
+    for line in stderr.decode('utf8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), int(cumulative) / 1e6, depth))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--runs', type=int, default=10,
+                        help=u'number of processes to start')
+    parser.add_argument('--top', type=int, default=5,
+                        help=u'number of slowest imports to list')
+    args = parser.parse_args()
+
+    if sys.version_info < (3, 7):
+        sys.exit(u'-X importtime needs Python 3.7')
+
+    startup = set(name for name, seconds, depth in import_times('-c', 'pass'))
+
+    runs = []
+    for i in range(args.runs):
+        times = [(name, seconds, depth)
+                 for name, seconds, depth
+                 in import_times('-m', 'pokedex', 'help')
+                 if name not in startup and depth == 0]
+        runs.append((sum(seconds for name, seconds, depth in times), times))
+    runs.sort(key=lambda run: run[0])
+
+    print(u'%d runs' % len(runs))
+    print(u'%-20s %10s %10s' % (u'', u'median ms', u'min ms'))
+    print(u'%-20s %10.1f %10.1f' % (
+        u'imports', runs[len(runs) // 2][0] * 1000, runs[0][0] * 1000))
+    print()
+    print(u'Slowest imports of the fastest run:')
+    for name, seconds, depth in sorted(runs[0][1],
+                                       key=lambda row: -row[1])[:args.top]:
+        print(u'%-40s %8.1f ms' % (name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Compares filtering and ordering by name in the default language through
+the association proxies, e.g. `Move.name == u'Tackle'`, with doing the same
+after `query.with_local_names(Move)`.
+
+The proxies compile to correlated subqueries: EXISTS for a filter, and a
+scalar subquery for ordering.  with_local_names() joins the names table once
+instead.  Each query is run a number of times, and the median is reported.
+Only ids are selected, so that the time is the database's, not the ORM's.
+"""
+from __future__ import division, print_function
+
+import argparse
+import time
+
+from sqlalchemy.sql.expression import bindparam, select
+
+import pokedex.db
+from pokedex.db import tables
+
+# (table, names to look for)
+FILTERS = [
+    (tables.PokemonSpecies, [u'Eevee', u'Marowak', u'Zygarde']),
+    (tables.Move, [u'Tackle', u'Thunderbolt', u'Hyperspace Fury']),
+    (tables.Item, [u'Master Ball', u'Leftovers', u'Zap Plate']),
+]
+
+ORDERS = [tables.PokemonSpecies, tables.Move, tables.Item]
+
+
+def subquery_name(table):
+    """The default language's name, as a correlated scalar subquery, like
+    the proxy's own `__clause_element__`.
+    """
+    names = table.names_table
+    query = select([names.name])
+    query = query.where(names.foreign_id == table.id)
+    query = query.where(
+        names.local_language_id == bindparam('_default_language_id'))
+    return query.as_scalar()
+
+
+def filter_exists(session, table, name):
+    return session.query(table.id).filter(table.name == name)
+
+def filter_join(session, table, name):
+    query = session.query(table.id).with_local_names(table)
+    return query.filter(table.names_table.name == name)
+
+def order_subquery(session, table):
+    return session.query(table.id).order_by(subquery_name(table), table.id)
+
+def order_join(session, table):
+    query = session.query(table.id).with_local_names(table, outer=True)
+    return query.order_by(table.names_table.name, table.id)
+
+
+def median_time(session, make_query, runs):
+    """Runs the query `runs` times, and returns the median time and the
+    ids it found.
+    """
+    times = []
+    for i in range(runs):
+        session.expunge_all()
+        start = time.time()
+        ids = [row.id for row in make_query()]
+        times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2], ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-e', '--engine', dest='engine_uri', default=None)
+    parser.add_argument('-n', '--runs', type=int, default=20,
+                        help=u'times to run each query')
+    args = parser.parse_args()
+
+    session = pokedex.db.connect(args.engine_uri)
+
+    rows = []
+    for table, names in FILTERS:
+        for name in names:
+            rows.append((u'%s = %s' % (table.__name__, name),
+                         lambda t=table, n=name: filter_exists(session, t, n),
+                         lambda t=table, n=name: filter_join(session, t, n)))
+    for table in ORDERS:
+        rows.append((u'%s by name' % table.__name__,
+                     lambda t=table: order_subquery(session, t),
+                     lambda t=table: order_join(session, t)))
+
+    print(u'%-40s %12s %12s %8s' % (
+        u'query', u'subquery ms', u'join ms', u'speedup'))
+    for label, subquery, join in rows:
+        subquery_time, subquery_ids = median_time(session, subquery, args.runs)
+        join_time, join_ids = median_time(session, join, args.runs)
+        if subquery_ids != join_ids:
+            raise AssertionError(u'%s: the results differ' % label)
+        print(u'%-40s %12.2f %12.2f %7.1fx' % (
+            label, subquery_time * 1000, join_time * 1000,
+            subquery_time / join_time))
+
+
+if __name__ == '__main__':
+    main()
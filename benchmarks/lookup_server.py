@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Load-tests `pokedex serve`, and reports latency percentiles.
+
+Starts a server with the given -e/-i/--lookup-backend options, unless --url
+points at one that's already running.  Then a number of clients, each with
+its own keep-alive connection, send a mix of requests as fast as they can,
+and the time each one takes to come back is recorded.
+"""
+from __future__ import division, print_function
+
+import argparse
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from six.moves import http_client
+from six.moves.urllib.parse import quote, unquote, urlsplit
+
+import pokedex.lookup
+
+REQUESTS = [
+    # Exact, in a few languages
+    u'/lookup?q=eevee',
+    u'/lookup?q=%s' % quote(u'イーブイ'.encode('utf8')),
+    u'/lookup?q=master%20ball',
+    u'/lookup?q=pokemon:133',
+    # Fuzzy and wildcard
+    u'/lookup?q=eevey',
+    u'/lookup?q=thunderbolr',
+    u'/lookup?q=*chu',
+    # Prefix and autocomplete
+    u'/prefix?q=pika',
+    u'/autocomplete?q=p',
+    u'/autocomplete?q=char',
+    u'/autocomplete?q=thu&type=move',
+    # Random
+    u'/random',
+]
+
+
+def percentile(times, fraction):
+    """Returns the given percentile of the sorted list `times`."""
+    index = min(int(len(times) * fraction), len(times) - 1)
+    return times[index]
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server(args):
+    """Runs `pokedex serve` in a subprocess, and waits for it to listen."""
+    port = free_port()
+    command = [sys.executable, '-m', 'pokedex', 'serve',
+               '--port', str(port), '--threads', str(args.threads)]
+    if args.engine_uri:
+        command += ['-e', args.engine_uri]
+    if args.index_dir:
+        command += ['-i', args.index_dir]
+    if args.lookup_backend:
+        command += ['--lookup-backend', args.lookup_backend]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+
+    # It says so once it's warmed up and listening
+    for line in iter(process.stdout.readline, b''):
+        if line.startswith(b'Serving'):
+            return process, 'http://127.0.0.1:%d' % port
+    raise RuntimeError("The server didn't start")
+
+
+def client(host, port, count, offset, times, errors):
+    """Sends `count` requests over one connection, and appends
+    `(path, seconds)` to `times` for each.
+    """
+    connection = http_client.HTTPConnection(host, port)
+    for i in range(count):
+        path = REQUESTS[(offset + i) % len(REQUESTS)]
+        start = time.time()
+        connection.request('GET', path)
+        response = connection.getresponse()
+        body = response.read()
+        times.append((path, time.time() - start))
+        if response.status != 200:
+            errors.append((path, response.status, body))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-e', '--engine', dest='engine_uri', default=None)
+    parser.add_argument('-i', '--index', dest='index_dir', default=None)
+    parser.add_argument('--lookup-backend', default=None,
+                        choices=sorted(pokedex.lookup.backends))
+    parser.add_argument('--url', default=None,
+                        help=u'use an already running server')
+    parser.add_argument('-t', '--threads', type=int, default=4,
+                        help=u'worker threads for the server to start')
+    parser.add_argument('-c', '--clients', type=int, default=8,
+                        help=u'number of concurrent clients')
+    parser.add_argument('-n', '--requests', type=int, default=2000,
+                        help=u'total number of requests')
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args)
+
+    try:
+        address = urlsplit(url)
+        # One pass through everything first, so nothing is cold
+        client(address.hostname, address.port, len(REQUESTS), 0, [], [])
+
+        times = []
+        errors = []
+        per_client = args.requests // args.clients
+        threads = [
+            threading.Thread(target=client, args=(
+                address.hostname, address.port, per_client, i, times, errors))
+            for i in range(args.clients)
+        ]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    # Fuzzy lookups are far slower than everything else, so break the
+    # numbers down by request, not just by endpoint
+    by_path = {}
+    for path, seconds in times:
+        by_path.setdefault(path, []).append(seconds)
+    rows = [(unquote(path), by_path[path]) for path in REQUESTS]
+    rows.append((u'all', [seconds for path, seconds in times]))
+
+    print(u'%d requests from %d clients in %.2fs: %.0f requests/s' % (
+        len(times), args.clients, elapsed, len(times) / elapsed))
+    print(u'%-32s %8s %10s %10s %10s' % (
+        u'request', u'count', u'p50 ms', u'p99 ms', u'max ms'))
+    for label, path_times in rows:
+        path_times.sort()
+        print(u'%-32s %8d %10.2f %10.2f %10.2f' % (
+            label, len(path_times),
+            percentile(path_times, 0.50) * 1000,
+            percentile(path_times, 0.99) * 1000,
+            path_times[-1] * 1000))
+
+    if errors:
+        print(u'%d errors; the first was:' % len(errors))
+        print(errors[0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Benchmarks wildcard lookups, with and without the n-gram index.
+
+For each pattern, times the backend's own wildcard search against narrowing
+the names down with the n-gram index first, and checks that both find the
+same documents.  Hydrating the results into database objects costs the same
+either way, so it's left out.
+"""
+from __future__ import print_function
+
+import argparse
+import timeit
+
+import pokedex.db
+import pokedex.lookup
+from pokedex.lookup.backend import Query, WILDCARD
+
+PATTERNS = [
+    # Leading: no literal prefix at all
+    (u'leading', u'*chu'),
+    (u'leading', u'*ite'),
+    (u'leading', u'*ball'),
+    # Infix: a short literal prefix, and more text later
+    (u'infix', u'*ee*'),
+    (u'infix', u'p*chu'),
+    (u'infix', u'*ar?e*'),
+    # Trailing: a literal prefix
+    (u'trailing', u'pika*'),
+    (u'trailing', u'char*'),
+    (u'trailing', u'thunder?*'),
+]
+
+
+def best_time(function, repeat):
+    """Returns the best time in milliseconds of a few runs of `function`."""
+    timer = timeit.Timer(function)
+    # Run enough times to take at least 0.2 seconds
+    number = 1
+    while timer.timeit(number) < 0.2:
+        number *= 10
+    return min(timer.repeat(repeat, number)) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-e', '--engine', dest='engine_uri', default=None)
+    parser.add_argument('-i', '--index', dest='index_dir', default=None)
+    parser.add_argument('--lookup-backend', default=None,
+                        choices=sorted(pokedex.lookup.backends))
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help=u'number of timing runs per pattern')
+    args = parser.parse_args()
+
+    session = pokedex.db.connect(args.engine_uri)
+    lookup = pokedex.lookup.PokedexLookup(args.index_dir, session,
+                                          backend=args.lookup_backend)
+    ranking = lookup._ranking()
+    limit = lookup.MAX_EXACT_RESULTS * lookup.INTERMEDIATE_FACTOR
+
+    # Load the n-gram index up front; that's a one-time cost
+    lookup._get_ngram_index()
+
+    print(u'Backend: %s' % type(lookup.backend).__name__)
+    print(u'%-9s %-11s %8s %12s %12s %8s' % (
+        u'kind', u'pattern', u'results', u'backend ms', u'n-gram ms',
+        u'speedup'))
+
+    for kind, pattern in PATTERNS:
+        def plain():
+            return lookup.backend.search(
+                Query(WILDCARD, pattern, None, None), ranking, limit=limit)
+
+        def narrowed():
+            names = lookup._get_ngram_index().match(pattern)
+            return lookup.backend.search(
+                Query(WILDCARD, pattern, None, None) if names is None
+                else Query(pokedex.lookup.ANY, names, None, None),
+                ranking, limit=limit)
+
+        expected = plain()
+        assert narrowed() == expected, pattern
+
+        plain_time = best_time(plain, args.repeat)
+        narrowed_time = best_time(narrowed, args.repeat)
+        print(u'%-9s %-11s %8d %12.2f %12.2f %7.1fx' % (
+            kind, pattern, len(expected), plain_time, narrowed_time,
+            plain_time / narrowed_time))
+
+
+if __name__ == '__main__':
+    main()
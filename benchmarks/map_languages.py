@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Compares loading every language into the `(column)_map` proxies of a big
+table, via `session.preload_language(maps=True)`, with loading only some, via
+`query.with_languages()`.  Either way, it's one query per translation table.
+
+Reports the number of translation rows loaded, the time taken, and the
+memory allocated meanwhile.
+"""
+from __future__ import division, print_function
+
+import argparse
+import time
+import tracemalloc
+
+import pokedex.db
+from pokedex.db import tables, util
+
+TABLES = [tables.PokemonSpecies, tables.Move, tables.Item, tables.Ability]
+
+
+def load(session, table, languages):
+    """Loads all of `table` and its translations in `languages`, or in every
+    language if that's None.  Returns the number of translation rows.
+    """
+    session.expunge_all()
+    query = session.query(table)
+    if languages is None:
+        objects = query.all()
+        session.preload_language(classes=[table], maps=True)
+    else:
+        objects = query.with_languages(*languages).all()
+    return sum(len(getattr(obj, translation_class.relation_name))
+               for obj in objects
+               for translation_class in table.translation_classes)
+
+
+def measure(session, table, languages):
+    """Returns (translation rows, seconds, bytes allocated) for load()."""
+    start = time.time()
+    load(session, table, languages)
+    elapsed = time.time() - start
+
+    # Tracing allocations slows everything down, so measure separately
+    tracemalloc.start()
+    rows = load(session, table, languages)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-e', '--engine', dest='engine_uri', default=None)
+    parser.add_argument('-l', '--languages', default=u'en,ja',
+                        help=u'comma-separated language identifiers to load')
+    args = parser.parse_args()
+
+    session = pokedex.db.connect(args.engine_uri)
+    identifiers = args.languages.split(u',')
+
+    print(u'%-16s %-8s %8s %10s %10s' % (
+        u'table', u'load', u'rows', u'ms', u'KiB'))
+    for table in TABLES:
+        for label in u'all', args.languages:
+            languages = None
+            if label != u'all':
+                languages = [util.get(session, tables.Language, identifier)
+                             for identifier in identifiers]
+            rows, elapsed, size = measure(session, table, languages)
+            print(u'%-16s %-8s %8d %10.0f %10.0f' % (
+                table.__name__, label, rows, elapsed * 1000, size / 1024))
+
+
+if __name__ == '__main__':
+    main()
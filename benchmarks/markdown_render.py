@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Times rendering every move's effect text to HTML three ways: with a new
+Markdown instance per text, as as_html() used to; with the extension's pool
+of reused instances; and through the render cache, once it's warm.
+
+Each way renders all the effects a number of times, and the median is
+reported.
+"""
+from __future__ import division, print_function
+
+import argparse
+import time
+
+import markdown as python_markdown
+
+import pokedex.db
+from pokedex.db import markdown, tables
+
+
+def render_fresh(texts, extension):
+    for text in texts:
+        md = python_markdown.Markdown(
+            extensions=['extra', extension],
+            safe_mode='escape',
+            output_format='xhtml1',
+        )
+        md.convert(text.source_text)
+
+def render_pooled(texts, extension):
+    for text in texts:
+        md = extension.get_markdown()
+        md.convert(text.source_text)
+        extension.release_markdown(md)
+
+def render_cached(texts, extension):
+    for text in texts:
+        text.as_html(extension=extension)
+
+
+def median_time(render, texts, extension, runs):
+    times = []
+    for i in range(runs):
+        start = time.time()
+        render(texts, extension)
+        times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-e', '--engine', dest='engine_uri', default=None)
+    parser.add_argument('-n', '--runs', type=int, default=5,
+                        help=u'times to render all the effects')
+    args = parser.parse_args()
+
+    session = pokedex.db.connect(args.engine_uri)
+    texts = [move.effect for move in session.query(tables.Move)
+             if move.effect is not None]
+    extension = session.markdown_extension
+
+    cache = extension.render_cache = markdown.RenderCache()
+    render_cached(texts, extension)
+    cache.reset_stats()
+
+    print(u'%d effects' % len(texts))
+    print(u'%-10s %10s %12s' % (u'', u'total ms', u'per text us'))
+    for label, render in [(u'fresh', render_fresh),
+                          (u'pooled', render_pooled),
+                          (u'cached', render_cached)]:
+        elapsed = median_time(render, texts, extension, args.runs)
+        print(u'%-10s %10.1f %12.1f' % (
+            label, elapsed * 1000, elapsed / len(texts) * 1e6))
+    print(u'cache: %d hits, %d misses' % (cache.hits, cache.misses))
+
+
+if __name__ == '__main__':
+    main()
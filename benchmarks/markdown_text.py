@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Measures the throughput of `MarkdownString.as_text()` over every move's
+effect and short effect.
+
+The first pass starts with nothing cached, so it includes looking up the
+names of linked things; the following ones show the steady state.  The
+median of those is reported.
+"""
+from __future__ import division, print_function
+
+import argparse
+import time
+
+import pokedex.db
+from pokedex.db import tables
+
+
+def run(texts):
+    start = time.time()
+    for text in texts:
+        text.as_text()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-e', '--engine', dest='engine_uri', default=None)
+    parser.add_argument('-n', '--runs', type=int, default=20,
+                        help=u'times to convert all the effects')
+    args = parser.parse_args()
+
+    session = pokedex.db.connect(args.engine_uri)
+    texts = []
+    for move in session.query(tables.Move):
+        for text in move.effect, move.short_effect:
+            if text is not None:
+                texts.append(text)
+    session.markdown_extension.clear_cache()
+
+    cold = run(texts)
+    times = sorted(run(texts) for i in range(args.runs))
+    warm = times[len(times) // 2]
+
+    print(u'%d texts' % len(texts))
+    print(u'%-10s %10s %12s %12s' % (u'', u'total ms', u'per text us',
+                                     u'texts/s'))
+    for label, elapsed in (u'cold', cold), (u'warm', warm):
+        print(u'%-10s %10.1f %12.1f %12.0f' % (
+            label, elapsed * 1000, elapsed / len(texts) * 1e6,
+            len(texts) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Measures how long a fresh process takes to get from importing
+pokedex.db.tables to the result of its first query.
+
+Each run is a new Python process, since everything measured here only
+happens once per process.  The time is split into importing SQLAlchemy,
+importing the tables, and connecting plus running the first query, which is
+also when SQLAlchemy configures the mappers.
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Run in each child process; prints the times in seconds, as JSON
+CHILD = u"""
+import json, sys, time
+start = time.time()
+import sqlalchemy.orm, sqlalchemy.ext.declarative
+imported_sqlalchemy = time.time()
+import pokedex.db
+from pokedex.db import tables
+imported_tables = time.time()
+session = pokedex.db.connect(sys.argv[1])
+species = session.query(tables.PokemonSpecies).filter_by(
+    identifier=u'eevee').one()
+species.name
+queried = time.time()
+print(json.dumps([imported_sqlalchemy - start,
+                  imported_tables - imported_sqlalchemy,
+                  queried - imported_tables,
+                  queried - start]))
+"""
+
+COLUMNS = [u'import sqlalchemy', u'import tables', u'first query', u'total']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-e', '--engine', dest='engine_uri', default=None)
+    parser.add_argument('-n', '--runs', type=int, default=10,
+                        help=u'number of processes to start')
+    args = parser.parse_args()
+
+    engine_uri = args.engine_uri
+    if engine_uri is None:
+        from pokedex.defaults import get_default_db_uri
+        engine_uri = get_default_db_uri()
+
+    runs = []
+    for i in range(args.runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', CHILD, engine_uri])
+        runs.append(json.loads(output.decode('utf8').splitlines()[-1]))
+
+    print(u'%d runs' % len(runs))
+    print(u'%-20s %10s %10s' % (u'', u'median ms', u'min ms'))
+    for i, label in enumerate(COLUMNS):
+        times = sorted(run[i] for run in runs)
+        print(u'%-20s %10.0f %10.0f' % (
+            label, times[len(times) // 2] * 1000, times[0] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Times `pokedex.db.util.get()` with and without its query cache, and
+reports the cache's hit rates.
+
+Without the cache, every call builds its query and compiles it to SQL from
+scratch; with it, that's done once per shape of query, and only the
+parameters change.  Objects are expunged between calls, so each call goes
+to the database.
+"""
+from __future__ import division, print_function
+
+import argparse
+import time
+
+import pokedex.db
+from pokedex.db import tables, util
+
+# (label, table, keyword arguments for get())
+LOOKUPS = [
+    (u'identifier', tables.PokemonSpecies, dict(identifier=u'eevee')),
+    (u'identifier', tables.Move, dict(identifier=u'thunderbolt')),
+    (u'identifier', tables.Item, dict(identifier=u'master-ball')),
+    (u'name', tables.PokemonSpecies, dict(name=u'Eevee')),
+    (u'name', tables.Move, dict(name=u'Thunderbolt')),
+    (u'name', tables.Item, dict(name=u'Master Ball')),
+    (u'french name', tables.Move, dict(name=u'Tonnerre', language=u'fr')),
+]
+
+
+def run(session, lookups, runs):
+    """Returns the median time each lookup takes."""
+    medians = []
+    for label, table, kwargs in lookups:
+        times = []
+        for i in range(runs):
+            session.expunge_all()
+            start = time.time()
+            util.get(session, table, **kwargs)
+            times.append(time.time() - start)
+        times.sort()
+        medians.append(times[len(times) // 2])
+    return medians
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-e', '--engine', dest='engine_uri', default=None)
+    parser.add_argument('-n', '--runs', type=int, default=200,
+                        help=u'times to run each lookup')
+    args = parser.parse_args()
+
+    session = pokedex.db.connect(args.engine_uri)()
+    lookups = []
+    for label, table, kwargs in LOOKUPS:
+        kwargs = dict(kwargs)
+        if 'language' in kwargs:
+            kwargs['language'] = util.get(
+                session, tables.Language, kwargs['language'])
+        lookups.append((label, table, kwargs))
+
+    session.enable_baked_queries = False
+    uncached = run(session, lookups, args.runs)
+    session.enable_baked_queries = True
+    util.bakery.cache.reset_stats()
+    cached = run(session, lookups, args.runs)
+
+    print(u'%-32s %12s %12s %8s' % (
+        u'get()', u'uncached us', u'cached us', u'speedup'))
+    for (label, table, kwargs), before, after in zip(
+            lookups, uncached, cached):
+        print(u'%-32s %12.0f %12.0f %7.1fx' % (
+            u'%s by %s' % (table.__name__, label),
+            before * 1e6, after * 1e6, before / after))
+
+    cache = util.bakery.cache
+    for kind in cache.kinds:
+        if cache.hit_rate(kind) is None:
+            continue
+        print(u'%s cache: %d hits, %d misses, %.1f%% hit rate' % (
+            kind, cache.hits[kind], cache.misses[kind],
+            cache.hit_rate(kind) * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,8 @@ def pytest_addoption(parser):
         help="Pokedex database URI")
     group.addoption("--index", action="store", default=None,
         help="Path to index directory")
+    group.addoption("--lookup-backend", action="store", default=None,
+        help="Lookup backend to test (default: whoosh)")
     group.addoption("--media-root", action="store", default=None,
         help="Root for the media files (if not specified and pokedex/data/media doesn't exist, tests are skipped)")
     group.addoption("--all", action="store_true", default=False,
@@ -31,7 +33,8 @@ def session(request):
 def lookup(request, session):
     import pokedex.lookup
     index_dir = request.config.getvalue("index")
-    return pokedex.lookup.PokedexLookup(index_dir, session)
+    backend = request.config.getvalue("lookup_backend")
+    return pokedex.lookup.PokedexLookup(index_dir, session, backend=backend)
 
 @pytest.fixture(scope="session")
 def media_root(request):
@@ -1,6 +1,3 @@
-from pokedex.search import search
-
-
 def configure_parser(parser):
     parser.set_defaults(func=command_search)
 
@@ -16,6 +13,7 @@ def configure_parser(parser):
 
 def command_search(parser, args):
     from pokedex.main import get_session
+    from pokedex.search import search
     session = get_session(args)
     results = search(session, **vars(args))
     for result in results:
@@ -1,6 +1,7 @@
 """Things missing from older versions of Python
 
-Currently these are functions missing from Python 2.5.
+Currently these are functions missing from Python 2.5, and lru_cache, which
+is missing from Python 2.
 """
 from __future__ import print_function
 import six
@@ -151,3 +152,29 @@ except ImportError:
             pass
 
         return result
+
+try:
+    from functools import lru_cache
+except ImportError:
+    import functools
+
+    # A simpler stand-in, which forgets everything when it fills up rather
+    # than keeping track of what was used recently
+    def lru_cache(maxsize=128):
+        def decorator(function):
+            cache = {}
+
+            @functools.wraps(function)
+            def wrapper(*args):
+                try:
+                    return cache[args]
+                except KeyError:
+                    pass
+                if len(cache) >= maxsize:
+                    cache.clear()
+                result = cache[args] = function(*args)
+                return result
+
+            wrapper.cache_clear = cache.clear
+            return wrapper
+        return decorator
@@ -0,0 +1,318 @@
+# encoding: utf8
+u"""A background process that keeps the database and lookup index open, so
+that `pokedex lookup` and `pokedex search` don't start from scratch every
+time they're run.
+
+It's opt-in.  `pokedex daemon` runs one in the foreground; or, with the
+POKEDEX_DAEMON environment variable set to 1, the CLI starts one in the
+background whenever it doesn't find one running.  While one is running, those
+commands are sent to it over a Unix socket, and their output is sent back.
+It exits after sitting idle for a while, and commands that change the data,
+like `pokedex load`, stop it first.
+
+This module is imported on every run of the CLI, before anything else, so it
+should stick to the standard library, and import the slower parts of that
+only where they're needed.
+"""
+from __future__ import print_function
+
+import errno
+import json
+import os
+import socket
+import sys
+
+# Commands the daemon runs
+FORWARDED_COMMANDS = ('lookup', 'search')
+
+# Commands that change the database or index, so a daemon should stop
+DATA_COMMANDS = ('load', 'setup', 'reindex', 'render')
+
+# Options that can come before the command, and whether they take a value
+COMMON_OPTIONS = {
+    '-e': True, '--engine': True,
+    '-i': True, '--index': True,
+    '--lookup-backend': True,
+    '-q': False, '--quiet': False,
+    '-v': False, '--verbose': False,
+}
+
+# Environment variables that affect the commands, and so are sent along
+ENVIRONMENT = ('POKEDEX_DB_ENGINE', 'POKEDEX_INDEX_DIR',
+               'POKEDEX_LOOKUP_BACKEND')
+
+# Seconds to wait for another command before exiting
+DEFAULT_IDLE_TIMEOUT = 600
+
+# Seconds to wait for a client to send its command
+REQUEST_TIMEOUT = 10
+
+
+def get_socket_path():
+    """Returns where the daemon's socket lives: the POKEDEX_DAEMON_SOCKET
+    environment variable, or a file in the temp directory.
+    """
+    path = os.environ.get('POKEDEX_DAEMON_SOCKET')
+    if path is None:
+        import tempfile
+        path = os.path.join(tempfile.gettempdir(),
+                            'pokedex-%d.sock' % os.getuid())
+    return path
+
+def command_name(argv):
+    """Returns the name of the command in the CLI arguments `argv`, or None
+    if there isn't one.
+    """
+    argv = list(argv)
+    while argv:
+        arg = argv.pop(0)
+        if arg.split('=', 1)[0] in COMMON_OPTIONS:
+            if COMMON_OPTIONS[arg.split('=', 1)[0]] and '=' not in arg:
+                # Skip the value too
+                argv[:1] = []
+        elif arg.startswith('-'):
+            return None
+        else:
+            return arg
+    return None
+
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message).encode('utf8') + b'\n')
+
+def _receive(sock):
+    line = sock.makefile('rb').readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf8'))
+
+def _connect(path=None):
+    """Returns a socket connected to the running daemon, or None if there
+    isn't one.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    if path is None:
+        path = get_socket_path()
+
+    try:
+        # Don't talk to a socket someone else put there
+        if os.stat(path).st_uid != os.getuid():
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+    except (OSError, IOError, socket.error):
+        return None
+    return sock
+
+
+def spawn():
+    """Starts a daemon in the background."""
+    import subprocess
+    with open(os.devnull, 'r+b') as devnull:
+        subprocess.Popen(
+            [sys.executable, '-m', 'pokedex', 'daemon'],
+            stdin=devnull, stdout=devnull, stderr=devnull,
+            close_fds=True, preexec_fn=os.setsid,
+        )
+
+def forward(argv):
+    """Runs the CLI arguments `argv` in the daemon, and prints its output.
+
+    Returns the exit status, or None if no daemon is running, in which case
+    the caller has to run the command itself.  If the POKEDEX_DAEMON
+    environment variable is 1, a daemon is started for next time.
+    """
+    sock = _connect()
+    if sock is None:
+        if os.environ.get('POKEDEX_DAEMON') == '1' and \
+                hasattr(socket, 'AF_UNIX'):
+            spawn()
+        return None
+
+    try:
+        _send(sock, dict(
+            argv=list(argv),
+            cwd=os.getcwd(),
+            environment=dict((name, os.environ.get(name))
+                             for name in ENVIRONMENT),
+        ))
+        response = _receive(sock)
+    except (OSError, IOError, socket.error, ValueError):
+        response = None
+    finally:
+        sock.close()
+
+    if response is None:
+        # It went away mid-command; nothing's been printed yet, so just run
+        # it here
+        return None
+
+    sys.stdout.write(response['stdout'])
+    sys.stdout.flush()
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+def stop(path=None):
+    """Stops the running daemon.  Returns whether there was one."""
+    sock = _connect(path)
+    if sock is None:
+        return False
+    try:
+        _send(sock, dict(stop=True))
+        _receive(sock)
+    except (OSError, IOError, socket.error, ValueError):
+        pass
+    finally:
+        sock.close()
+    return True
+
+
+class Daemon(object):
+    """Runs commands sent over a Unix socket, one at a time, until it's been
+    idle for `idle_timeout` seconds or is told to stop.
+
+    Sessions and lookups are kept in `cache` between commands; see
+    `pokedex.main.get_session` and `get_lookup`.
+    """
+    def __init__(self, path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        if path is None:
+            path = get_socket_path()
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.cache = {}
+        self.parser = None
+
+    def _listen(self):
+        """Returns a listening socket, or None if a daemon is already
+        running.
+        """
+        existing = _connect(self.path)
+        if existing is not None:
+            existing.close()
+            return None
+
+        # Left behind by one that died
+        try:
+            os.unlink(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        sock.listen(5)
+        return sock
+
+    def serve(self):
+        """Handles commands until it's time to stop.  Returns False right
+        away if another daemon is already running.
+        """
+        sock = self._listen()
+        if sock is None:
+            return False
+        inode = os.stat(self.path).st_ino
+
+        try:
+            sock.settimeout(self.idle_timeout)
+            while True:
+                try:
+                    connection, _ = sock.accept()
+                except socket.timeout:
+                    break
+                try:
+                    if not self.handle(connection):
+                        break
+                finally:
+                    connection.close()
+        finally:
+            sock.close()
+            # Only clean up the socket if it's still ours
+            try:
+                if os.stat(self.path).st_ino == inode:
+                    os.unlink(self.path)
+            except OSError:
+                pass
+
+        return True
+
+    def handle(self, connection):
+        """Handles one request.  Returns False if it was to stop."""
+        connection.settimeout(REQUEST_TIMEOUT)
+        try:
+            request = _receive(connection)
+        except (socket.error, ValueError):
+            return True
+        if request is None:
+            return True
+        connection.settimeout(None)
+
+        if request.get('stop'):
+            _send(connection, dict(stopped=True))
+            return False
+
+        status, stdout, stderr = self.run(
+            request['argv'], request['cwd'], request['environment'])
+        try:
+            _send(connection, dict(
+                status=status, stdout=stdout, stderr=stderr))
+        except socket.error:
+            pass
+        return True
+
+    def run(self, argv, cwd, environment):
+        """Runs a command with the given working directory and environment
+        variables.  Returns `(status, stdout, stderr)`.
+        """
+        import traceback
+        from six import StringIO
+        import pokedex.main
+
+        if self.parser is None:
+            self.parser = pokedex.main.create_parser()
+
+        old_cwd = os.getcwd()
+        old_environment = dict((name, os.environ.get(name))
+                               for name in ENVIRONMENT)
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        stdout = sys.stdout = StringIO()
+        stderr = sys.stderr = StringIO()
+        try:
+            os.chdir(cwd)
+            _set_environment(environment)
+
+            args = self.parser.parse_args(argv)
+            args.cache = self.cache
+            args.func(self.parser, args)
+            status = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+            _set_environment(old_environment)
+            os.chdir(old_cwd)
+
+            # Don't keep transactions open between commands
+            for key, value in self.cache.items():
+                if key[0] == 'session':
+                    value.rollback()
+
+        return status, stdout.getvalue(), stderr.getvalue()
+
+def _set_environment(environment):
+    for name, value in environment.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
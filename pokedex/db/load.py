@@ -9,9 +9,11 @@ import sys
 import six
 import sqlalchemy.sql.util
 import sqlalchemy.types
+from sqlalchemy.sql.expression import and_, bindparam, select
 
 import pokedex
-from pokedex.db import metadata, translations
+from pokedex.db import metadata, render, translations
+from pokedex.normalize import sort_keys
 from pokedex.defaults import get_default_csv_dir
 from pokedex.db.dependencies import find_dependent_tables
 from pokedex.db.oracle import rewrite_long_table_names
@@ -99,7 +101,7 @@ def _get_verbose_prints(verbose):
     return print_start, print_status, print_done
 
 
-def load(session, tables=[], directory=None, drop_tables=False, verbose=False, safe=True, recursive=True, langs=None):
+def load(session, tables=[], directory=None, drop_tables=False, verbose=False, safe=True, recursive=True, langs=None, reindex=False, render_prose=False):
     """Load data from CSV files into the given database session.
 
     Tables are created automatically.
@@ -129,6 +131,15 @@ def load(session, tables=[], directory=None, drop_tables=False, verbose=False, s
 
     `langs`
         List of identifiers of extra language to load, or None to load them all
+
+    `reindex`
+        If set to True, the lookup index is rebuilt inside the database too,
+        using the sqlite lookup backend.  SQLite only.
+
+    `render_prose`
+        If set to True, the Markdown prose is rendered ahead of time, as by
+        `pokedex render`.  Otherwise, any prose rendered before is dropped,
+        since the names it links to may have changed.
     """
 
     # First take care of verbosity
@@ -366,6 +377,64 @@ def load(session, tables=[], directory=None, drop_tables=False, verbose=False, s
 
     print_done()
 
+    sort_key_tables = [table_obj for table_obj in table_objs
+                       if 'sort_key' in table_obj.c]
+    if sort_key_tables:
+        print_start('Sort keys')
+        for n, table_obj in enumerate(sort_key_tables, 1):
+            _fill_sort_keys(session, table_obj)
+            print_status('%s/%s' % (n, len(sort_key_tables)))
+        print_done()
+
+    # Prose rendered from the old data might be out of date
+    render.metadata.drop_all(bind=session.connection())
+    session.commit()
+    session.markdown_extension.clear_cache()
+    # The tables have sort keys now; see pokedex.db.util.order_by_name
+    session.info.pop('pokedex_sort_keys', None)
+    if render_prose:
+        print_start('Rendered prose')
+        render.render_prose(session)
+        print_done()
+
+    if reindex:
+        # Imported here, since the lookup needs the database package
+        from pokedex.lookup import PokedexLookup
+
+        print_start('Lookup index')
+        PokedexLookup(session=session, backend='sqlite').rebuild_index()
+        session.commit()
+        print_done()
+
+
+def _fill_sort_keys(session, table_obj):
+    """Computes the sort_key column of a names table from the names."""
+    languages = metadata.tables['languages']
+    language_identifiers = dict(session.execute(
+        select([languages.c.id, languages.c.identifier])).fetchall())
+
+    key_columns = list(table_obj.primary_key.columns)
+    rows_by_language = {}
+    for row in session.execute(select(key_columns + [table_obj.c.name])):
+        rows_by_language.setdefault(row.local_language_id, []).append(row)
+
+    update_stmt = table_obj.update().where(and_(*[
+        column == bindparam('_' + column.name) for column in key_columns
+    ])).values(sort_key=bindparam('_sort_key'))
+
+    params = []
+    for language_id, rows in rows_by_language.items():
+        keys = sort_keys([row.name for row in rows],
+                         language_identifiers.get(language_id))
+        for row, key in zip(rows, keys):
+            row_params = dict(('_' + column.name, row[column])
+                              for column in key_columns)
+            row_params['_sort_key'] = key
+            params.append(row_params)
+    if params:
+        session.execute(update_stmt, params)
+    session.commit()
+
 
 def dump(session, tables=[], directory=None, verbose=False, langs=None):
     """Dumps the contents of a database to a set of CSV files.  Probably not
@@ -415,12 +484,15 @@ def dump(session, tables=[], directory=None, verbose=False, langs=None):
             filename = '%s/%s.csv' % (directory, table_name)
 
         # CSV module only works with bytes on 2 and only works with text on 3!
+        # Derived columns are computed by load, rather than stored
+        table_columns = [col for col in table.columns
+                         if not col.info.get('derived')]
         if six.PY3:
             writer = csv.writer(open(filename, 'w', newline=''), lineterminator='\n')
-            columns = [col.name for col in table.columns]
+            columns = [col.name for col in table_columns]
         else:
             writer = csv.writer(open(filename, 'wb'), lineterminator='\n')
-            columns = [col.name.encode('utf8') for col in table.columns]
+            columns = [col.name.encode('utf8') for col in table_columns]
 
         # For name tables, always dump rows for official languages, as well as
         # for those in `langs` if specified.
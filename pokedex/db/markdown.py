@@ -11,11 +11,18 @@ which case it is replaced by the name of the thing linked to.
 """
 from __future__ import absolute_import
 
+import hashlib
+import io
+import json
+import os
 import re
+import tempfile
 
 import markdown
 import six
 from sqlalchemy.orm.session import object_session
+from sqlalchemy.sql import select
+from sqlalchemy.util import LRUCache
 try:
     # Markdown 2.1+
     from markdown.util import etree, AtomicString
@@ -23,6 +30,95 @@ except ImportError:
     # Old Markdown
     from markdown import etree, AtomicString
 
+class RenderCache(object):
+    """Keeps HTML rendered by `MarkdownString.as_html`.
+
+    Recently used HTML is kept in memory, up to `size` strings.  If
+    `directory` is given, everything rendered is also written there, one file
+    per string, so that it outlives the process and can be shared between
+    processes.
+
+    Caching is off unless a cache is set as a link extension's
+    `render_cache`, e.g. with `connect(session_args=dict(render_cache=...))`.
+
+    Keys are hex digests from `MarkdownString.cache_key`, which include a hash
+    of the text itself and the database's URL, so there's nothing to
+    invalidate when the text changes.  The names of linked objects aren't
+    part of the key, though: the extension's `clear_cache()`, which `pokedex
+    load` calls, clears its render cache too.
+    """
+
+    def __init__(self, size=2000, directory=None):
+        self.memory = LRUCache(size)
+        self.directory = directory
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.html')
+
+    def get(self, key):
+        """Returns the HTML stored under `key`, or None."""
+        html = self.memory.get(key)
+        if html is not None:
+            self.hits += 1
+            return html
+        if self.directory is not None:
+            try:
+                with io.open(self._path(key), encoding='utf8') as f:
+                    html = f.read()
+            except (IOError, OSError):
+                pass
+            else:
+                self.disk_hits += 1
+                self.memory[key] = html
+                return html
+        self.misses += 1
+        return None
+
+    def set(self, key, html):
+        self.memory[key] = html
+        if self.directory is None:
+            return
+        path = self._path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # Another process may have made it meanwhile
+                if not os.path.isdir(os.path.dirname(path)):
+                    raise
+        # Write to a temporary file and rename it into place, so that
+        # readers never see half a file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with io.open(fd, 'w', encoding='utf8') as f:
+                f.write(html)
+            if os.path.exists(path):
+                # os.rename won't replace files on Windows
+                os.remove(path)
+            os.rename(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def clear(self):
+        """Forgets everything, including what's on disk."""
+        self.memory.clear()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for subdirectory in os.listdir(self.directory):
+                subdirectory = os.path.join(self.directory, subdirectory)
+                if not os.path.isdir(subdirectory):
+                    continue
+                for filename in os.listdir(subdirectory):
+                    if filename.endswith('.html'):
+                        os.remove(os.path.join(subdirectory, filename))
+
 @six.python_2_unicode_compatible
 class MarkdownString(object):
     """Wraps a Markdown string.
@@ -65,13 +161,59 @@ class MarkdownString(object):
         if extension is None:
             extension = self.session.markdown_extension
 
-        md = markdown.Markdown(
-            extensions=['extra', extension],
-            safe_mode='escape',
-            output_format='xhtml1',
-        )
+        cache = extension.render_cache
+        key = None
+        if cache is not None:
+            key = self.cache_key(extension)
+        if key is not None:
+            html = cache.get(key)
+            if html is not None:
+                return html
+
+        html = None
+        if type(extension) is PokedexLinkExtension:
+            # `pokedex render` only renders with this one
+            stored = extension.get_stored_prose(self.content_hash())
+            if stored is not None:
+                html = stored[0]
+        if html is None:
+            html = self._render_html(extension)
+
+        if key is not None:
+            cache.set(key, html)
+        return html
+
+    def _render_html(self, extension):
+        extension.resolve_links([self.source_text])
+        md = extension.get_markdown()
+        try:
+            return md.convert(self.source_text)
+        finally:
+            extension.release_markdown(md)
 
-        return md.convert(self.source_text)
+    def content_hash(self):
+        """Returns a hash of the text and its language, which `pokedex render`
+        stores its renderings under.  See `content_hash` below.
+        """
+        default_language_id = self.session.default_language_id
+        if self.language is None:
+            language_id = default_language_id
+        else:
+            language_id = self.language.id
+        return content_hash(self.source_text, language_id, default_language_id)
+
+    def cache_key(self, extension):
+        """Returns the key as_html() caches the HTML under, for `extension`.
+
+        That's a hash of the text, its language, and the extension's own
+        `cache_key()`.  Returns None if the extension's output can't be
+        cached.
+        """
+        extension_key = extension.cache_key()
+        if extension_key is None:
+            return None
+        key = json.dumps([self.content_hash(), extension_key])
+        return hashlib.sha1(key.encode('utf8')).hexdigest()
 
     def as_text(self):
         """Returns the string in a plaintext-friendly form.
@@ -81,14 +223,42 @@ class MarkdownString(object):
         # Since Markdown is pretty readable by itself, we just have to replace
         # the links by their text.
         # XXX: The tables get unaligned
+        extension = self.session.markdown_extension
+        language = self.language
+
+        def replace(match):
+            label, category, target = match.groups()
+            if label:
+                return label
+            name = extension.get_link_name(category, target, language)
+            return name or target
+
+        return _link_re.sub(replace, self.source_text)
+
+def content_hash(source_text, language_id, default_language_id):
+    """Returns a hash of a Markdown text, the id of the language it's in, and
+    the id of the session's default language, which the names of linked
+    objects are in.  Those are all its renderings depend on, as long as the
+    database stays the same.
+    """
+    key = json.dumps([source_text, language_id, default_language_id])
+    return hashlib.sha1(key.encode('utf8')).hexdigest()
 
-        link_maker = PokedexLinkExtension(self.session)
-        pattern = PokedexLinkPattern(link_maker, self.session, self.language)
-        regex = '()%s()' % pattern.regex
-        def handleMatch(m):
-            return pattern.handleMatch(m).text
+def resolve_links(markdown_strings, extension=None):
+    """Looks up everything a batch of MarkdownStrings link to, with one query
+    per category, so that rendering them with `as_html(extension)` doesn't
+    need any more.
 
-        return re.sub(regex, handleMatch, self.source_text)
+    `extension` defaults to the first string's session's markdown_extension,
+    like as_html's.
+    """
+    markdown_strings = [string for string in markdown_strings if string]
+    if not markdown_strings:
+        return
+    if extension is None:
+        extension = markdown_strings[0].session.markdown_extension
+    extension.resolve_links(
+        [string.source_text for string in markdown_strings])
 
 def _markdownify_effect_text(move, effect_text, language=None):
     session = object_session(move)
@@ -164,7 +334,7 @@ class PokedexLinkPattern(markdown.inlinepatterns.Pattern):
 
     Handles matches using factory
     """
-    regex = u'(?x) \\[ ([^]]*) \\] \\{ ([-a-z0-9]+) : ([-a-z0-9 ]+) \\}'
+    regex = u'\\[([^]]*)\\]\\{([-a-z0-9]+):([-a-z0-9 ]+)\\}'
 
     def __init__(self, factory, session, string_language=None, game_language=None):
         markdown.inlinepatterns.Pattern.__init__(self, self.regex)
@@ -174,53 +344,16 @@ class PokedexLinkPattern(markdown.inlinepatterns.Pattern):
         self.game_language = game_language
 
     def handleMatch(self, m):
-        from pokedex.db import tables
         start, label, category, target, end = m.groups()
-        try:
-            table = dict(
-                    ability=tables.Ability,
-                    item=tables.Item,
-                    location=tables.Location,
-                    move=tables.Move,
-                    pokemon=tables.PokemonSpecies,
-                    type=tables.Type,
-                    form=tables.PokemonForm,
-                )[category]
-        except KeyError:
+        link = self.factory.get_link(category, target,
+                                     self.string_language, self.game_language)
+        if link is None:
             obj = name = target
             url = self.factory.identifier_url(category, obj)
         else:
-            session = self.session
-            if table is tables.PokemonForm:
-                form_ident, pokemon_ident = target.split()
-                query = session.query(table)
-                query = query.filter(
-                        tables.PokemonForm.form_identifier == form_ident)
-                query = query.join(tables.PokemonForm.pokemon)
-                query = query.join(tables.Pokemon.species)
-                query = query.filter(
-                        tables.PokemonSpecies.identifier == pokemon_ident)
-            else:
-                query = session.query(table)
-                query = query.filter(table.identifier == target)
-            try:
-                obj = query.one()
-            except Exception:
-                obj = name = target
-                url = self.factory.identifier_url(category, obj)
-            else:
-                url = self.factory.object_url(category, obj)
-                url = url or self.factory.identifier_url(category, target)
-                name = None
-                # Translations can be incomplete; in which case we want to use
-                # a fallback.
-                if table in [tables.Type] and self.string_language:
-                    # Type wants to be localized to the text language
-                    name = obj.name_map.get(self.string_language)
-                if not name and self.game_language:
-                    name = obj.name_map.get(self.game_language)
-                if not name:
-                    name = obj.name
+            obj, name = link
+            url = self.factory.object_url(category, obj)
+            url = url or self.factory.identifier_url(category, target)
         if url:
             el = self.factory.make_link(category, obj, url, label or name)
         else:
@@ -228,6 +361,35 @@ class PokedexLinkPattern(markdown.inlinepatterns.Pattern):
             el.text = AtomicString(label or name)
         return el
 
+# Finds (label, category, target) for each link in a text
+_link_re = re.compile(PokedexLinkPattern.regex)
+
+def _link_tables():
+    """Returns the tables links can point to, by category."""
+    from pokedex.db import tables
+    return dict(
+        ability=tables.Ability,
+        item=tables.Item,
+        location=tables.Location,
+        move=tables.Move,
+        pokemon=tables.PokemonSpecies,
+        type=tables.Type,
+        form=tables.PokemonForm,
+    )
+
+def _link_languages(table, string_language, game_language):
+    """Returns the languages to look for a linked object's name in, best
+    first.  The session's default language is the last resort.
+    """
+    from pokedex.db import tables
+    languages = []
+    if table in [tables.Type] and string_language:
+        # Type wants to be localized to the text language
+        languages.append(string_language)
+    if game_language:
+        languages.append(game_language)
+    return languages
+
 class PokedexLinkExtension(markdown.Extension):
     u"""Markdown extension that translates the syntax used in effect text:
 
@@ -235,8 +397,249 @@ class PokedexLinkExtension(markdown.Extension):
     where `category` is the table's singular name, and `label` is an optional
     link title that defaults to the object's name in the current language.
     """
+    # A `RenderCache` for `MarkdownString.as_html` to keep what it renders
+    # with this extension in; None to always render from scratch
+    render_cache = None
+
     def __init__(self, session):
         self.session = session
+        self._markdown_pool = []
+        # (category, target, language ids) -> (object, name), or None for
+        # links to nothing; filled in by resolve_links()
+        self._links = {}
+        # (category, language ids) -> {target: name}, for every object in
+        # the category; filled in by get_link_name()
+        self._link_names = {}
+        # Whether the database has prose from `pokedex render`; None if it's
+        # not been checked yet
+        self._has_stored_prose = None
+
+    def get_markdown(self):
+        """Returns a Markdown instance that uses this extension.
+
+        Setting one up takes longer than converting a typical text, so they're
+        reused: hand it back with `release_markdown()` when done.
+        """
+        try:
+            return self._markdown_pool.pop()
+        except IndexError:
+            return markdown.Markdown(
+                extensions=['extra', self],
+                safe_mode='escape',
+                output_format='xhtml1',
+            )
+
+    def release_markdown(self, md):
+        """Resets a Markdown instance from `get_markdown()`, and puts it
+        back in the pool.
+        """
+        md.reset()
+        self._markdown_pool.append(md)
+
+    def cache_key(self):
+        """Returns something JSON-serializable that identifies the HTML
+        this extension makes, for `MarkdownString.cache_key`.
+
+        By default that's the class, the database and the session's default
+        language, which the link text is in.  Override this if the links also
+        depend on how the instance was set up, or return None to turn off
+        caching.
+        """
+        cls = type(self)
+        url = self.session.get_bind().url
+        return [cls.__module__, getattr(cls, '__qualname__', cls.__name__),
+                repr(url), self.session.default_language_id]
+
+    def resolve_links(self, texts, string_language=None, game_language=None):
+        """Looks up everything `texts` link to, ahead of rendering them.
+
+        Links are grouped by category, and each category takes one query, no
+        matter how many links there are.  Links that were already looked up
+        are skipped.  Rendering looks links up here, so this is optional; it
+        just saves a query per link.
+        """
+        link_tables = _link_tables()
+        wanted = {}
+        for text in texts:
+            for label, category, target in _link_re.findall(text):
+                table = link_tables.get(category)
+                if table is None:
+                    continue
+                languages = _link_languages(
+                    table, string_language, game_language)
+                key = category, target, tuple(l.id for l in languages)
+                if self._cached_link(key) is not False:
+                    continue
+                group = wanted.setdefault((category, key[2]), (languages, {}))
+                group[1][target] = key
+
+        for (category, language_ids), (languages, keys) in wanted.items():
+            table = link_tables[category]
+            if table.__singlename__ == 'pokemon_form':
+                found = self._query_forms(keys)
+            else:
+                found = self._query_objects(table, keys, languages)
+            for target, key in keys.items():
+                results = found.get(target, ())
+                if len(results) == 1:
+                    self._links[key] = results[0]
+                else:
+                    # Missing, or ambiguous
+                    self._links[key] = None
+
+    def _cached_link(self, key):
+        """Returns what resolve_links() found for `key`, or False if it's not
+        been looked up (or its object has left the session since).
+        """
+        link = self._links.get(key, False)
+        if link and link[0] not in self.session:
+            return False
+        return link
+
+    def _query_objects(self, table, targets, languages):
+        from pokedex.db.multilang import FallbackColumn
+        # Translations can be incomplete; in which case we want to use a
+        # fallback.
+        name_column = FallbackColumn(table, 'name', languages)
+        query = self.session.query(table, name_column.column)
+        query = query.with_fallback(name_column)
+        query = query.filter(table.identifier.in_(list(targets)))
+        found = {}
+        for obj, name in query:
+            found.setdefault(obj.identifier, []).append((obj, name))
+        return found
+
+    def _query_forms(self, targets):
+        from pokedex.db import tables
+        # Form links look like {form:sky shaymin}
+        pairs = {}
+        for target in targets:
+            try:
+                form_identifier, species_identifier = target.split()
+            except ValueError:
+                continue
+            pairs[form_identifier, species_identifier] = target
+        if not pairs:
+            return {}
+        query = self.session.query(tables.PokemonForm,
+                                   tables.PokemonSpecies.identifier)
+        query = query.join(tables.PokemonForm.pokemon)
+        query = query.join(tables.Pokemon.species)
+        query = query.filter(tables.PokemonForm.form_identifier.in_(
+            set(form for form, species in pairs)))
+        query = query.filter(tables.PokemonSpecies.identifier.in_(
+            set(species for form, species in pairs)))
+        found = {}
+        for form, species_identifier in query:
+            target = pairs.get((form.form_identifier, species_identifier))
+            if target is not None:
+                found.setdefault(target, []).append((form, form.name))
+        return found
+
+    def get_link(self, category, target, string_language=None,
+                 game_language=None):
+        """Returns (object, name) for the {category:target} link, or None if
+        it doesn't point to anything in the database.
+
+        Looks the link up with resolve_links() if it hasn't been already.
+        """
+        table = _link_tables().get(category)
+        if table is None:
+            return None
+        languages = _link_languages(table, string_language, game_language)
+        key = category, target, tuple(l.id for l in languages)
+        link = self._cached_link(key)
+        if link is False:
+            text = u'[]{%s:%s}' % (category, target)
+            self.resolve_links([text], string_language, game_language)
+            link = self._links.get(key)
+        return link
+
+    def get_link_name(self, category, target, string_language=None):
+        """Returns the name for a {category:target} link in text in
+        `string_language`, or None if it doesn't point to anything.
+
+        Unlike get_link(), this doesn't load any objects.  The first link to
+        a category loads the names of everything in it, with one query, and
+        later ones are dict lookups.
+        """
+        table = _link_tables().get(category)
+        if table is None:
+            return None
+        languages = _link_languages(table, string_language, None)
+        key = category, tuple(l.id for l in languages)
+        try:
+            names = self._link_names[key]
+        except KeyError:
+            if table.__singlename__ == 'pokemon_form':
+                rows = self._query_form_names()
+            else:
+                rows = self._query_names(table, languages)
+            names = {}
+            ambiguous = set()
+            for identifier, name in rows:
+                if identifier in names:
+                    ambiguous.add(identifier)
+                names[identifier] = name
+            for identifier in ambiguous:
+                # Rendered like missing links, as get_link() does
+                names[identifier] = None
+            self._link_names[key] = names
+        return names.get(target)
+
+    def _query_names(self, table, languages):
+        from pokedex.db.multilang import FallbackColumn
+        name_column = FallbackColumn(table, 'name', languages)
+        query = self.session.query(table.identifier, name_column.column)
+        return query.with_fallback(name_column)
+
+    def _query_form_names(self):
+        from pokedex.db import tables
+        from pokedex.db.multilang import FallbackColumn
+        # Like PokemonForm.name: the form's pokemon_name, or else the
+        # species name, in the default language
+        form_name = FallbackColumn(tables.PokemonForm, 'pokemon_name', [])
+        species_name = FallbackColumn(tables.PokemonSpecies, 'name', [])
+        query = self.session.query(
+            tables.PokemonForm.form_identifier,
+            tables.PokemonSpecies.identifier,
+            form_name.column, species_name.column)
+        query = query.select_from(tables.PokemonForm)
+        query = query.join(tables.PokemonForm.pokemon)
+        query = query.join(tables.Pokemon.species)
+        query = query.with_fallback(form_name).with_fallback(species_name)
+        query = query.filter(tables.PokemonForm.form_identifier != None)
+        return [(u'%s %s' % (form_identifier, species_identifier),
+                 pokemon_name or name)
+                for form_identifier, species_identifier, pokemon_name, name
+                in query]
+
+    def clear_cache(self):
+        """Forgets the links looked up so far, whether there's stored prose,
+        and everything in the render cache.  Call this after changing the
+        database.
+        """
+        self._links.clear()
+        self._link_names.clear()
+        self._has_stored_prose = None
+        if self.render_cache is not None:
+            self.render_cache.clear()
+
+    def get_stored_prose(self, content_hash):
+        """Returns (html, text) as stored by `pokedex render` for the text
+        with `content_hash`, or None if there's nothing stored.
+        """
+        from pokedex.db.render import rendered_prose_table
+        if self._has_stored_prose is None:
+            self._has_stored_prose = rendered_prose_table.exists(
+                self.session.connection())
+        if not self._has_stored_prose:
+            return None
+        return self.session.execute(
+            select([rendered_prose_table.c.html,
+                    rendered_prose_table.c.text])
+            .where(rendered_prose_table.c.content_hash == content_hash)
+        ).first()
 
     def extendMarkdown(self, md, md_globals):
         pattern = PokedexLinkPattern(self, self.session)
@@ -1,20 +1,68 @@
+import operator
+import threading
+
+import six
+import sqlalchemy
+from sqlalchemy import inspection
 from sqlalchemy.ext.associationproxy import association_proxy, AssociationProxy
-from sqlalchemy.orm import Query, mapper, relationship, synonym
-from sqlalchemy.orm.collections import attribute_mapped_collection
+from sqlalchemy.orm import Mapper, Query, aliased, deferred, joinedload, mapper, relationship, synonym
+from sqlalchemy.orm.attributes import instance_state, set_committed_value
+from sqlalchemy.orm.collections import MappedCollection, collection_adapter
+from sqlalchemy.orm.relationships import RelationshipProperty
 from sqlalchemy.orm.scoping import ScopedSession
 from sqlalchemy.orm.session import Session, object_session
-from sqlalchemy.schema import Column, ForeignKey, Table
+from sqlalchemy.schema import Column, ForeignKey, Index, Table
 from sqlalchemy.sql.expression import and_, bindparam, select, exists
+from sqlalchemy.sql.functions import coalesce
 from sqlalchemy.sql.operators import ColumnOperators
-from sqlalchemy.types import Integer
+from sqlalchemy.types import Integer, Unicode
 
 from pokedex.db import markdown
 
-class LocalAssociationProxy(AssociationProxy, ColumnOperators):
+# Mapping translation classes lazily hooks into SQLAlchemy internals:
+# `_inspects`, `_inspect_mapped_class`, and `Query._set_entity_selectables`.
+# They're only used on the versions they were written against, which setup.py
+# pins; on any other, every class is mapped as soon as it's created, with
+# public API only.
+SQLALCHEMY_VERSION = tuple(
+    int(part) for part in sqlalchemy.__version__.split('.')[:2])
+LAZY_MAPPING = (1, 2) <= SQLALCHEMY_VERSION < (1, 4)
+if LAZY_MAPPING:
+    from sqlalchemy.inspection import _inspects
+    from sqlalchemy.orm.base import _inspect_mapped_class
+
+class TranslationAssociationProxy(AssociationProxy):
+    """An association proxy onto one of the relations to a translation class
+
+    The relations don't exist until the translation class is mapped, so this
+    maps it before doing anything else.
+    """
+    def __init__(self, translation_class, *args, **kwargs):
+        self.translation_class = translation_class
+        super(TranslationAssociationProxy, self).__init__(*args, **kwargs)
+
+    def __get__(self, obj, class_):
+        self.translation_class._map()
+        if obj is not None:
+            _load_session_map_languages(self.translation_class,
+                                        self.target_collection, obj)
+        return super(TranslationAssociationProxy, self).__get__(obj, class_)
+
+    def __set__(self, obj, values):
+        self.translation_class._map()
+        return super(TranslationAssociationProxy, self).__set__(obj, values)
+
+    def __delete__(self, obj):
+        self.translation_class._map()
+        return super(TranslationAssociationProxy, self).__delete__(obj)
+
+class LocalAssociationProxy(TranslationAssociationProxy, ColumnOperators):
     """An association proxy for names in the default language
 
     Over the regular association_proxy, this provides sorting and filtering
-    capabilities, implemented via SQL subqueries.
+    capabilities, implemented via SQL subqueries.  The subqueries are
+    correlated, so most databases run them once per row; for large queries,
+    `MultilangQuery.with_local_names` is faster.
     """
     def __clause_element__(self):
         q = select([self.remote_attr])
@@ -30,6 +78,267 @@ class LocalAssociationProxy(AssociationProxy, ColumnOperators):
         return exists(q)
 
 
+# Translation classes are only mapped when they're first used, since mapping
+# and configuring all of them is a good part of the time it takes to get from
+# importing pokedex.db.tables to running a query.
+_mapping_lock = threading.RLock()
+_mapping = set()
+_unmapped = []
+
+class TranslationClassMeta(type):
+    """Metaclass for the classes made by `create_translation_table`.
+
+    Until they're used, they are plain classes with a `__table__`.  Looking
+    up a missing attribute (such as a column), creating an instance,
+    inspecting the class (as `session.query()` does), or getting the
+    relationships to it from the foreign class maps it.
+    """
+    def __getattr__(cls, name):
+        if name.startswith('__') or not cls._map():
+            raise AttributeError(name)
+        return getattr(cls, name)
+
+    def __call__(cls, *args, **kwargs):
+        cls._map()
+        return super(TranslationClassMeta, cls).__call__(*args, **kwargs)
+
+    def _map(cls):
+        """Maps the class, if it hasn't been yet.  Returns whether it had to.
+        """
+        # Only removed once mapping is finished
+        if '_map_later' not in cls.__dict__:
+            return False
+
+        with _mapping_lock:
+            map_later = cls.__dict__.get('_map_later')
+            if map_later is None or cls in _mapping:
+                # Done by another thread, or in progress in this one
+                return False
+
+            _mapping.add(cls)
+            try:
+                map_later()
+            finally:
+                _mapping.discard(cls)
+            del cls._map_later
+            _unmapped.remove(cls)
+            return True
+
+if LAZY_MAPPING:
+    @_inspects(TranslationClassMeta)
+    def _inspect_translation_class(cls):
+        cls._map()
+        return _inspect_mapped_class(cls)
+
+class _UnmappedRelationship(object):
+    """Stands in for a relationship to a translation class that hasn't been
+    mapped yet.  Mapping it replaces this with the real relationship.
+    """
+    def __init__(self, translation_class, name):
+        self.translation_class = translation_class
+        self.name = name
+
+    def __get__(self, instance, owner):
+        self.translation_class._map()
+        if owner.__dict__.get(self.name) is self:
+            raise AttributeError(self.name)
+        return getattr(owner if instance is None else instance, self.name)
+
+def map_translation_classes():
+    """Maps every translation class that hasn't been mapped yet.
+
+    Only needed for code that looks through all the mappers, such as
+    callers of `configure_mappers()`.
+    """
+    for translation_class in list(_unmapped):
+        translation_class._map()
+
+_eagerly_mapped = set()
+
+def map_eager_translation_classes(mapper):
+    """Maps the translation classes that a query for `mapper` would join to
+    eagerly: its own, and those of the classes it always joins to, and so on.
+
+    Called by `MultilangQuery`, for the classes it queries and those its
+    loader options reach, so that translations that are loaded with
+    `lazy='joined'` are joined on the first query, rather than loaded one
+    row at a time afterward.
+    """
+    if mapper in _eagerly_mapped:
+        return
+
+    todo = [mapper]
+    seen = set()
+    while todo:
+        mapper = todo.pop()
+        if mapper in seen or mapper in _eagerly_mapped:
+            continue
+        seen.add(mapper)
+
+        for translation_class in mapper.class_.__dict__.get(
+                'translation_classes', ()):
+            translation_class._map()
+        for relationship in mapper.relationships:
+            if relationship.lazy == 'joined':
+                todo.append(relationship.mapper)
+
+    _eagerly_mapped.update(seen)
+
+def _map_option_translation_classes(query, option):
+    """Maps the translation classes joined eagerly from everything a loader
+    option, such as `joinedload(Pokemon.species)`, goes through.
+    """
+    try:
+        path = option.path
+    except AttributeError:
+        path = None
+    if path is None:
+        # Not a loader option, or one SQLAlchemy keeps differently
+        map_translation_classes()
+        return
+
+    mappers = [inspection.inspect(description['entity'])
+               for description in query.column_descriptions
+               if description['entity'] is not None]
+    for element in path:
+        if isinstance(element, Mapper):
+            # Bound Load() options have the mappers in their path
+            mappers = [element]
+        elif isinstance(element, RelationshipProperty):
+            mappers = [element.mapper]
+        elif isinstance(element, six.string_types):
+            # A relationship name, on the mappers before it
+            if element == '*' or element.endswith(':*'):
+                return
+            previous, mappers = mappers, []
+            for mapper in previous:
+                if mapper.has_property(element):
+                    prop = mapper.get_property(element)
+                    if isinstance(prop, RelationshipProperty):
+                        mappers.append(prop.mapper)
+        elif isinstance(getattr(element, 'property', None),
+                        RelationshipProperty):
+            mappers = [element.property.mapper]
+        else:
+            continue
+        for mapper in mappers:
+            map_eager_translation_classes(mapper)
+
+class TranslationDict(MappedCollection):
+    """The collection behind a `(relation)` relation: a dict of translation
+    rows, keyed by language.
+
+    Usually it has every language's row.  `MultilangQuery.with_languages` and
+    `MultilangSession.map_languages` only load some; then looking up another
+    language loads its row on the spot.  `in` and `get()` do too, but
+    iterating only goes over the rows that are loaded.
+    """
+    def __init__(self, translation_class):
+        super(TranslationDict, self).__init__(
+            operator.attrgetter('local_language'))
+        self.translation_class = translation_class
+        # Ids of the languages that have been looked for; None for all
+        self.loaded_language_ids = None
+
+    def __missing__(self, language):
+        row = self._load(language)
+        if row is None:
+            raise KeyError(language)
+        return row
+
+    def __contains__(self, language):
+        return (dict.__contains__(self, language) or
+                self._load(language) is not None)
+
+    def get(self, language, default=None):
+        try:
+            return self[language]
+        except KeyError:
+            return default
+
+    def _load(self, language):
+        """Loads the row for `language`, if it might exist and hasn't been
+        loaded yet.  Returns it, or None.
+        """
+        language_id = getattr(language, 'id', None)
+        if (self.loaded_language_ids is None or language_id is None or
+                language_id in self.loaded_language_ids):
+            return None
+        self.loaded_language_ids.add(language_id)
+
+        state = collection_adapter(self).owner_state
+        if state.session is None:
+            return None
+        row = state.session.query(self.translation_class).filter_by(
+            foreign_id=state.identity[0],
+            local_language_id=language_id,
+        ).first()
+        if row is not None:
+            # Not a change to the collection, so skip the instrumentation
+            dict.__setitem__(self, language, row)
+        return row
+
+def _load_map_languages(session, translation_class, objects, language_ids):
+    """Fills in the `(relation)` collections for `translation_class` of the
+    given objects with just the rows in the given languages, with one query.
+    Objects that have the collection loaded already are left alone.
+    """
+    relation_name = translation_class.relation_name
+    states = [instance_state(obj) for obj in objects]
+    states = [state for state in states
+              if relation_name not in state.dict and state.identity]
+    if not states:
+        return
+    ids = [state.identity[0] for state in states]
+
+    query = session.query(translation_class).filter(
+        translation_class.local_language_id.in_(language_ids))
+    if len(ids) <= PRELOAD_MAX_IDS:
+        query = query.filter(translation_class.foreign_id.in_(ids))
+
+    rows = {}
+    for row in query:
+        rows.setdefault(row.foreign_id, []).append(row)
+
+    for state, id in zip(states, ids):
+        set_committed_value(state.obj(), relation_name, rows.get(id, []))
+        state.dict[relation_name].loaded_language_ids = set(language_ids)
+
+def _add_map_language(state, relation_name, rows, language_id):
+    """Adds the rows of one language to an object's `(relation)` collection,
+    loading it with just those rows if it isn't loaded yet.  Collections
+    that already have every language, or this one, are left alone.
+    """
+    if relation_name not in state.dict:
+        set_committed_value(state.obj(), relation_name, rows)
+        state.dict[relation_name].loaded_language_ids = set([language_id])
+        return
+    collection = state.dict[relation_name]
+    if (collection.loaded_language_ids is None or
+            language_id in collection.loaded_language_ids):
+        return
+    for row in rows:
+        # Not a change to the collection, so skip the instrumentation
+        dict.__setitem__(collection, row.local_language, row)
+    collection.loaded_language_ids.add(language_id)
+
+def _load_session_map_languages(translation_class, relation_name, obj):
+    """Called when a `(column)_map` proxy is used.  If the session has
+    `map_languages` set and the collection behind the proxy isn't loaded,
+    loads just those languages into it, for every object of the same class in
+    the session at once.
+    """
+    if relation_name != translation_class.relation_name:
+        return
+    session = object_session(obj)
+    map_languages = getattr(session, 'map_languages', None)
+    if map_languages is None or relation_name in instance_state(obj).dict:
+        return
+    objects = [other for other in session.identity_map.values()
+               if isinstance(other, type(obj))]
+    _load_map_languages(session, translation_class, objects,
+                        [language.id for language in map_languages])
+
 def _getset_factory_factory(column_name, string_getter):
     """Hello!  I am a factory for creating getset_factory functions for SQLA.
     I exist to avoid the closure-in-a-loop problem.
@@ -86,7 +395,7 @@ def create_translation_table(_table_name, foreign_class, relation_name,
 
     - `(relation_name)`, a relation to the new table.  It uses a dict-based
       collection class, where the keys are language identifiers and the values
-      are rows in the created tables.
+      are rows in the created tables; see `TranslationDict`.
     - `(relation_name)_local`, a relation to the row in the new table that
       matches the current default language.
     - `(relation_name)_table`, the class created by this function.
@@ -108,13 +417,21 @@ def create_translation_table(_table_name, foreign_class, relation_name,
 
     For Markdown-formatted columns, `(column)_map` and `(column)` will give
     Markdown objects.
+
+    If there's a `name` column, a `sort_key` column is added too, and indexed
+    along with the language.  It's not in the CSVs; see
+    `pokedex.normalize.sort_keys`.
+
+    The table is created right away, but the class is only mapped, and the
+    relations added, when something first uses them; see
+    `TranslationClassMeta`.
     """
     # n.b.: language_class only exists for the sake of tests, which sometimes
     # want to create tables entirely separate from the pokedex metadata
 
     foreign_key_name = foreign_class.__singlename__ + '_id'
 
-    Translations = type(_table_name, (object,), {
+    Translations = TranslationClassMeta(str(_table_name), (object,), {
         '_language_identifier': association_proxy('local_language', 'identifier'),
         'relation_name': relation_name,
         '__tablename__': _table_name,
@@ -140,40 +457,71 @@ def create_translation_table(_table_name, foreign_class, relation_name,
         column.name = name
         table.append_column(column)
 
-    # Construct ye mapper
-    mapper(Translations, table, properties={
-        'foreign_id': synonym(foreign_key_name),
-        'local_language': relationship(language_class,
-            primaryjoin=table.c.local_language_id == language_class.id,
-            innerjoin=True),
-    })
+    # Names get a key to sort them by, which `pokedex load` fills in, and an
+    # index to sort with
+    if 'name' in kwargs:
+        # Letters can turn into two characters; see pokedex.normalize
+        length = kwargs['name'].type.length
+        table.append_column(Column('sort_key', Unicode(length and length * 2),
+            nullable=True,
+            doc=u"The name, as normalized for sorting in its language; "
+                u"computed when the data is loaded",
+            info=dict(format='plaintext', derived=True)))
+        Index('ix_%s_sort_key' % _table_name,
+              table.c.local_language_id, table.c.sort_key)
+
+    local_relation_name = relation_name + '_local'
+
+    def map_later():
+        # Construct ye mapper
+        properties = {
+            'foreign_id': synonym(foreign_key_name),
+            'local_language': relationship(language_class,
+                primaryjoin=table.c.local_language_id == language_class.id,
+                innerjoin=True),
+        }
+        if 'sort_key' in table.c:
+            # Only used for ordering; and databases loaded before it was
+            # added don't have it
+            properties['sort_key'] = deferred(table.c.sort_key)
+        mapper(Translations, table, properties=properties)
+
+        # Add full-table relations to the original class
+        # Foo.bars
+        setattr(foreign_class, relation_name, relationship(Translations,
+            primaryjoin=foreign_class.id == Translations.foreign_id,
+            collection_class=lambda: TranslationDict(Translations),
+        ))
+        # Foo.bars_local
+        # This is a bit clever; it uses bindparam() to make the join clause
+        # modifiable on the fly.  db sessions know the current language and
+        # populate the bindparam.
+        # The 'dummy' value is to trick SQLA; without it, SQLA thinks this
+        # bindparam is just its own auto-generated clause and everything gets
+        # fucked up.
+        setattr(foreign_class, local_relation_name, relationship(Translations,
+            primaryjoin=and_(
+                Translations.foreign_id == foreign_class.id,
+                Translations.local_language_id == bindparam('_default_language_id',
+                    value='dummy', type_=Integer, required=True),
+            ),
+            foreign_keys=[Translations.foreign_id, Translations.local_language_id],
+            uselist=False,
+            lazy=relation_lazy,
+        ))
+
+    Translations._map_later = map_later
+    _unmapped.append(Translations)
 
-    # Add full-table relations to the original class
     # Foo.bars_table
     setattr(foreign_class, relation_name + '_table', Translations)
-    # Foo.bars
-    setattr(foreign_class, relation_name, relationship(Translations,
-        primaryjoin=foreign_class.id == Translations.foreign_id,
-        collection_class=attribute_mapped_collection('local_language'),
-    ))
-    # Foo.bars_local
-    # This is a bit clever; it uses bindparam() to make the join clause
-    # modifiable on the fly.  db sessions know the current language and
-    # populate the bindparam.
-    # The 'dummy' value is to trick SQLA; without it, SQLA thinks this
-    # bindparam is just its own auto-generated clause and everything gets
-    # fucked up.
-    local_relation_name = relation_name + '_local'
-    setattr(foreign_class, local_relation_name, relationship(Translations,
-        primaryjoin=and_(
-            Translations.foreign_id == foreign_class.id,
-            Translations.local_language_id == bindparam('_default_language_id',
-                value='dummy', type_=Integer, required=True),
-        ),
-        foreign_keys=[Translations.foreign_id, Translations.local_language_id],
-        uselist=False,
-        lazy=relation_lazy,
-    ))
+    if LAZY_MAPPING:
+        # Foo.bars and Foo.bars_local, until they're mapped
+        for name in relation_name, local_relation_name:
+            setattr(foreign_class, name,
+                    _UnmappedRelationship(Translations, name))
+    else:
+        Translations._map()
 
     # Add per-column proxies to the original class
     for name, column in kwitems:
@@ -185,7 +533,7 @@ def create_translation_table(_table_name, foreign_class, relation_name,
 
         # Class.(column) -- accessor for the default language's value
         setattr(foreign_class, name,
-            LocalAssociationProxy(local_relation_name, name,
+            LocalAssociationProxy(Translations, local_relation_name, name,
                     getset_factory=getset_factory))
 
         # Class.(column)_map -- accessor for the language dict
@@ -197,8 +545,8 @@ def create_translation_table(_table_name, foreign_class, relation_name,
             setattr(row, name, value)
             return row
         setattr(foreign_class, name + '_map',
-            association_proxy(relation_name, name, creator=creator,
-                    getset_factory=getset_factory))
+            TranslationAssociationProxy(Translations, relation_name, name,
+                    creator=creator, getset_factory=getset_factory))
 
     # Add to the list of translation classes
     foreign_class.translation_classes.append(Translations)
@@ -206,15 +554,222 @@ def create_translation_table(_table_name, foreign_class, relation_name,
     # Done
     return Translations
 
+class FallbackColumn(ColumnOperators):
+    """A translated column, in the first of several languages that has it.
+
+    `table` is a class with translations, `name` the name of one of their
+    columns, and `languages` the languages to try, in order; None stands for
+    the session's default language.  Unless `default` is false, the default
+    language is tried last, if it's not in `languages` already.
+
+    It compiles to COALESCE over outer joins to the translation table, one per
+    language.  `MultilangQuery.with_fallback` adds the joins; after that, use
+    this like a column in filters and ORDER BY, and its `column` in selects:
+
+        name = FallbackColumn(Move, 'name', [french, japanese])
+        q = session.query(Move, name.column).with_fallback(name)
+        q = q.order_by(name)
+    """
+    def __init__(self, table, name, languages, default=True):
+        self.table = table
+        self.name = name
+        self.languages = list(languages)
+        if default and None not in self.languages:
+            self.languages.append(None)
+        # What the joins use, so that the column can outlive the session the
+        # languages came from
+        self.language_ids = [None if language is None else language.id
+                             for language in self.languages]
+
+        for translation_class in table.translation_classes:
+            if name in translation_class.__table__.c:
+                break
+        else:
+            raise ValueError("%s has no translated column %s" % (
+                table.__name__, name))
+        self.translation_class = translation_class
+        self.aliases = [aliased(translation_class) for language in self.languages]
+
+        columns = [getattr(alias, name) for alias in self.aliases]
+        if len(columns) == 1:
+            self.column = columns[0].__clause_element__().label(name)
+        else:
+            self.column = coalesce(*columns).label(name)
+
+    def __clause_element__(self):
+        return self.column
+
+    def operate(self, op, *other, **kwargs):
+        return op(self.column, *other, **kwargs)
+
+    def reverse_operate(self, op, other, **kwargs):
+        return op(other, self.column, **kwargs)
+
 class MultilangQuery(Query):
+    """A Query that binds the `_default_language_id` parameter, used by the
+    `(relation)_local` relations and the `(column)` proxies, to the default
+    language of its session.
+
+    The language is bound when the query gets its session, so that running
+    the query doesn't have to.  Giving `_default_language_id` to `params()`
+    overrides it.
+    """
+    # Whether _default_language_id is the session's, to be rebound with it
+    _session_language = False
+
+    def __init__(self, entities, session=None):
+        super(MultilangQuery, self).__init__(entities, session)
+        if session is not None:
+            self._params = dict(
+                _default_language_id=session.default_language_id)
+            self._session_language = True
+
+    def with_session(self, session):
+        query = super(MultilangQuery, self).with_session(session)
+        if query._session_language:
+            query._bind_session_language()
+        return query
+
+    def params(self, *args, **kwargs):
+        query = super(MultilangQuery, self).params(*args, **kwargs)
+        if ('_default_language_id' in kwargs or
+                args and '_default_language_id' in args[0]):
+            # Lazy loads pass the placeholder from the relation's bindparam
+            query._session_language = (
+                query._params['_default_language_id'] == 'dummy')
+            if query._session_language:
+                query._bind_session_language()
+        return query
+
+    def _bind_session_language(self):
+        params = dict(self._params)
+        if self.session is None:
+            params.pop('_default_language_id', None)
+        else:
+            params['_default_language_id'] = self.session.default_language_id
+        self._params = params
+
+    if LAZY_MAPPING:
+        def _set_entity_selectables(self, *args, **kwargs):
+            super(MultilangQuery, self)._set_entity_selectables(
+                *args, **kwargs)
+            # Before any options or filters refer to the translation relations
+            for entity in self._mapper_entities:
+                map_eager_translation_classes(entity.mapper)
+
+        def options(self, *args):
+            for option in args:
+                _map_option_translation_classes(self, option)
+            return super(MultilangQuery, self).options(*args)
+
+    # (names class or alias, language id or None) for each with_local_names()
+    _local_names = ()
+
+    def with_local_names(self, table, language=None, alias=None, outer=False):
+        """Joins the names of `table` in one language: the session's default
+        language, or `language` if given.
+
+        Afterwards, filter and order by the columns of `alias` if it's given,
+        or else of `table.names_table`:
+
+            q = session.query(Move).with_local_names(Move)
+            q = q.filter(Move.names_table.name == u'Tackle')
+
+        Filtering or ordering by `Move.name` itself does the same with a
+        correlated subquery, which the database runs for every row; a join
+        can use the index on the names instead.
+
+        With `outer`, rows that have no name in the language are kept.
+
+        Joining the same names in the same language again does nothing, so
+        helpers that each need the names can all call this.
+        """
+        language_id = None if language is None else language.id
+        return self._with_local_translations(
+            table, table.names_table, language_id, alias, outer)
+
+    def _with_local_translations(self, table, translation_class, language_id,
+                                 alias=None, outer=False):
+        if alias is None:
+            alias = translation_class
+
+        for joined, joined_language_id in self._local_names:
+            if joined is alias:
+                if joined_language_id != language_id:
+                    raise ValueError(
+                        "%s is already joined in another language; "
+                        "use an alias" % translation_class.__name__)
+                return self
+
+        if language_id is None:
+            language_clause = (alias.local_language_id ==
+                               bindparam('_default_language_id'))
+        else:
+            language_clause = alias.local_language_id == language_id
+        onclause = and_(alias.foreign_id == table.id, language_clause)
+        if outer:
+            query = self.outerjoin(alias, onclause)
+        else:
+            query = self.join(alias, onclause)
+        query._local_names = self._local_names + ((alias, language_id),)
+        return query
+
+    def with_fallback(self, column):
+        """Adds the outer joins that a `FallbackColumn` needs."""
+        query = self
+        for alias, language_id in zip(column.aliases, column.language_ids):
+            query = query._with_local_translations(
+                column.table, column.translation_class, language_id, alias,
+                outer=True)
+        return query
+
+    # Languages for with_languages()
+    _map_languages = None
+
+    def with_languages(self, *languages):
+        """Loads the translations of the objects this query returns into
+        their `(relation)` collections, behind the `(column)_map` proxies, but
+        only in the given languages, with one query per translation table.
+
+        The other languages are loaded a row at a time if they're looked up;
+        see `TranslationDict`.
+        """
+        query = self._clone()
+        query._map_languages = languages
+        return query
+
+    def __iter__(self):
+        if self._map_languages is None:
+            return super(MultilangQuery, self).__iter__()
+
+        results = list(super(MultilangQuery, self).__iter__())
+        objects = {}
+        for result in results:
+            if not isinstance(result, tuple):
+                result = result,
+            for obj in result:
+                if getattr(type(obj), 'translation_classes', None):
+                    objects.setdefault(type(obj), []).append(obj)
+
+        language_ids = [language.id for language in self._map_languages]
+        for cls, instances in objects.items():
+            for translation_class in cls.translation_classes:
+                _load_map_languages(self.session, translation_class,
+                                    instances, language_ids)
+        return iter(results)
+
     def _execute_and_instances(self, *args, **kwargs):
-        # Set _default_language_id param if it hasn't been set by the time the query is executed.
-        # XXX This is really hacky and we should figure out a cleaner method.
-        if '_default_language_id' not in self._params or self._params['_default_language_id'] == 'dummy':
-            self._params = self._params.copy()
-            self._params['_default_language_id'] = self.session.default_language_id
+        # Queries that replace their params wholesale, such as Query.get(),
+        # lose the language bound above
+        if '_default_language_id' not in self._params:
+            self._session_language = True
+            self._bind_session_language()
         return super(MultilangQuery, self)._execute_and_instances(*args, **kwargs)
 
+# Above this many objects of a class, preload_language() loads all of a
+# translation table's rows in the language, rather than listing ids
+PRELOAD_MAX_IDS = 500
+
 class MultilangSession(Session):
     """A tiny Session subclass that adds support for a default language.
 
@@ -223,19 +778,101 @@ class MultilangSession(Session):
     default_language_id = None
     markdown_extension_class = markdown.PokedexLinkExtension
 
+    # Languages to load into the `(relation)` collections, behind the
+    # `(column)_map` proxies, when they're first used; None for all of them.
+    # See `TranslationDict`.
+    map_languages = None
+
     def __init__(self, *args, **kwargs):
         if 'default_language_id' in kwargs:
             self.default_language_id = kwargs.pop('default_language_id')
+        if 'map_languages' in kwargs:
+            self.map_languages = kwargs.pop('map_languages')
 
         markdown_extension_class = kwargs.pop('markdown_extension_class',
                 self.markdown_extension_class)
+        render_cache = kwargs.pop('render_cache', None)
 
         self.markdown_extension = markdown_extension_class(self)
+        if render_cache is not None:
+            self.markdown_extension.render_cache = render_cache
 
         kwargs.setdefault('query_cls', MultilangQuery)
 
         super(MultilangSession, self).__init__(*args, **kwargs)
 
+    def preload_language(self, language=None, classes=None, maps=False):
+        """Loads the translations of the objects in the identity map, with one
+        query per translation table, so that reading `obj.name` and the like
+        doesn't take a query per object.
+
+        `language` is the Language to load, or None for the default language.
+        For the default language, the `(relation)_local` relations behind the
+        `(column)` proxies are filled in.  For any other, its rows are added
+        to the `(relation)` collections behind the `(column)_map` proxies,
+        so that `obj.name_map[language]` needs no query.
+
+        `classes` limits this to objects of those classes; by default, every
+        object with translations is included.
+
+        With `maps`, every language is loaded, and the `(relation)`
+        collections behind the `(column)_map` proxies are filled in too.
+
+        Relations that are already loaded are left alone, except that `maps`
+        fills in collections that only have some languages.
+        """
+        if language is None:
+            language_id = self.default_language_id
+        else:
+            language_id = language.id
+        if classes is not None:
+            classes = tuple(classes)
+
+        objects = {}
+        for obj in self.identity_map.values():
+            if classes is not None and not isinstance(obj, classes):
+                continue
+            if getattr(type(obj), 'translation_classes', None):
+                objects.setdefault(type(obj), []).append(obj)
+
+        for cls, instances in objects.items():
+            states = [instance_state(obj) for obj in instances]
+            ids = [state.identity[0] for state in states]
+
+            for translation_class in cls.translation_classes:
+                query = self.query(translation_class)
+                if maps:
+                    query = query.options(
+                        joinedload(translation_class.local_language))
+                else:
+                    query = query.filter(
+                        translation_class.local_language_id == language_id)
+                if len(ids) <= PRELOAD_MAX_IDS:
+                    query = query.filter(translation_class.foreign_id.in_(ids))
+
+                rows = {}
+                for row in query:
+                    rows.setdefault(row.foreign_id, []).append(row)
+
+                relation_name = translation_class.relation_name
+                local_relation_name = relation_name + '_local'
+                for obj, state, id in zip(instances, states, ids):
+                    obj_rows = rows.get(id, [])
+                    if (language_id == self.default_language_id and
+                            local_relation_name not in state.dict):
+                        local_rows = [row for row in obj_rows
+                                      if row.local_language_id == language_id]
+                        set_committed_value(obj, local_relation_name,
+                                            local_rows[0] if local_rows else None)
+                    if maps and (relation_name not in state.dict or
+                            state.dict[relation_name].loaded_language_ids
+                            is not None):
+                        # Missing, or with only some languages
+                        set_committed_value(obj, relation_name, obj_rows)
+                    elif not maps and language_id != self.default_language_id:
+                        _add_map_language(state, relation_name, obj_rows,
+                                          language_id)
+
 class MultilangScopedSession(ScopedSession):
     """Dispatches language selection to the attached Session."""
 
@@ -249,6 +886,20 @@ class MultilangScopedSession(ScopedSession):
     def default_language_id(self, new):
         self.registry().default_language_id = new
 
+    @property
+    def map_languages(self):
+        """Passes the languages for `(column)_map` proxies through to the
+        current session.
+        """
+        return self.registry().map_languages
+
+    @map_languages.setter
+    def map_languages(self, new):
+        self.registry().map_languages = new
+
     @property
     def markdown_extension(self):
         return self.registry().markdown_extension
+
+    def preload_language(self, *args, **kwargs):
+        return self.registry().preload_language(*args, **kwargs)
@@ -0,0 +1,206 @@
+# encoding: utf8
+u"""Renders the Markdown prose in the database ahead of time.
+
+Every Markdown translation column, and every move's effect texts, are
+rendered to HTML and to plain text, and the results are stored in the
+`pokedex_rendered_prose` table, keyed by `MarkdownString.content_hash()`.
+`MarkdownString.as_html` serves the HTML instead of rendering when the
+session's own link extension is used, and renders live otherwise.  The plain
+text is there for reading with SQL; as_text() is quicker than looking it up.
+
+The hash covers the text, its language and the session's default language,
+which the names of linked objects are in, so texts that change are simply
+rendered again.  Renaming a linked object doesn't change the hash, though;
+`pokedex load` drops the table for that reason, and `render_prose(full=True)`
+renders everything again.
+"""
+import importlib
+import multiprocessing
+import sys
+
+from sqlalchemy import Column, MetaData, Table, Unicode
+from sqlalchemy.sql import select
+
+from pokedex.db import markdown
+
+metadata = MetaData()
+
+rendered_prose_table = Table('pokedex_rendered_prose', metadata,
+    Column('content_hash', Unicode(40), primary_key=True),
+    Column('html', Unicode, nullable=False),
+    Column('text', Unicode, nullable=False),
+)
+
+# Texts per process pool task
+RENDER_CHUNK_SIZE = 200
+
+# Rows per INSERT, and values per IN, to stay under SQLite's variable limit
+CHUNK_SIZE = 500
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _iter_texts(session):
+    """Yields (source_text, language_id) for every Markdown text in the
+    database, as MarkdownStrings get them.
+    """
+    from pokedex.db import tables
+
+    for cls in tables.mapped_classes:
+        for translation_class in cls.translation_classes:
+            table = translation_class.__table__
+            for column in table.c:
+                if column.info.get('string_getter') is not \
+                        markdown.MarkdownString:
+                    continue
+                query = select([column, table.c.local_language_id])
+                query = query.where(column != None).distinct()
+                for row in session.execute(query):
+                    yield tuple(row)
+
+    # Move effects have $effect_chance filled in, so each move has its own.
+    # Load all the effects first, so that the moves find them in the
+    # identity map.
+    for cls in tables.mapped_classes:
+        properties = [name for name, attr in vars(cls).items()
+                      if isinstance(attr, markdown.MoveEffectPropertyMap)]
+        if not properties:
+            continue
+        effect_class = cls.move_effect.property.mapper.class_
+        session.query(effect_class).all()
+        session.preload_language(classes=[effect_class], maps=True)
+        for obj in session.query(cls):
+            if obj.move_effect is None:
+                continue
+            for name in properties:
+                for language, string in getattr(obj, name).items():
+                    if string is not None:
+                        yield string.source_text, language.id
+
+
+def _render(session, texts):
+    """Returns (content_hash, html, text) for each (source_text, language_id)
+    in `texts`.
+    """
+    from pokedex.db import tables
+
+    languages = dict((language.id, language)
+                     for language in session.query(tables.Language))
+    extension = session.markdown_extension
+    strings = [markdown.MarkdownString(source_text, session,
+                                       languages[language_id])
+               for source_text, language_id in texts]
+    markdown.resolve_links(strings, extension)
+    return [(string.content_hash(), string._render_html(extension),
+             string.as_text())
+            for string in strings]
+
+
+def _class_path(cls):
+    """Returns `(module name, qualified name)` to import `cls` by in another
+    process, or None if it can't be imported, e.g. if it's defined in a
+    function.
+    """
+    name = getattr(cls, '__qualname__', cls.__name__)
+    obj = sys.modules.get(cls.__module__)
+    for part in name.split('.'):
+        obj = getattr(obj, part, None)
+    if obj is not cls:
+        return None
+    return cls.__module__, name
+
+def _import_class(path):
+    module_name, name = path
+    obj = importlib.import_module(module_name)
+    for part in name.split('.'):
+        obj = getattr(obj, part)
+    return obj
+
+
+# Each worker process's own session
+_worker_session = None
+
+def _init_worker(uri, default_language_id, extension_path):
+    global _worker_session
+    import pokedex.db
+    session_args = dict(markdown_extension_class=_import_class(extension_path))
+    _worker_session = pokedex.db.connect(uri, session_args=session_args)()
+    _worker_session.default_language_id = default_language_id
+
+def _render_in_worker(texts):
+    return _render(_worker_session, texts)
+
+
+def render_prose(session, procs=None, full=False):
+    """Renders every Markdown text that isn't in the rendered prose table
+    yet, stores the results there, and removes renderings of texts that
+    are gone.  Returns the number of texts rendered.
+
+    The renderings are for the session's default language, and its own
+    `markdown_extension_class`.
+
+    `full`
+        If set to True, everything is rendered again, even texts that were
+        rendered before.
+
+    `procs`
+        The number of processes to render in; the default is one per CPU.
+        In-memory SQLite databases, and sessions whose extension class can't
+        be imported by the workers, are always rendered in this process.
+    """
+    if procs is None:
+        procs = multiprocessing.cpu_count()
+
+    connection = session.connection()
+    if full:
+        metadata.drop_all(bind=connection)
+    metadata.create_all(bind=connection)
+
+    texts = {}
+    for source_text, language_id in _iter_texts(session):
+        content_hash = markdown.content_hash(
+            source_text, language_id, session.default_language_id)
+        texts[content_hash] = source_text, language_id
+
+    stored = set(content_hash for content_hash, in session.execute(
+        select([rendered_prose_table.c.content_hash])))
+    for chunk in _chunks(stored - set(texts), CHUNK_SIZE):
+        session.execute(rendered_prose_table.delete().where(
+            rendered_prose_table.c.content_hash.in_(chunk)))
+
+    new_texts = [text for content_hash, text in sorted(texts.items())
+                 if content_hash not in stored]
+    chunks = list(_chunks(new_texts, RENDER_CHUNK_SIZE))
+    url = session.get_bind().url
+    in_memory = url.drivername.startswith('sqlite') and \
+        url.database in (None, '', ':memory:')
+    extension_path = _class_path(type(session.markdown_extension))
+
+    if procs > 1 and len(chunks) > 1 and not in_memory and \
+            extension_path is not None:
+        # The workers read the database while we wait, so don't hold on
+        # to a transaction (and, on SQLite, a lock) meanwhile
+        session.commit()
+        pool = multiprocessing.Pool(procs, _init_worker, (
+            str(url), session.default_language_id, extension_path))
+        try:
+            results = list(pool.imap(_render_in_worker, chunks))
+        finally:
+            pool.terminate()
+    else:
+        results = [_render(session, chunk) for chunk in chunks]
+
+    rows = [dict(content_hash=content_hash, html=html, text=text)
+            for result in results
+            for content_hash, html, text in result]
+    for chunk in _chunks(rows, CHUNK_SIZE):
+        session.execute(rendered_prose_table.insert(), chunk)
+    session.commit()
+
+    # The session's extension may have found the table missing before
+    session.markdown_extension.clear_cache()
+    return len(rows)
@@ -491,7 +491,7 @@ def synchronize(reference, stream, key=lambda x: x, unused=None):
 def yield_source_csv_messages(cls, foreign_cls, csvreader, force_column=None):
     """Yield all messages from one source CSV file.
     """
-    columns = list(cls.__table__.c)
+    columns = [c for c in cls.__table__.c if not c.info.get('derived')]
     column_names = next(csvreader)
     # Assumptions: rows are in lexicographic order
     #  (taking numeric values as numbers of course)
@@ -4,10 +4,76 @@ These include identifier- and name-based lookup, filtering out base forms
 of pokemon, and filtering/ordering by name.
 """
 
-from sqlalchemy.orm import aliased
-from sqlalchemy.sql.expression import func
+from __future__ import division
+
+from sqlalchemy import inspect
+from sqlalchemy.engine.interfaces import Dialect
+from sqlalchemy.ext import baked
+from sqlalchemy.orm.scoping import ScopedSession
+from sqlalchemy.sql.expression import bindparam, func
 from sqlalchemy.sql.functions import coalesce
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.util import LRUCache
+
+from pokedex.db.multilang import FallbackColumn
+
+### Query cache
+
+class QueryCache(LRUCache):
+    """An LRU cache that counts its hits and misses.
+
+    Baked queries keep two kinds of things in their cache: the queries
+    themselves, and, keyed by dialect, the SQL they compile to.  They're
+    counted separately, as 'queries' and 'compiled'.  The helpers below also
+    keep the clauses they add to plain queries there, as 'clauses'.
+    """
+    kinds = 'queries', 'compiled', 'clauses'
+
+    def __init__(self, *args, **kwargs):
+        super(QueryCache, self).__init__(*args, **kwargs)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = dict.fromkeys(self.kinds, 0)
+        self.misses = dict.fromkeys(self.kinds, 0)
+
+    def get(self, key, default=None):
+        value = super(QueryCache, self).get(key, default)
+        if isinstance(key[0], Dialect):
+            kind = 'compiled'
+        elif key[0] == 'clauses':
+            kind = 'clauses'
+        else:
+            kind = 'queries'
+        if value is default:
+            self.misses[kind] += 1
+        else:
+            self.hits[kind] += 1
+        return value
+
+    def hit_rate(self, kind='queries'):
+        """Returns the fraction of lookups that were hits, or None if there
+        haven't been any.
+        """
+        lookups = self.hits[kind] + self.misses[kind]
+        if not lookups:
+            return None
+        return self.hits[kind] / lookups
+
+# Builds the queries for the helpers below, and caches them, so that each
+# shape of query is only built and compiled once.  `bakery.cache` is the
+# QueryCache.
+bakery = baked.Bakery(baked.BakedQuery, QueryCache(500))
+
+def _cached_clauses(key, build):
+    """Returns what `build()` returns, cached in the bakery's cache under
+    `key`, for the helpers to reuse on plain queries.
+    """
+    key = ('clauses', ) + key
+    clauses = bakery.cache.get(key)
+    if clauses is None:
+        clauses = bakery.cache[key] = build()
+    return clauses
 
 ### Getter
 
@@ -28,15 +94,27 @@ def get(session, table, identifier=None, name=None, id=None, language=None):
 
     If zero or more than one objects matching the criteria are found, the
     appropriate SQLAlchemy exception is raised.
+
+    The query is baked, so its SQL is only built once for each table and
+    combination of criteria.
     """
 
-    query = session.query(table)
+    if isinstance(session, ScopedSession):
+        # Baked queries need the real thing
+        session = session()
+
+    query = bakery(lambda session: session.query(table), table)
+    params = dict(_default_language_id=session.default_language_id)
 
     if identifier is not None:
-        query = query.filter_by(identifier=identifier)
+        query += lambda q: q.filter(table.identifier == bindparam('identifier'))
+        params['identifier'] = identifier
 
     if name is not None:
         query = filter_name(query, table, name, language)
+        params['name'] = name
+
+    query = query(session).params(**params)
 
     if id is not None:
         # ASSUMPTION: id is the primary key of the table.
@@ -59,20 +137,53 @@ def filter_name(query, table, name, language, name_attribute='name'):
     name: The name to look for. May be a tuple of alternatives.
     language: The language for "name", or None for the session default
     name_attribute: the attribute to use; defaults to 'name'
+
+    The query may also be a BakedQuery, in which case the name is left as a
+    bound parameter called `name`, to be given to the result's params().
+
+    On a plain query, the filter is cached, with the name as a parameter
+    named after the names table and attribute, such as
+    `pokemon_species_names_name`.
     """
-    if language is None:
-        query = query.filter(getattr(table, name_attribute) == name)
-    else:
-        names_table = table.names_table
-        name_column = getattr(names_table, name_attribute)
-        query = query.join(names_table)
-        query = query.filter(names_table.foreign_id == table.id)
-        query = query.filter(names_table.local_language_id == language.id)
-        if isinstance(name, tuple):
-            query = query.filter(name_column in name)
-        else:
-            query = query.filter(name_column == name)
-    return query
+    expanding = isinstance(name, tuple)
+    if isinstance(query, baked.BakedQuery):
+        name_param = bindparam('name', expanding=expanding)
+        language_id = None if language is None else language.id
+        return query.with_criteria(
+            lambda q: q.with_local_names(table, language).filter(
+                _name_criterion(table, name_param, name_attribute)),
+            table, language_id, expanding, name_attribute)
+
+    param_name = '%s_%s' % (table.names_table.__tablename__, name_attribute)
+    criterion = _cached_clauses(
+        ('filter_name', table, name_attribute, expanding),
+        lambda: _name_criterion(
+            table, bindparam(param_name, expanding=expanding), name_attribute))
+    query = query.with_local_names(table, language).filter(criterion)
+    return query.params({param_name: list(name) if expanding else name})
+
+def _name_criterion(table, name_param, name_attribute):
+    name_column = getattr(table.names_table, name_attribute)
+    if name_param.expanding:
+        return name_column.in_(name_param)
+    return name_column == name_param
+
+def _has_sort_key(session, table):
+    """Returns whether the database has the `sort_key` column of `table`'s
+    names table.  Databases loaded before it was added don't; the answer is
+    kept in the session's `info`.
+    """
+    names_table = table.names_table.__table__
+    if 'sort_key' not in names_table.c:
+        return False
+    if session is None:
+        return True
+    checked = session.info.setdefault('pokedex_sort_keys', {})
+    if names_table.name not in checked:
+        columns = inspect(session.connection()).get_columns(names_table.name)
+        checked[names_table.name] = any(
+            column['name'] == 'sort_key' for column in columns)
+    return checked[names_table.name]
 
 def order_by_name(query, table, language=None, *extra_languages, **kwargs):
     """Order a query by name.
@@ -87,22 +198,47 @@ def order_by_name(query, table, language=None, *extra_languages, **kwargs):
     name_attribute (keyword argument): the attribute to use; defaults to 'name'
 
     Uses the identifier as a fallback ordering.
+
+    Names are sorted by their `sort_key`, which ignores case and accents in a
+    way that suits each language; see `pokedex.normalize.sort_keys`.  Other
+    attributes, and names in databases loaded before sort keys were added,
+    are only lowercased.
+
+    The query may also be a BakedQuery.  On a plain query, the joined names
+    and the ORDER BY clause are cached.
     """
     name_attribute = kwargs.pop('name', 'name')
     if kwargs:
         raise ValueError('Unexpected keyword arguments: %s' % kwargs.keys())
-    order_columns = []
-    if language is None:
-        query = query.outerjoin(table.names_local)
-        order_columns.append(func.lower(getattr(table.names_table, name_attribute)))
+    if isinstance(query, baked.BakedQuery):
+        # n.b.: the SQL is cached without regard to whether the database has
+        # sort keys, so don't mix databases from before and after them
+        languages = (language, ) + extra_languages
+        language_ids = tuple(None if language is None else language.id
+                             for language in languages)
+        return query.with_criteria(
+            lambda q: order_by_name(q, table, *languages, name=name_attribute),
+            table, language_ids, name_attribute)
+    # None, for the default language, works as a fallback language too
+    languages = (language, ) + extra_languages
+    language_ids = tuple(None if language is None else language.id
+                         for language in languages)
+    if name_attribute == 'name' and _has_sort_key(query.session, table):
+        # Already normalized, and indexed
+        column_name = 'sort_key'
     else:
-        extra_languages = (language, ) + extra_languages
-    for language in extra_languages:
-        names_table = aliased(table.names_table)
-        query = query.outerjoin(names_table)
-        query = query.filter(names_table.foreign_id == table.id)
-        query = query.filter(names_table.local_language_id == language.id)
-        order_columns.append(func.lower(getattr(names_table, name_attribute)))
-    order_columns.append(table.identifier)
-    query = query.order_by(coalesce(*order_columns))
+        column_name = name_attribute
+
+    def build():
+        name_column = FallbackColumn(table, column_name, languages, default=False)
+        if column_name == 'sort_key':
+            order_columns = [name_column, table.identifier]
+        else:
+            order_columns = [func.lower(name_column), table.identifier]
+        return name_column, coalesce(*order_columns)
+
+    name_column, order = _cached_clauses(
+        ('order_by_name', table, column_name, language_ids), build)
+    query = query.with_fallback(name_column)
+    query = query.order_by(order)
     return query
@@ -2,6 +2,15 @@
 
 import os
 
+# Lookup backends that can be picked by name, as `module:class`.  Imported
+# only when used, so that their dependencies are optional.  These live here,
+# and not in pokedex.lookup, so the CLI can list them without importing it
+lookup_backends = dict(
+    whoosh='pokedex.lookup.whoosh_backend:WhooshBackend',
+    memory='pokedex.lookup.memory:MemoryBackend',
+    sqlite='pokedex.lookup.sqlite_backend:SQLiteBackend',
+)
+
 def get_default_db_uri_with_origin():
     uri = os.environ.get('POKEDEX_DB_ENGINE', None)
     origin = 'environment'
@@ -27,6 +36,16 @@ def get_default_index_dir_with_origin():
 
     return index_dir, origin
 
+def get_default_lookup_backend_with_origin():
+    backend = os.environ.get('POKEDEX_LOOKUP_BACKEND', None)
+    origin = 'environment'
+
+    if backend is None:
+        backend = 'whoosh'
+        origin = 'default'
+
+    return backend, origin
+
 def get_default_csv_dir_with_origin():
     import pkg_resources
     csv_dir = pkg_resources.resource_filename('pokedex', 'data/csv')
@@ -41,6 +60,9 @@ def get_default_db_uri():
 def get_default_index_dir():
     return get_default_index_dir_with_origin()[0]
 
+def get_default_lookup_backend():
+    return get_default_lookup_backend_with_origin()[0]
+
 def get_default_csv_dir():
     return get_default_csv_dir_with_origin()[0]
 
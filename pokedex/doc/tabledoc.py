@@ -23,9 +23,10 @@ from sqlalchemy.orm import configure_mappers
 from sqlalchemy.ext.associationproxy import AssociationProxy
 from pokedex.db.markdown import MoveEffectPropertyMap, MoveEffectProperty
 
-from pokedex.db import tables, markdown
+from pokedex.db import tables, markdown, multilang
 
-# Make sure all the backrefs are in place
+# Make sure all the backrefs and translation relations are in place
+multilang.map_translation_classes()
 configure_mappers()
 
 
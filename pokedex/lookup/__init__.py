@@ -0,0 +1,1072 @@
+# encoding: utf8
+import array
+import bisect
+import hashlib
+import heapq
+import importlib
+import json
+import multiprocessing
+import random
+import re
+
+from six import string_types, text_type
+from sqlalchemy.sql import select
+
+from pokedex.compatibility import namedtuple
+
+from pokedex.db import connect
+import pokedex.db.tables as tables
+from pokedex.lookup.backend import (
+    LookupBackend, Query, Ranking, UninitializedIndex, relative_similarity,
+    table_order as _table_order, EXACT, WILDCARD, ID, PREFIX, ANY)
+from pokedex.lookup.ngram import NgramIndex, N as NGRAM_LENGTH
+from pokedex.normalize import normalize_name, normalize_many
+from pokedex.roomaji import romanize_many
+from pokedex.defaults import (
+    get_default_index_dir, get_default_lookup_backend, lookup_backends)
+
+__all__ = ['PokedexLookup', 'hydrate']
+
+
+LookupResult = namedtuple('LookupResult', [
+    'object', 'indexed_name', 'name', 'language', 'iso639', 'iso3166', 'exact',
+])
+
+Completion = namedtuple('Completion', ['name', 'table', 'id'])
+
+# Max ids per IN clause when hydrating
+HYDRATE_CHUNK_SIZE = 500
+
+
+class LazyObject(object):
+    """Stands in for the database object in a `LookupResult` until it's
+    actually needed, when the lookup is made with `lazy=True`.
+
+    The table and id are known up front, so `id`, `__tablename__` and
+    `isinstance()` work without touching the database; any other attribute
+    loads the object from the session.  Use `hydrate()` to load a bunch of
+    them at once.
+
+    It's not quite the object, though: `type()` gives LazyObject, and
+    comparing or hashing it loads the object.  Pickling it pickles the
+    object.
+    """
+    __slots__ = ('_session', '_cls', 'id', '_object')
+
+    def __init__(self, session, cls, id):
+        self._session = session
+        self._cls = cls
+        self.id = id
+        self._object = None
+
+    @property
+    def __class__(self):
+        return self._cls
+
+    @property
+    def __tablename__(self):
+        return self._cls.__tablename__
+
+    def _hydrate(self):
+        if self._object is None:
+            self._object = self._session.query(self._cls).get(self.id)
+        return self._object
+
+    def __getattr__(self, name):
+        return getattr(self._hydrate(), name)
+
+    def __setattr__(self, name, value):
+        if name in LazyObject.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._hydrate(), name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyObject):
+            other = other._hydrate()
+        return self._hydrate() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._hydrate())
+
+    def __repr__(self):
+        if self._object is None:
+            return '<lazy %s id=%r>' % (self._cls.__name__, self.id)
+        return repr(self._object)
+
+    def __str__(self):
+        return str(self._hydrate())
+
+    def __reduce__(self):
+        return self._hydrate().__reduce__()
+
+    def __reduce_ex__(self, protocol):
+        return self._hydrate().__reduce_ex__(protocol)
+
+def hydrate(results):
+    """Loads the objects of the given `LookupResult`s, with one query per
+    table, and returns the results.
+    """
+    pending = {}
+    for result in results:
+        obj = result.object
+        if isinstance(obj, LazyObject) and obj._object is None:
+            key = obj._session, obj._cls
+            pending.setdefault(key, {}).setdefault(obj.id, []).append(obj)
+
+    for (session, cls), proxies in pending.items():
+        ids = list(proxies)
+        for i in range(0, len(ids), HYDRATE_CHUNK_SIZE):
+            for row in session.query(cls).filter(
+                    cls.id.in_(ids[i:i + HYDRATE_CHUNK_SIZE])):
+                for proxy in proxies[row.id]:
+                    proxy._object = row
+
+    return results
+
+# Backends that can be picked by name; see `pokedex.defaults`
+backends = lookup_backends
+
+def get_backend_class(name):
+    """Returns the backend class registered under `name` in `backends`."""
+    try:
+        path = backends[name]
+    except KeyError:
+        raise ValueError("Unknown lookup backend %r; choose from %s" % (
+            name, ', '.join(sorted(backends))))
+    module_name, class_name = path.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+def _make_document_groups(name_rows):
+    """Turns `(table, row_id, language_id, language, iso639, iso3166, name)`
+    tuples into `(key, content_hash, documents)` groups, one per tuple.
+
+    This is where the expensive normalization and romanization happens, so
+    it lives at module level to be usable from a process pool.
+    """
+    name_rows = list(name_rows)
+
+    # Add generated Roomaji too
+    # XXX this should be a first-class concept, not piggybacking on
+    # Japanese
+    roomaji = iter(romanize_many(
+        row[-1] for row in name_rows if row[3] == u'ja-Hrkt'))
+
+    names_per_row = []
+    for (table, row_id, language_id, language, iso639, iso3166,
+            name) in name_rows:
+        names = [name]
+        if language == u'ja-Hrkt':
+            names.append(next(roomaji))
+        names_per_row.append(names)
+
+    # Normalize everything in one go
+    normalized = iter(normalize_many(
+        name for names in names_per_row for name in names))
+
+    groups = []
+    for (table, row_id, language_id, language, iso639, iso3166,
+            _), names in zip(name_rows, names_per_row):
+        key = u'%s/%s/%s' % (table, row_id, language)
+        documents = [
+            dict(
+                name=next(normalized),
+                display_name=name,
+                table=text_type(table),
+                table_order=_table_order[table],
+                row_id=text_type(row_id),
+                language=language,
+                language_id=language_id,
+                iso639=iso639,
+                iso3166=iso3166,
+                key=key,
+            )
+            for name in names
+        ]
+
+        content = repr(sorted(
+            sorted(document.items()) for document in documents))
+        content_hash = text_type(
+            hashlib.sha1(content.encode('utf8')).hexdigest())
+        for document in documents:
+            document['content_hash'] = content_hash
+
+        groups.append((key, content_hash, documents))
+
+    return groups
+
+class AutocompleteIndex(object):
+    """Sorted arrays of indexed names, for fast ranked prefix completion.
+
+    Names are split into buckets by (language, table), and each bucket is
+    sorted by normalized name, so every prefix corresponds to a contiguous
+    slice of each bucket that bisect can find.  Completions are ranked the
+    same way as lookup results: current locale first, then roomaji, then
+    everything else; within that by table order, then by name.  Walking the
+    buckets in that order means only about `limit` entries are ever looked
+    at, no matter how short the prefix is.
+
+    Built from the backend's documents by `rebuild_index` and `update_index`,
+    and saved as JSON with the backend's `save_blob()`.
+    """
+    filename = 'AUTOCOMPLETE_MAIN.json'
+
+    def __init__(self, languages, buckets):
+        # language_id => (identifier, iso639, iso3166)
+        self.languages = languages
+        # (language_id, table) => (names, display_names, row_ids)
+        self.buckets = buckets
+
+    @classmethod
+    def from_documents(cls, documents):
+        languages = {}
+        entries = {}
+        for fields in documents:
+            language_id = fields['language_id']
+            languages[language_id] = (
+                fields['language'], fields['iso639'], fields['iso3166'])
+            entries.setdefault((language_id, fields['table']), []).append(
+                (fields['name'], fields['display_name'],
+                 int(fields['row_id'])))
+
+        buckets = {}
+        for key, bucket_entries in entries.items():
+            bucket_entries.sort()
+            buckets[key] = tuple(list(column)
+                                 for column in zip(*bucket_entries))
+
+        return cls(languages, buckets)
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data.decode('utf8'))
+
+        languages = dict(
+            (int(language_id), tuple(codes))
+            for language_id, codes in data['languages'].items())
+        buckets = dict(
+            ((language_id, table), (names, display_names, row_ids))
+            for language_id, table, names, display_names, row_ids
+            in data['buckets'])
+        return cls(languages, buckets)
+
+    def to_json(self):
+        data = dict(
+            languages=self.languages,
+            buckets=[key + columns for key, columns in self.buckets.items()],
+        )
+        return json.dumps(data, ensure_ascii=False).encode('utf8')
+
+    def complete(self, prefix, locale_id, roomaji_id=None,
+                 tables=None, languages=None):
+        """Yields `(name, display_name, table, row_id, language_id)` for
+        every name starting with `prefix`, best first.
+
+        `tables` and `languages` optionally restrict the results to the given
+        table names and language ids.
+        """
+        language_ids = set(self.languages)
+        if languages is not None:
+            language_ids &= set(languages)
+
+        # Tiers of languages that are equally good, best first
+        tiers = []
+        for language_id in (locale_id, roomaji_id):
+            if language_id in language_ids:
+                tiers.append([language_id])
+                language_ids.discard(language_id)
+        tiers.append(sorted(language_ids))
+
+        # Groups of tables that are equally good, best first
+        table_groups = {}
+        for table in _table_order:
+            if tables is None or table in tables:
+                table_groups.setdefault(_table_order[table], []).append(table)
+
+        end = prefix + u'\U0010ffff'
+        for tier in tiers:
+            for order in sorted(table_groups):
+                slices = []
+                for language_id in tier:
+                    for table in table_groups[order]:
+                        bucket = self.buckets.get((language_id, table))
+                        if not bucket:
+                            continue
+                        names = bucket[0]
+                        lo = bisect.bisect_left(names, prefix)
+                        hi = bisect.bisect_left(names, end, lo)
+                        if lo < hi:
+                            slices.append(self._iter_slice(
+                                bucket, lo, hi, table, language_id))
+
+                for completion in heapq.merge(*slices):
+                    yield completion
+
+    @staticmethod
+    def _iter_slice(bucket, lo, hi, table, language_id):
+        names, display_names, row_ids = bucket
+        for i in range(lo, hi):
+            yield names[i], display_names[i], table, row_ids[i], language_id
+
+
+class PokedexLookup(object):
+    MAX_FUZZY_RESULTS = 10
+    MAX_EXACT_RESULTS = 43
+    INTERMEDIATE_FACTOR = 2
+    # Number of names handed to each worker process when indexing
+    INDEX_CHUNK_SIZE = 2000
+
+    # Dictionary of table name => table class.
+    # Need the table name so we can get the class from the table name after we
+    # retrieve something from the index
+    indexed_tables = dict(
+        (cls.__tablename__, cls)
+        for cls in (
+            tables.Ability,
+            tables.Item,
+            tables.Location,
+            tables.Move,
+            tables.Nature,
+            tables.PokemonSpecies,
+            tables.PokemonForm,
+            tables.Type,
+
+            tables.ConquestKingdom,
+            tables.ConquestWarrior,
+            tables.ConquestWarriorSkill,
+        )
+    )
+
+
+    def __init__(self, directory=None, session=None, backend=None):
+        """Opens the index stored in the named directory.  If the index
+        doesn't already exist, it will be created.
+
+        `directory`
+            Directory containing the index.  Defaults to a location within the
+            `pokedex` egg directory.
+
+        `session`
+            Used for creating the index and retrieving objects.  Defaults to an
+            attempt to connect to the default SQLite database installed by
+            `pokedex setup`.
+
+        `backend`
+            What stores and searches the names: the name of one of `backends`,
+            a `LookupBackend` subclass, or an instance of one.  Defaults to the
+            POKEDEX_LOOKUP_BACKEND environment variable, or whoosh.
+        """
+
+        # By the time this returns, self.backend and self.session must be set
+
+        # If a directory was not given, use the default
+        if directory is None:
+            directory = get_default_index_dir()
+
+        self.directory = directory
+        self._roomaji_id = None
+        self._random_ids = None
+        self._autocomplete_index = None
+        self._ngram_index = None
+
+        if session:
+            self.session = session
+        else:
+            self.session = connect()
+
+        if backend is None:
+            backend = get_default_lookup_backend()
+        if isinstance(backend, string_types):
+            backend = get_backend_class(backend)
+        if not isinstance(backend, LookupBackend):
+            backend = backend(directory, session=self.session)
+        self.backend = backend
+
+    @property
+    def index(self):
+        """The backend's underlying index; an `UninitializedIndex` if it
+        hasn't been built yet.
+        """
+        return self.backend.index
+
+    def _get_indexed_classes(self, tables=None):
+        """Returns the table classes to index; all of them if `tables` is
+        None, otherwise those named (or given) in `tables`.
+        """
+        if tables is None:
+            return list(self.indexed_tables.values())
+
+        classes = []
+        for table in tables:
+            table_name = self._parse_table_name(table)
+            if not table_name:
+                raise ValueError("%r is not an indexed table" % (table,))
+            classes.append(self.indexed_tables[table_name])
+        return classes
+
+    def _select_names(self, cls):
+        """Returns a Core select of `(row_id, language_id, language, iso639,
+        iso3166, name)` for every name of every row in `cls`.
+        """
+        if cls == tables.PokemonForm:
+            name_column = 'pokemon_name'
+        else:
+            name_column = 'name'
+
+        names = cls.names_table.__table__
+        languages = tables.Language.__table__
+        foreign_id = names.c[cls.__singlename__ + '_id']
+        name = names.c[name_column]
+
+        return (
+            select([
+                foreign_id,
+                languages.c.id,
+                languages.c.identifier,
+                languages.c.iso639,
+                languages.c.iso3166,
+                name,
+            ])
+            .select_from(names.join(
+                languages, names.c.local_language_id == languages.c.id))
+            .where(name != None)
+            .where(name != u'')
+            .order_by(foreign_id, languages.c.id)
+        )
+
+    def _iter_document_groups(self, classes, procs=None):
+        """Yields `(key, content_hash, documents)` for every indexed name of
+        every row in the given table classes.
+
+        Documents are grouped by (table, row_id, language); `content_hash`
+        changes whenever anything in the group does.
+
+        Names are fetched with a single query per table, and normalized in a
+        pool of `procs` processes (default: one per CPU).
+        """
+        if procs is None:
+            procs = multiprocessing.cpu_count()
+
+        chunks = []
+        for cls in classes:
+            table_name = text_type(cls.__tablename__)
+            rows = [(table_name,) + tuple(row) for row in
+                    self.session.execute(self._select_names(cls))]
+            chunks.extend(rows[i:i + self.INDEX_CHUNK_SIZE]
+                          for i in range(0, len(rows), self.INDEX_CHUNK_SIZE))
+
+        if procs > 1 and len(chunks) > 1:
+            pool = multiprocessing.Pool(procs)
+            try:
+                for groups in pool.imap(_make_document_groups, chunks):
+                    for group in groups:
+                        yield group
+            finally:
+                pool.terminate()
+        else:
+            for chunk in chunks:
+                for group in _make_document_groups(chunk):
+                    yield group
+
+    def rebuild_index(self, procs=None):
+        """Creates the index from scratch.
+
+        `procs`
+            Number of processes used to build the index.  Defaults to the
+            number of CPUs.
+
+        The sqlite backend writes in the session's transaction, so commit the
+        session afterwards to keep the index.
+        """
+        if procs is None:
+            procs = multiprocessing.cpu_count()
+
+        # Index every name in all our tables of interest
+        groups = self._iter_document_groups(
+            self._get_indexed_classes(), procs=procs)
+        self.backend.rebuild(groups, procs=procs)
+
+        self._random_ids = None
+        self._rebuild_side_indexes()
+
+    def update_index(self, tables=None, procs=None):
+        """Brings the index up to date with the database, only touching the
+        documents that have actually changed.
+
+        `tables`
+            A list of table names or classes to update.  Defaults to all of
+            `indexed_tables`.
+
+        `procs`
+            Number of processes used to prepare documents.  Defaults to the
+            number of CPUs.
+
+        Falls back to `rebuild_index()` if there is no index yet, or if it was
+        built in an older format.
+
+        Returns `(added, updated, deleted)` counts of (table, row_id, language)
+        document groups.
+
+        Like `rebuild_index()`, the sqlite backend needs the session committed
+        afterwards.
+        """
+        if not self.backend.is_current():
+            self.rebuild_index(procs=procs)
+            added = len(set(
+                document['key'] for document in self.backend.iter_documents()))
+            return added, 0, 0
+
+        classes = self._get_indexed_classes(tables)
+        table_names = set(cls.__tablename__ for cls in classes)
+
+        # Find out what's in the index right now
+        old_hashes = self.backend.get_hashes(table_names)
+
+        added = updated = deleted = 0
+        changed_groups = []
+        replaced_keys = []
+        groups = self._iter_document_groups(classes, procs=procs)
+        for group in groups:
+            key, content_hash, documents = group
+            old_hash = old_hashes.pop(key, None)
+            if old_hash == content_hash:
+                continue
+            elif old_hash is None:
+                added += 1
+            else:
+                replaced_keys.append(key)
+                updated += 1
+
+            changed_groups.append(group)
+
+        # Whatever is left no longer exists in the database
+        replaced_keys.extend(old_hashes)
+        deleted = len(old_hashes)
+
+        if added or updated or deleted:
+            self.backend.update(changed_groups, replaced_keys)
+            self._random_ids = None
+            self._rebuild_side_indexes()
+
+        return added, updated, deleted
+
+
+    def _build_side_indexes(self):
+        """Regenerates the autocompletion data and the n-gram index from the
+        index, in memory only.
+        """
+        documents = list(self.backend.iter_documents())
+        self._autocomplete_index = AutocompleteIndex.from_documents(documents)
+        self._ngram_index = NgramIndex.from_names(
+            document['name'] for document in documents)
+
+    def _rebuild_side_indexes(self):
+        """Regenerates the autocompletion data and the n-gram index from the
+        index, and saves them alongside it.
+        """
+        self._build_side_indexes()
+        self.backend.save_blob(AutocompleteIndex.filename,
+                               self._autocomplete_index.to_json())
+        self.backend.save_blob(NgramIndex.filename,
+                               self._ngram_index.to_json())
+
+    def _get_autocomplete_index(self):
+        """Returns the `AutocompleteIndex`, loading it if necessary.  Indexes
+        built before it existed get one generated on the fly, which isn't
+        saved: lookups don't write.
+        """
+        if self._autocomplete_index is None:
+            data = self.backend.load_blob(AutocompleteIndex.filename)
+            if data is None:
+                self._build_side_indexes()
+            else:
+                self._autocomplete_index = AutocompleteIndex.from_json(data)
+
+        return self._autocomplete_index
+
+    def _get_ngram_index(self):
+        """Returns the `NgramIndex`, loading it if necessary.  Indexes built
+        before it existed get one generated on the fly, like the
+        `AutocompleteIndex`.
+        """
+        if self._ngram_index is None:
+            data = self.backend.load_blob(NgramIndex.filename)
+            if data is None:
+                self._build_side_indexes()
+            else:
+                self._ngram_index = NgramIndex.from_json(data)
+
+        return self._ngram_index
+
+    def normalize_name(self, name):
+        """Strips irrelevant formatting junk from name input.
+
+        Specifically: everything is lowercased, and accents are removed.
+        """
+        return normalize_name(name)
+
+
+    def _apply_valid_types(self, name, valid_types):
+        """Combines the enforced `valid_types` with any from the search string
+        itself and updates the query.
+
+        For example, a name of 'a,b:foo' and valid_types of b,c will search for
+        only `b`s named "foo".
+
+        Returns `(name, merged_valid_types, tables, languages)`, where `name`
+        has had any type prefix stripped, `merged_valid_types` combines the
+        original `valid_types` with the type prefix, and `tables` and
+        `languages` are sets of the allowed table names and language codes.
+        Either is None if there is no such restriction.
+        """
+
+        # Remove any type prefix (pokemon:133) first
+        user_valid_types = []
+        if ':' in name:
+            prefix_chunk, name = name.split(':', 1)
+            name = name.strip()
+
+            prefixes = prefix_chunk.split(',')
+            user_valid_types = []
+            for prefix in prefixes:
+                prefix = prefix.strip()
+                if prefix:
+                    user_valid_types.append(prefix)
+                if prefix == 'pokemon':
+                    # When the user says 'pokemon', they really meant both
+                    # species & form.
+                    user_valid_types.append('pokemon_species')
+                    user_valid_types.append('pokemon_form')
+
+        # Merge the valid types together.  Only types that appear in BOTH lists
+        # may be used.
+        # As a special case, if the user asked for types that are explicitly
+        # forbidden, completely ignore what the user requested.
+        # And, just to complicate matters: "type" and language need to be
+        # considered separately.
+        def merge_requirements(func):
+            user = list(filter(func, user_valid_types))
+            system = list(filter(func, valid_types))
+
+            if user and system:
+                merged = list(set(user) & set(system))
+                if merged:
+                    return merged
+                else:
+                    # No overlap; use the system restrictions
+                    return system
+            else:
+                # One or the other is blank; use the one that's not
+                return user or system
+
+        # @foo means language must be foo; otherwise it's a table name
+        lang_requirements = merge_requirements(lambda req: req[0] == u'@')
+        type_requirements = merge_requirements(lambda req: req[0] != u'@')
+        all_requirements = lang_requirements + type_requirements
+
+        # Collect the restrictions
+        languages = set()
+        for lang in lang_requirements:
+            # Allow for either country or language codes
+            languages.add(lang[1:])
+
+        table_names = set()
+        for type in type_requirements:
+            table_name = self._parse_table_name(type)
+
+            # Quietly ignore bogus valid_types; more likely to DTRT
+            if table_name:
+                table_names.add(table_name)
+
+        return name, all_requirements, table_names or None, languages or None
+
+
+    def _parse_table_name(self, name):
+        """Takes a singular table name, table name, or table object and returns
+        the table name.
+
+        Returns None for a bogus name.
+        """
+        # Table object
+        if hasattr(name, '__tablename__'):
+            return getattr(name, '__tablename__')
+
+        # Table name
+        for table in self.indexed_tables.values():
+            if name in (table.__tablename__, table.__singlename__):
+                return table.__tablename__
+
+        # Bogus.  Be nice and return dummy
+        return None
+
+    def _records_to_results(self, records, exact=True):
+        """Converts a list of the backend's documents to LookupResult tuples
+        containing database objects.  The objects are `LazyObject`s, so
+        they're only loaded if they're used; see `_load_results()`.
+        """
+        # XXX cache me?
+        languages = dict(
+            (row.identifier, row)
+            for row in self.session.query(tables.Language)
+        )
+        # XXX this 'exact' thing is getting kinda leaky.  would like a better
+        # way to handle it, since only lookup() cares about fuzzy results
+        seen = {}
+        results = []
+        for record in records:
+            # Skip dupes
+            seen_key = record['table'], record['row_id']
+            if seen_key in seen:
+                continue
+            seen[seen_key] = True
+
+            cls = self.indexed_tables[record['table']]
+            obj = LazyObject(self.session, cls, int(record['row_id']))
+
+            results.append(LookupResult(object=obj,
+                                        indexed_name=record['name'],
+                                        name=record['display_name'],
+                                        language=languages[record['language']],
+                                        iso639=record['iso639'],
+                                        iso3166=record['iso3166'],
+                                        exact=exact))
+
+        return results
+
+    def _load_results(self, results, lazy=False):
+        """Returns `results` from `_records_to_results()` with the actual
+        database objects in them, loaded with one query per table, unless
+        `lazy` is set.
+        """
+        if lazy:
+            return results
+        hydrate(results)
+        return [result._replace(object=result.object._object)
+                for result in results]
+
+    def _get_roomaji_id(self):
+        """Returns the id of the roomaji language, or -1 if there's none."""
+        if self._roomaji_id is None:
+            languages = tables.Language.__table__
+            self._roomaji_id, = self.session.execute(
+                select([languages.c.id])
+                .where(languages.c.identifier == u'roomaji')
+            ).fetchone() or (-1,)
+
+        return self._roomaji_id
+
+    def _ranking(self, extra_weights={}):
+        """Returns a `Ranking` that bubbles results in the session's current
+        language to the top of the list.
+
+        `extra_weights` may be a dictionary of weights which will be factored
+        in.  Intended for use with spelling corrections, which come along with
+        their own weightings.
+        """
+        weights = {}
+        # Given that the Japanese names are the originals, it seems likely that
+        # basically anyone might want to look them up.  Boost them a little
+        # bit.
+        weights[self._get_roomaji_id()] = 1.4
+        # Bump up names in the current locale
+        weights[self.session.default_language_id] = 2.0
+        return Ranking(weights, extra_weights=extra_weights)
+
+
+    def _wildcard_query(self, pattern, table_names=None, languages=None):
+        """Returns a `Query` for the wildcard `pattern`.
+
+        Most backends can only narrow down the names to try by the pattern's
+        literal prefix.  When that's too short to help, the n-gram index finds
+        the matching names instead.
+        """
+        literal_prefix = re.split(u'[*?]', pattern, 1)[0]
+        if len(literal_prefix) < NGRAM_LENGTH and \
+                not self.backend.indexes_wildcards:
+            names = self._get_ngram_index().match(pattern)
+            if names is not None:
+                return Query(ANY, names, table_names, languages)
+
+        return Query(WILDCARD, pattern, table_names, languages)
+
+    def lookup(self, input, valid_types=[], exact_only=False, lazy=False):
+        """Attempts to find some sort of object, given a name.
+
+        Returns a list of named (object, name, language, iso639, iso3166,
+        exact) tuples.  `object` is a database object, `name` is the name under
+        which the object was found, `language` and the two isos are the name
+        and country codes of the language in which the name was found, and
+        `exact` is True iff this was an exact match.
+
+        This function currently ONLY does fuzzy matching if there are no exact
+        matches.
+
+        Extraneous whitespace is removed with extreme prejudice.
+
+        Recognizes:
+        - Names: "Eevee", "Surf", "Run Away", "Payapa Berry", etc.
+        - Foreign names: "Iibui", "Eivui"
+        - Fuzzy names in whatever language: "Evee", "Ibui"
+        - IDs: "133", "192", "250"
+        Also:
+        - Type restrictions.  "type:psychic" will only return the type.  This
+          is how to make ID lookup useful.  Multiple type specs can be entered
+          with commas, as "move,item:1".
+        - Language restrictions.  "@fr:charge" will only return Tackle, which
+          is called "Charge" in French.  These can be combined with type
+          restrictions, e.g., "@fr,move:charge".
+
+        `input`
+            Name of the thing to look for.
+
+        `valid_types`
+            A list of type or language restrictions, e.g., `['pokemon',
+            '@ja']`.  If this is provided, only results in one of the given
+            tables will be returned.
+
+        `exact_only`
+            If True, only exact matches are returned.  If set to False (the
+            default), and the provided `name` doesn't match anything exactly,
+            spelling correction will be attempted.
+
+        `lazy`
+            If True, the objects are `LazyObject`s, which are only loaded
+            from the database when they're used.
+        """
+
+        name = self.normalize_name(input)
+        exact = True
+
+        # Pop off any type prefix and merge with valid_types
+        name, merged_valid_types, table_names, languages = \
+            self._apply_valid_types(name, valid_types)
+
+        # Random lookup
+        if name == 'random':
+            return self.random_lookup(valid_types=merged_valid_types,
+                                      lazy=lazy)
+
+        # Do different things depending what the query looks like
+        try:
+            # Let Python try to convert to a number, so 0xff works
+            name_as_number = int(name, base=0)
+        except ValueError:
+            # Oh well
+            name_as_number = None
+
+        if '*' in name or '?' in name:
+            exact_only = True
+            query = self._wildcard_query(name, table_names, languages)
+        elif name_as_number is not None:
+            # Don't spell-check numbers!
+            exact_only = True
+            query = Query(ID, text_type(name_as_number), table_names,
+                          languages)
+        else:
+            # Not an integer
+            query = Query(EXACT, name, table_names, languages)
+
+        ### Actual searching
+        # Limits; result limits are constants, and intermediate results (before
+        # duplicate items are stripped out) are capped at the result limit
+        # times another constant.
+        # Fuzzy are capped at 10, beyond which something is probably very
+        # wrong.  Exact matches -- that is, wildcards and ids -- are far less
+        # constrained.
+        if exact_only:
+            max_results = self.MAX_EXACT_RESULTS
+        else:
+            max_results = self.MAX_FUZZY_RESULTS
+
+        results = self.backend.search(
+            query,
+            self._ranking(),
+            limit=int(max_results * self.INTERMEDIATE_FACTOR),
+        )
+
+        # Look for some fuzzy matches if necessary
+        if not exact_only and not results:
+            exact = False
+
+            fuzzy_weights = {}
+            for suggestion in self.backend.suggest(name, limit=max_results):
+                fuzzy_weights[suggestion] = relative_similarity(
+                    name, suggestion)
+
+            if not fuzzy_weights:
+                # Nothing at all; don't try querying
+                return []
+
+            fuzzy_query = Query(ANY, sorted(fuzzy_weights), table_names,
+                                languages)
+            results = self.backend.search(
+                fuzzy_query,
+                self._ranking(extra_weights=fuzzy_weights),
+                limit=max_results,
+            )
+
+        ### Convert results to db objects
+        objects = self._records_to_results(results, exact=exact)
+
+        # Truncate and return
+        return self._load_results(objects[:max_results], lazy=lazy)
+
+
+    def _get_random_ids(self, table_names):
+        """Returns a dict of table name => array of the row ids the index has
+        documents for, including at least `table_names`.
+
+        Only ids from the index are picked, so that each has a name to show.
+        Each table's array is loaded the first time it's needed, and again
+        after the index is rebuilt or updated.
+        """
+        if self._random_ids is None:
+            self._random_ids = {}
+        missing = [table_name for table_name in table_names
+                   if table_name not in self._random_ids]
+        if missing:
+            row_ids = self.backend.get_row_ids(missing)
+            for table_name in missing:
+                self._random_ids[table_name] = array.array(
+                    'l', row_ids.get(table_name, ()))
+
+        return self._random_ids
+
+    def random_lookup(self, valid_types=[], uniform=False, lazy=False):
+        """Returns a random lookup result from one of the provided
+        `valid_types`.
+
+        By default a random table is picked first, then a random row from it,
+        so small tables like Type are as likely to come up as large ones.
+        With `uniform`, every row of every allowed table is equally likely
+        instead.  `lazy` is as for `lookup()`.
+
+        Only rows that have names in the index are picked.  Returns an empty
+        list if none of the tables has any.
+        """
+
+        table_names = []
+        for valid_type in valid_types:
+            table_name = self._parse_table_name(valid_type)
+            # Skip anything not recognized.  Could be, say, a language code.
+            # XXX The vast majority of Pokémon forms are unnamed and unindexed,
+            #     which can produce blank results.  So skip them too for now.
+            if table_name and table_name != 'pokemon_forms':
+                table_names.append(table_name)
+
+        if not table_names:
+            # n.b.: It's possible we got a list of valid_types and none of them
+            # were valid, but this function is guaranteed to return
+            # *something*, so it politely selects from the entire index instead
+            table_names = list(self.indexed_tables)
+            table_names.remove('pokemon_forms')
+
+        random_ids = self._get_random_ids(table_names)
+        table_names = [name for name in table_names if random_ids[name]]
+        if not table_names:
+            return []
+        if uniform:
+            # Pick a position in all the tables laid end to end
+            offsets = []
+            total = 0
+            for table_name in table_names:
+                total += len(random_ids[table_name])
+                offsets.append(total)
+            position = random.randrange(total)
+            index = bisect.bisect_right(offsets, position)
+            table_name = table_names[index]
+            if index:
+                position -= offsets[index - 1]
+            id = random_ids[table_name][position]
+        else:
+            table_name = random.choice(table_names)
+            id = random.choice(random_ids[table_name])
+
+        # Fetch the best name for the row straight from the index
+        query = Query(ID, text_type(id), set([table_name]), None)
+        results = self.backend.search(query, self._ranking(), limit=1)
+
+        return self._load_results(self._records_to_results(results),
+                                  lazy=lazy)
+
+    def prefix_lookup(self, prefix, valid_types=[], limit=None, lazy=False):
+        """Returns terms starting with the given exact prefix.
+
+        Type prefixes are recognized, but no other name munging is done.
+
+        At most `limit` results are returned, if given.  See also
+        `autocomplete()`, which is much faster for short prefixes.  `lazy` is
+        as for `lookup()`.
+        """
+
+        # Pop off any type prefix and merge with valid_types
+        prefix, merged_valid_types, table_names, languages = \
+            self._apply_valid_types(prefix, valid_types)
+
+        query = Query(PREFIX, self.normalize_name(prefix), table_names,
+                      languages)
+
+        if limit is None:
+            results = self.backend.search(query, self._ranking(), limit=None)
+        else:
+            # Leave room for duplicates, which get removed below
+            results = self.backend.search(query, self._ranking(),
+                limit=int(limit * self.INTERMEDIATE_FACTOR))
+
+        return self._load_results(self._records_to_results(results)[:limit],
+                                  lazy=lazy)
+
+    def autocomplete(self, prefix, valid_types=[], limit=10, hydrate=False):
+        """Returns the best `limit` completions for the given prefix, ranked
+        like `lookup()` results.
+
+        The input is normalized, and type and language prefixes are
+        recognized, as in `lookup()`.
+
+        Returns a list of `Completion` tuples of `(name, table, id)`, or of
+        `LookupResult`s with database objects if `hydrate` is true.
+        """
+        prefix = self.normalize_name(prefix)
+        prefix, merged_valid_types, table_names, language_codes = \
+            self._apply_valid_types(prefix, valid_types)
+
+        autocomplete_index = self._get_autocomplete_index()
+
+        languages = None
+        if language_codes:
+            languages = set(
+                language_id for language_id, codes
+                in autocomplete_index.languages.items()
+                if language_codes & set(codes[1:]))
+
+        seen = set()
+        completions = []
+        records = []
+        for name, display_name, table, row_id, language_id in \
+                autocomplete_index.complete(prefix,
+                    self.session.default_language_id, self._get_roomaji_id(),
+                    tables=table_names, languages=languages):
+            if (table, row_id) in seen:
+                continue
+            seen.add((table, row_id))
+
+            if hydrate:
+                identifier, iso639, iso3166 = \
+                    autocomplete_index.languages[language_id]
+                records.append(dict(
+                    table=table, row_id=row_id, name=name,
+                    display_name=display_name, language=identifier,
+                    iso639=iso639, iso3166=iso3166,
+                ))
+            else:
+                completions.append(Completion(display_name, table, row_id))
+
+            if len(seen) >= limit:
+                break
+
+        if hydrate:
+            return self._load_results(self._records_to_results(records))
+        return completions
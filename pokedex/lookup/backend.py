@@ -0,0 +1,309 @@
+# encoding: utf8
+u"""The interface between `PokedexLookup` and the engines that actually store
+and search the indexed names.
+
+A backend stores *documents*: dicts with these keys, one per indexed name:
+
+- `name`: the normalized name, which is what gets searched
+- `display_name`: the name as it appears in the database
+- `table`, `table_order`, `row_id`: what the name belongs to
+- `language`, `language_id`, `iso639`, `iso3166`: what language it's in
+- `key`, `content_hash`: identify the (table, row_id, language) group the
+  document belongs to, for incremental updates
+
+Searches return documents in the same format, with `row_id` as text.
+"""
+
+import heapq
+import io
+import os
+import re
+
+from pokedex.compatibility import namedtuple
+
+# Puts different "types" of results in a relatively natural order: Pokémon
+# first, then moves, etc.  Stored in the index as `table_order`.
+table_order = dict(
+    pokemon_species=1,
+    pokemon_forms=1,
+    moves=2,
+    abilities=3,
+    items=4,
+    types=5,
+    locations=6,
+    natures=7,
+    conquest_warriors=8,
+    conquest_warrior_skills=9,
+    conquest_kingdoms=10,
+)
+
+# Kinds of queries
+EXACT = 'exact'         # text is a normalized name
+WILDCARD = 'wildcard'   # text is a glob pattern with * and ?
+ID = 'id'               # text is a row id
+PREFIX = 'prefix'       # text is the start of a normalized name
+ANY = 'any'             # text is a list of normalized names
+
+Query = namedtuple('Query', ['kind', 'text', 'tables', 'languages'])
+Query.__doc__ = u"""A search for documents.
+
+`kind` is one of the constants above, and `text` is what to look for.
+
+`tables` is a set of table names, and `languages` a set of language codes
+matching either `iso639` or `iso3166`.  Either may be None, meaning no
+restriction.
+"""
+
+class Ranking(object):
+    """How to order search results: by language weight, then by table order,
+    then by name.
+
+    `weights` maps language ids to weights, which default to 1.  Higher
+    weights come first.
+
+    `extra_weights` maps names to weights which are factored in.  Intended for
+    use with spelling corrections, which come along with their own weightings.
+    """
+    def __init__(self, weights, extra_weights={}):
+        self.weights = weights
+        self.extra_weights = extra_weights
+
+    def weight(self, language_id, name):
+        weight = self.weights.get(language_id, 1.0)
+        if self.extra_weights:
+            weight *= self.extra_weights.get(name, 1.0)
+        return weight
+
+    def sort_key(self, language_id, name, table_order):
+        # Higher weights should come FIRST, but sorts are ascending.  Negate
+        # the weight to fix this
+        return -self.weight(language_id, name), table_order, name
+
+
+class UninitializedIndex(object):
+    class UninitializedIndexError(Exception):
+        pass
+
+    def __nonzero__(self):
+        """Dummy object should identify itself as False."""
+        return False
+
+    def __bool__(self):
+        """Python 3000 version of the above.  Future-proofing rules!"""
+        return False
+
+    def __getattr__(self, *args, **kwargs):
+        raise self.UninitializedIndexError(
+            "The lookup index does not exist.  Please use `pokedex setup` "
+            "or lookup.rebuild_index() to create it."
+        )
+
+
+class LookupBackend(object):
+    """Base class for lookup backends.
+
+    `directory` is where the backend keeps its files, and `session` is the
+    session of the `PokedexLookup` using it.  After construction, `index` must
+    be either the backend's open index, or an `UninitializedIndex` if there
+    isn't one yet.
+    """
+    # True if wildcard searches without a literal prefix are already fast,
+    # so they needn't be narrowed down with the n-gram index first
+    indexes_wildcards = False
+
+    def __init__(self, directory, session=None):
+        self.directory = directory
+        self.session = session
+        self.index = UninitializedIndex()
+
+    def is_current(self):
+        """Returns True iff an index exists, and is in the format this version
+        of the backend writes.
+        """
+        raise NotImplementedError
+
+    def rebuild(self, groups, procs=1):
+        """Replaces the index with one containing the documents from `groups`,
+        an iterable of `(key, content_hash, documents)`.
+
+        `procs` is a hint for how many processes may be used.
+        """
+        raise NotImplementedError
+
+    def get_hashes(self, table_names):
+        """Returns a dict of key => content_hash for every document group of
+        the given tables.
+        """
+        hashes = {}
+        for document in self.iter_documents():
+            if document['table'] in table_names:
+                hashes[document['key']] = document['content_hash']
+        return hashes
+
+    def get_row_ids(self, table_names):
+        """Returns a dict of table name => sorted list of the row ids that
+        have documents, for each of the given tables that has any.
+        """
+        row_ids = {}
+        for document in self.iter_documents():
+            if document['table'] in table_names:
+                row_ids.setdefault(document['table'], set()).add(
+                    int(document['row_id']))
+        return dict((table_name, sorted(ids))
+                    for table_name, ids in row_ids.items())
+
+    def update(self, groups, deleted_keys):
+        """Removes every document whose key is in `deleted_keys`, then adds
+        the documents from `groups`.
+        """
+        raise NotImplementedError
+
+    def iter_documents(self):
+        """Yields every document in the index."""
+        raise NotImplementedError
+
+    def search(self, query, ranking, limit=None):
+        """Returns a list of the documents matching the `Query`, ordered by
+        the `Ranking`, and cut off at `limit`.
+        """
+        raise NotImplementedError
+
+    def suggest(self, text, limit):
+        """Returns up to `limit` indexed names within an edit distance of two
+        of `text`, closest (and then most common) first.
+        """
+        raise NotImplementedError
+
+    def load_blob(self, name):
+        """Returns the bytes stored with `save_blob()` under `name`, or None.
+
+        Used for auxiliary data that should live alongside the index.  By
+        default, blobs are files in `directory`.
+        """
+        try:
+            with io.open(os.path.join(self.directory, name), 'rb') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def save_blob(self, name, data):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with io.open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(data)
+
+
+def levenshtein(a, b, limit=None):
+    """Returns the Levenshtein edit distance between two strings.
+
+    If `limit` is given, any distance above it may be reported as
+    `limit + 1`, which is much faster for very different strings.
+    """
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for x, char_a in enumerate(a):
+        current = [x + 1]
+        for y, char_b in enumerate(b):
+            current.append(min(
+                previous[y + 1] + 1,
+                current[y] + 1,
+                previous[y] + (char_a != char_b),
+            ))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return previous[-1]
+
+def damerau_levenshtein(a, b, limit=None):
+    """Returns the Levenshtein edit distance between two strings, counting
+    transpositions as a single edit.
+
+    `limit` works as for `levenshtein()`.
+    """
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    twoago = None
+    previous = list(range(len(b) + 1))
+    for x, char_a in enumerate(a):
+        current = [x + 1]
+        for y, char_b in enumerate(b):
+            cost = min(
+                previous[y + 1] + 1,
+                current[y] + 1,
+                previous[y] + (char_a != char_b),
+            )
+            if (x and y and char_a == b[y - 1] and a[x - 1] == char_b
+                    and char_a != char_b):
+                cost = min(cost, twoago[y - 1] + 1)
+            current.append(cost)
+        # A transposition can reach back two rows, so both have to be over
+        if limit is not None and min(current) > limit \
+                and min(previous) > limit:
+            return limit + 1
+        twoago, previous = previous, current
+
+    return previous[-1]
+
+def wildcard_regex(pattern):
+    """Compiles a whoosh-style wildcard pattern, where only * and ? are
+    special, into a regex.
+    """
+    parts = []
+    for char in pattern:
+        if char == u'*':
+            parts.append(u'.*')
+        elif char == u'?':
+            parts.append(u'.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(u''.join(parts) + u'\\Z', re.DOTALL | re.UNICODE)
+
+def bigrams(name):
+    """Returns the set of character bigrams in `name`, including ones marking
+    the start and end.
+    """
+    padded = u'\x02' + name + u'\x03'
+    return set(padded[i:i + 2] for i in range(len(padded) - 1))
+
+def bigram_threshold(text, maxdist):
+    """Returns how many of the `bigrams()` of `text` a name within `maxdist`
+    edits of it must share, or 0 if it needn't share any.
+
+    Each edit can destroy at most three of them: two, or three for a
+    transposition.
+    """
+    return max(len(bigrams(text)) - 3 * maxdist, 0)
+
+def best_suggestions(text, candidates, frequency, limit, maxdist=2):
+    """Picks spelling suggestions for `text` out of `candidates`, an iterable
+    of names.  `frequency` is a function returning how many documents have a
+    name.
+
+    Returns up to `limit` names at most `maxdist` edits away, closest and then
+    most frequent first, in the same order whoosh's corrector would.
+    """
+    suggestions = []
+    for name in candidates:
+        distance = damerau_levenshtein(text, name, limit=maxdist)
+        if 0 < distance <= maxdist:
+            suggestions.append((-distance, frequency(name), name))
+
+    # Same choice as whoosh's corrector: ties at the cutoff keep the names
+    # that sort last, but the survivors come out in ascending order
+    suggestions = heapq.nlargest(limit, suggestions)
+    suggestions.sort(key=lambda suggestion: (
+        -suggestion[0], -suggestion[1], suggestion[2]))
+    return [name for distance, frequency, name in suggestions]
+
+def relative_similarity(a, b):
+    """Returns how similar two strings are, in the range [0-1] where 1 means
+    total equality.
+    """
+    distance = damerau_levenshtein(a, b)
+    longer = float(max(len(a), len(b)))
+    shorter = float(min(len(a), len(b)))
+    return ((longer - distance) / longer) * (shorter / longer)
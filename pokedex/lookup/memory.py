@@ -0,0 +1,478 @@
+# encoding: utf8
+u"""Lookup backend that keeps the names in a single compact file, which is
+memory-mapped rather than parsed when opened.
+
+The file holds every distinct normalized name in sorted order, so exact,
+prefix, and wildcard matches are binary searches; a hash table of the names
+for exact hits; and the documents themselves as parallel arrays, sorted by
+name, with the table and language interned as small integers.  The document
+numbers are also listed in order of row id, for id lookups.  Spelling
+suggestions use an inverted index of the names' character bigrams.
+"""
+
+import array
+import collections
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+
+from six import text_type
+
+from pokedex.lookup.backend import (
+    LookupBackend, best_suggestions, bigram_threshold, bigrams, table_order,
+    wildcard_regex,
+    EXACT, WILDCARD, ID, PREFIX, ANY)
+
+MAGIC = b'PDXLOOK1'
+HEADER_SIZE = struct.Struct('<I')
+
+# Sections of the file, and the array typecode of each
+SECTIONS = (
+    ('name_offsets', 'I'),      # where each distinct name starts in name_blob
+    ('name_blob', 'B'),         # UTF-8 names, sorted
+    ('name_docs', 'I'),         # first document of each distinct name
+    ('name_slots', 'i'),        # open-addressed hash table of name numbers
+    ('gram_offsets', 'I'),      # where each bigram starts in gram_blob
+    ('gram_blob', 'B'),         # UTF-8 bigrams, sorted
+    ('gram_postings_offsets', 'I'),  # where each bigram's names start
+    ('gram_postings', 'I'),     # name numbers containing each bigram
+    ('doc_names', 'I'),         # name number of each document
+    ('doc_tables', 'B'),        # table number of each document
+    ('doc_row_ids', 'i'),
+    ('doc_languages', 'i'),     # language id of each document
+    ('display_offsets', 'I'),   # where each document starts in display_blob
+    ('display_blob', 'B'),      # UTF-8 display names
+    ('doc_hashes', 'B'),        # content hash of each document, as 40 ASCII hex digits
+    ('id_docs', 'I'),           # document numbers, sorted by row id
+)
+HASH_SIZE = 40
+
+
+def _name_hash(encoded_name):
+    return zlib.crc32(encoded_name) & 0xffffffff
+
+def _encode_strings(strings):
+    """Returns `(offsets, blob)` arrays for a list of strings."""
+    offsets = array.array('I', [0])
+    blob = bytearray()
+    for string in strings:
+        blob.extend(string.encode('utf8'))
+        offsets.append(len(blob))
+    return offsets, array.array('B', bytes(blob))
+
+
+class MemoryIndex(object):
+    """A read-only view of an index file.
+
+    Everything is read directly from the mapped file, so opening one only
+    costs parsing the small JSON header.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buf = memoryview(self._mmap)
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise IOError("%s is not a pokedex lookup index" % path)
+        header_start = len(MAGIC) + HEADER_SIZE.size
+        header_size, = HEADER_SIZE.unpack(bytes(buf[len(MAGIC):header_start]))
+        header = json.loads(
+            bytes(buf[header_start:header_start + header_size]).decode('utf8'))
+
+        self.header = header
+        self.tables = header['tables']
+        self.languages = dict(
+            (int(language_id), tuple(codes))
+            for language_id, codes in header['languages'].items())
+
+        for name, typecode in SECTIONS:
+            offset, count = header['sections'][name]
+            itemsize = array.array(typecode).itemsize
+            data = buf[offset:offset + count * itemsize]
+            try:
+                data = data.cast(typecode)
+            except AttributeError:
+                # Python 2's memoryview can't be cast; copy instead
+                data = array.array(typecode, data.tobytes())
+            setattr(self, name, data)
+
+        self.name_count = len(self.name_docs) - 1
+        self.doc_count = len(self.doc_names)
+        self.gram_count = len(self.gram_postings_offsets) - 1
+
+    @classmethod
+    def is_compatible(cls, header):
+        """Returns True iff a file with this header was written by a machine
+        with the same array layout as this one.
+        """
+        return header.get('byteorder') == sys.byteorder and all(
+            header['itemsizes'].get(typecode) ==
+                array.array(typecode).itemsize
+            for name, typecode in SECTIONS)
+
+    @classmethod
+    def write(cls, path, documents):
+        """Writes the given documents to an index file at `path`."""
+        documents = sorted(documents, key=lambda document: (
+            document['name'], document['table_order'], document['table'],
+            int(document['row_id']), document['language_id']))
+
+        names = []
+        tables = sorted(set(document['table'] for document in documents))
+        table_numbers = dict((table, n) for n, table in enumerate(tables))
+        languages = {}
+
+        arrays = dict(
+            name_docs=array.array('I'),
+            doc_names=array.array('I'),
+            doc_tables=array.array('B'),
+            doc_row_ids=array.array('i'),
+            doc_languages=array.array('i'),
+        )
+        hashes = bytearray()
+        for n, document in enumerate(documents):
+            if not names or names[-1] != document['name']:
+                names.append(document['name'])
+                arrays['name_docs'].append(n)
+            arrays['doc_names'].append(len(names) - 1)
+            arrays['doc_tables'].append(table_numbers[document['table']])
+            arrays['doc_row_ids'].append(int(document['row_id']))
+            arrays['doc_languages'].append(document['language_id'])
+            hashes.extend(document['content_hash'].encode('ascii'))
+            languages[document['language_id']] = (
+                document['language'], document['iso639'],
+                document['iso3166'])
+        arrays['name_docs'].append(len(documents))
+        arrays['doc_hashes'] = array.array('B', bytes(hashes))
+        row_ids = arrays['doc_row_ids']
+        arrays['id_docs'] = array.array('I', sorted(
+            range(len(documents)), key=row_ids.__getitem__))
+
+        arrays['name_offsets'], arrays['name_blob'] = _encode_strings(names)
+        arrays['display_offsets'], arrays['display_blob'] = _encode_strings(
+            [document['display_name'] for document in documents])
+
+        # Hash table of names, at most half full
+        slot_count = 1
+        while slot_count < len(names) * 2:
+            slot_count *= 2
+        slots = array.array('i', [-1]) * slot_count
+        for n, name in enumerate(names):
+            slot = _name_hash(name.encode('utf8')) & (slot_count - 1)
+            while slots[slot] != -1:
+                slot = (slot + 1) & (slot_count - 1)
+            slots[slot] = n
+        arrays['name_slots'] = slots
+
+        # Bigram postings
+        postings = collections.defaultdict(list)
+        for n, name in enumerate(names):
+            for gram in bigrams(name):
+                postings[gram].append(n)
+        grams = sorted(postings)
+        arrays['gram_offsets'], arrays['gram_blob'] = _encode_strings(grams)
+        arrays['gram_postings_offsets'] = array.array('I', [0])
+        arrays['gram_postings'] = array.array('I')
+        for gram in grams:
+            arrays['gram_postings'].extend(postings[gram])
+            arrays['gram_postings_offsets'].append(
+                len(arrays['gram_postings']))
+
+        # Lay out the sections, each aligned to 8 bytes, after the header.
+        # The header contains the offsets, so make room for the biggest it
+        # could be and pad
+        header = dict(
+            byteorder=sys.byteorder,
+            itemsizes=dict((typecode, array.array(typecode).itemsize)
+                           for name, typecode in SECTIONS),
+            tables=tables,
+            languages=dict((text_type(language_id), codes)
+                           for language_id, codes in languages.items()),
+            sections={},
+        )
+        for name, typecode in SECTIONS:
+            header['sections'][name] = [2 ** 32 - 1, len(arrays[name])]
+        header_size = len(json.dumps(header).encode('utf8'))
+        offset = len(MAGIC) + HEADER_SIZE.size + header_size
+        for name, typecode in SECTIONS:
+            offset += -offset % 8
+            header['sections'][name] = [offset, len(arrays[name])]
+            offset += len(arrays[name]) * arrays[name].itemsize
+        header_bytes = json.dumps(header).encode('utf8')
+        header_bytes += b' ' * (header_size - len(header_bytes))
+
+        # Write to a temporary file and move it into place, so anything that
+        # has the old file mapped keeps working
+        temp_path = path + '.tmp'
+        with io.open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER_SIZE.pack(header_size))
+            f.write(header_bytes)
+            for name, typecode in SECTIONS:
+                f.write(b'\0' * (header['sections'][name][0] - f.tell()))
+                f.write(arrays[name].tobytes()
+                        if hasattr(arrays[name], 'tobytes')
+                        else arrays[name].tostring())
+        if os.path.exists(path) and not hasattr(os, 'replace'):
+            os.remove(path)
+        getattr(os, 'replace', os.rename)(temp_path, path)
+
+    def _decode(self, offsets, blob, n):
+        return bytes(blob[offsets[n]:offsets[n + 1]]).decode('utf8')
+
+    def name(self, n):
+        """Returns the `n`th distinct name."""
+        return self._decode(self.name_offsets, self.name_blob, n)
+
+    def display_name(self, doc):
+        return self._decode(self.display_offsets, self.display_blob, doc)
+
+    def find_name(self, name):
+        """Returns the number of the given name, or None."""
+        encoded_name = name.encode('utf8')
+        mask = len(self.name_slots) - 1
+        slot = _name_hash(encoded_name) & mask
+        while True:
+            n = self.name_slots[slot]
+            if n == -1:
+                return None
+            offsets = self.name_offsets
+            if bytes(self.name_blob[offsets[n]:offsets[n + 1]]) == \
+                    encoded_name:
+                return n
+            slot = (slot + 1) & mask
+
+    def bisect_names(self, name):
+        """Returns the number of the first name not less than `name`."""
+        lo, hi = 0, self.name_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def prefix_range(self, prefix):
+        """Returns the range of name numbers that start with `prefix`."""
+        return (self.bisect_names(prefix),
+                self.bisect_names(prefix + u'\U0010ffff'))
+
+    def docs(self, n):
+        """Returns the range of documents with the `n`th name."""
+        return range(self.name_docs[n], self.name_docs[n + 1])
+
+    def docs_with_row_id(self, row_id):
+        """Returns the numbers of the documents with the given row id."""
+        def bisect(row_id):
+            # The first position in id_docs whose row id isn't less
+            lo, hi = 0, self.doc_count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.doc_row_ids[self.id_docs[mid]] < row_id:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+        return self.id_docs[bisect(row_id):bisect(row_id + 1)]
+
+    def postings(self, gram):
+        """Returns the numbers of the names containing the given bigram."""
+        lo, hi = 0, self.gram_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._decode(self.gram_offsets, self.gram_blob, mid) < gram:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.gram_count and \
+                self._decode(self.gram_offsets, self.gram_blob, lo) == gram:
+            offsets = self.gram_postings_offsets
+            return self.gram_postings[offsets[lo]:offsets[lo + 1]]
+        return ()
+
+    def document(self, doc):
+        """Returns the `doc`th document as a dict."""
+        table = self.tables[self.doc_tables[doc]]
+        row_id = text_type(self.doc_row_ids[doc])
+        language_id = self.doc_languages[doc]
+        language, iso639, iso3166 = self.languages[language_id]
+        return dict(
+            name=self.name(self.doc_names[doc]),
+            display_name=self.display_name(doc),
+            table=table,
+            table_order=table_order[table],
+            row_id=row_id,
+            language=language,
+            language_id=language_id,
+            iso639=iso639,
+            iso3166=iso3166,
+            key=u'%s/%s/%s' % (table, row_id, language),
+            content_hash=bytes(self.doc_hashes[
+                doc * HASH_SIZE:(doc + 1) * HASH_SIZE]).decode('ascii'),
+        )
+
+
+class MemoryBackend(LookupBackend):
+    """Keeps the names in a memory-mapped file called `MEMORY_MAIN.idx`."""
+    filename = 'MEMORY_MAIN.idx'
+
+    # Largest edit distance for spelling suggestions
+    MAX_DISTANCE = 2
+
+    def __init__(self, directory, session=None):
+        super(MemoryBackend, self).__init__(directory, session=session)
+        self.path = os.path.join(directory, self.filename)
+        if os.path.exists(self.path):
+            self.index = MemoryIndex(self.path)
+
+    def is_current(self):
+        return bool(self.index) and \
+            MemoryIndex.is_compatible(self.index.header)
+
+    def _write(self, documents):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        MemoryIndex.write(self.path, documents)
+        self.index = MemoryIndex(self.path)
+
+    def rebuild(self, groups, procs=1):
+        self._write(
+            document
+            for key, content_hash, documents in groups
+            for document in documents)
+
+    def update(self, groups, deleted_keys):
+        deleted_keys = set(deleted_keys)
+        documents = [document for document in self.iter_documents()
+                     if document['key'] not in deleted_keys]
+        for key, content_hash, new_documents in groups:
+            documents.extend(new_documents)
+        self._write(documents)
+
+    def iter_documents(self):
+        for doc in range(self.index.doc_count):
+            yield self.index.document(doc)
+
+    def get_row_ids(self, table_names):
+        index = self.index
+        row_ids = {}
+        for doc in index.id_docs:
+            table_name = index.tables[index.doc_tables[doc]]
+            if table_name in table_names:
+                ids = row_ids.setdefault(table_name, [])
+                row_id = index.doc_row_ids[doc]
+                # In order of row id, so any repeat is the last one
+                if not ids or ids[-1] != row_id:
+                    ids.append(row_id)
+        return row_ids
+
+    def _match_names(self, query):
+        """Yields the numbers of the names matching `query`."""
+        index = self.index
+        if query.kind == EXACT:
+            n = index.find_name(query.text)
+            if n is not None:
+                yield n
+        elif query.kind == ANY:
+            for name in query.text:
+                n = index.find_name(name)
+                if n is not None:
+                    yield n
+        elif query.kind == PREFIX:
+            for n in range(*index.prefix_range(query.text)):
+                yield n
+        elif query.kind == WILDCARD:
+            regex = wildcard_regex(query.text)
+            literal_prefix = re.split(u'[*?]', query.text, 1)[0]
+            for n in range(*index.prefix_range(literal_prefix)):
+                if regex.match(index.name(n)):
+                    yield n
+        else:
+            raise ValueError("Unknown query kind %r" % (query.kind,))
+
+    def _match(self, query):
+        """Yields the numbers of the documents matching `query`, ignoring
+        its table and language restrictions.
+        """
+        if query.kind == ID:
+            try:
+                row_id = int(query.text)
+            except ValueError:
+                return
+            for doc in self.index.docs_with_row_id(row_id):
+                yield doc
+        else:
+            for n in self._match_names(query):
+                for doc in self.index.docs(n):
+                    yield doc
+
+    def search(self, query, ranking, limit=None):
+        index = self.index
+
+        table_numbers = None
+        if query.tables:
+            table_numbers = set(
+                n for n, table in enumerate(index.tables)
+                if table in query.tables)
+        language_ids = None
+        if query.languages:
+            language_ids = set(
+                language_id
+                for language_id, codes in index.languages.items()
+                if codes[1] in query.languages
+                or codes[2] in query.languages)
+
+        keyed_docs = []
+        names = {}
+        for doc in self._match(query):
+            table_number = index.doc_tables[doc]
+            language_id = index.doc_languages[doc]
+            if table_numbers is not None and \
+                    table_number not in table_numbers:
+                continue
+            if language_ids is not None and language_id not in language_ids:
+                continue
+
+            n = index.doc_names[doc]
+            if n not in names:
+                names[n] = index.name(n)
+            table = index.tables[table_number]
+            keyed_docs.append((
+                ranking.sort_key(language_id, names[n], table_order[table]),
+                doc))
+
+        keyed_docs.sort()
+        return [index.document(doc) for key, doc in keyed_docs[:limit]]
+
+    def suggest(self, text, limit):
+        index = self.index
+        maxdist = self.MAX_DISTANCE
+
+        threshold = bigram_threshold(text, maxdist)
+        if threshold:
+            counts = collections.Counter()
+            for gram in bigrams(text):
+                counts.update(index.postings(gram))
+            candidates = [n for n, count in counts.items()
+                          if count >= threshold]
+        else:
+            # Too short to say anything; check everything
+            candidates = range(index.name_count)
+
+        numbers = {}
+        for n in candidates:
+            numbers[index.name(n)] = n
+
+        def frequency(name):
+            n = numbers[name]
+            return index.name_docs[n + 1] - index.name_docs[n]
+
+        return best_suggestions(text, numbers, frequency, limit,
+                                maxdist=maxdist)
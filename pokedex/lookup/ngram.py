@@ -0,0 +1,95 @@
+# encoding: utf8
+u"""A character n-gram index of the indexed names, for wildcard queries.
+
+A pattern like `*chu` has no literal prefix, so a backend has to try it
+against every name it has.  But any name it matches must contain `chu` right
+before the end, so intersecting the lists of names containing each n-gram
+of the pattern's literal parts narrows things down to a handful of
+candidates, which are then checked against the whole pattern.
+"""
+
+import json
+import re
+
+from pokedex.lookup.backend import wildcard_regex
+
+# Length of the n-grams
+N = 3
+
+# Mark the start and end of names, so anchored parts of patterns count too
+START = u'\x02'
+END = u'\x03'
+
+
+def ngrams(text, n=N):
+    """Returns the set of n-grams in `text`."""
+    return set(text[i:i + n] for i in range(len(text) - n + 1))
+
+def pattern_ngrams(pattern, n=N):
+    """Returns the set of n-grams that every name matching the wildcard
+    `pattern` must contain.
+    """
+    fragments = re.split(u'[*?]', pattern)
+    fragments[0] = START + fragments[0]
+    fragments[-1] = fragments[-1] + END
+
+    grams = set()
+    for fragment in fragments:
+        grams.update(ngrams(fragment, n))
+    return grams
+
+
+class NgramIndex(object):
+    """Maps each n-gram to the names containing it.
+
+    Built by `PokedexLookup.rebuild_index` and `update_index`, and saved as
+    JSON with the backend's `save_blob()`.
+    """
+    filename = 'NGRAM_MAIN.json'
+
+    def __init__(self, names, postings):
+        # Every distinct name, sorted
+        self.names = names
+        # n-gram => ascending list of positions in `names`
+        self.postings = postings
+
+    @classmethod
+    def from_names(cls, names):
+        names = sorted(set(names))
+        postings = {}
+        for position, name in enumerate(names):
+            for gram in ngrams(START + name + END):
+                postings.setdefault(gram, []).append(position)
+        return cls(names, postings)
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data.decode('utf8'))
+        return cls(data['names'], data['postings'])
+
+    def to_json(self):
+        data = dict(names=self.names, postings=self.postings)
+        return json.dumps(data, ensure_ascii=False).encode('utf8')
+
+    def match(self, pattern):
+        """Returns the sorted list of names matching the wildcard `pattern`.
+
+        Returns None if the pattern doesn't contain enough literal text to
+        narrow down the search, in which case the backend has to do it.
+        """
+        grams = pattern_ngrams(pattern)
+        if not grams:
+            return None
+
+        # Intersect, starting with the rarest
+        postings = sorted(
+            (self.postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for positions in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(positions)
+
+        regex = wildcard_regex(pattern)
+        return [self.names[position] for position in sorted(candidates)
+                if regex.match(self.names[position])]
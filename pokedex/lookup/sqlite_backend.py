@@ -0,0 +1,369 @@
+# encoding: utf8
+u"""Lookup backend that keeps the index inside the pokédex's own SQLite
+database, so the two can't drift apart.
+
+The documents live in an ordinary table, whose index on `name` handles exact
+and prefix matches.  Wildcards that start with a literal use the same index;
+ones that don't go through an FTS5 table with the trigram tokenizer, if this
+SQLite has it.  Spelling suggestions are found through a table of the names'
+bigrams.
+"""
+
+import sqlite3
+
+from six import text_type
+from sqlalchemy import (
+    Column, Index, Integer, LargeBinary, MetaData, Table, Unicode, inspect)
+from sqlalchemy.sql import (
+    and_, case, column, func, literal, or_, select, table as table_clause)
+
+from pokedex.lookup.backend import (
+    LookupBackend, best_suggestions, bigram_threshold, bigrams,
+    damerau_levenshtein,
+    EXACT, WILDCARD, ID, PREFIX, ANY)
+
+metadata = MetaData()
+
+documents_table = Table('pokedex_lookup_documents', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', Unicode, nullable=False),
+    Column('display_name', Unicode, nullable=False),
+    Column('table_name', Unicode, nullable=False),
+    Column('table_order', Integer, nullable=False),
+    Column('row_id', Integer, nullable=False),
+    Column('language', Unicode, nullable=False),
+    Column('language_id', Integer, nullable=False),
+    Column('iso639', Unicode),
+    Column('iso3166', Unicode),
+    Column('key', Unicode, nullable=False),
+    Column('content_hash', Unicode, nullable=False),
+)
+Index('ix_pokedex_lookup_documents_name', documents_table.c.name)
+Index('ix_pokedex_lookup_documents_row_id', documents_table.c.row_id)
+Index('ix_pokedex_lookup_documents_key', documents_table.c.key)
+
+bigrams_table = Table('pokedex_lookup_bigrams', metadata,
+    Column('gram', Unicode, primary_key=True),
+    Column('name', Unicode, primary_key=True),
+    sqlite_with_rowid=False,
+)
+
+blobs_table = Table('pokedex_lookup_blobs', metadata,
+    Column('name', Unicode, primary_key=True),
+    Column('data', LargeBinary, nullable=False),
+)
+
+# FTS5 table of the names, with the documents table as its content.  Its
+# column named after the table takes commands, such as 'delete'.
+trigrams_table = table_clause('pokedex_lookup_trigrams', column('rowid'),
+                              column('name'), column('pokedex_lookup_trigrams'))
+TRIGRAMS_DDL = (
+    u"CREATE VIRTUAL TABLE pokedex_lookup_trigrams USING fts5("
+    u"name, content='pokedex_lookup_documents', content_rowid='id', "
+    u"tokenize='trigram')"
+)
+
+# The trigram tokenizer was added in SQLite 3.34
+HAVE_TRIGRAMS = sqlite3.sqlite_version_info >= (3, 34)
+
+# Rows per INSERT, and values per IN, to stay under SQLite's variable limit
+CHUNK_SIZE = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+def _glob_pattern(pattern):
+    """Converts a whoosh-style wildcard pattern, where only * and ? are
+    special, into one for SQLite's GLOB.
+    """
+    return pattern.replace(u'[', u'[[]')
+
+
+class SQLiteBackend(LookupBackend):
+    """Keeps the index in tables named `pokedex_lookup_*` in the session's
+    SQLite database.  `directory` isn't used.
+
+    Changes to the index are made in the session's transaction, and are only
+    kept once whoever owns the session commits it.
+    """
+    def __init__(self, directory, session=None):
+        super(SQLiteBackend, self).__init__(directory, session=session)
+        if session is None:
+            raise ValueError("The sqlite lookup backend needs a session")
+
+        self.bind = session.get_bind()
+        if self.bind.dialect.name != 'sqlite':
+            raise ValueError(
+                "The sqlite lookup backend only works with SQLite databases")
+
+        # Everything goes through the session's connection, since SQLite
+        # won't let another one in while it's writing
+        self._has_trigrams = False
+        if documents_table.exists(session.connection()):
+            self._open()
+
+    def _open(self):
+        self.index = self.bind
+        self._has_trigrams = HAVE_TRIGRAMS and trigrams_table.name in \
+            inspect(self.session.connection()).get_table_names()
+
+    @property
+    def indexes_wildcards(self):
+        return self._has_trigrams
+
+    def is_current(self):
+        if not self.index:
+            return False
+        connection = self.session.connection()
+        columns = set(column['name'] for column in
+                      inspect(connection).get_columns(documents_table.name))
+        return columns == set(documents_table.c.keys()) and all(
+            table.exists(connection) for table in metadata.sorted_tables)
+
+    def _insert_documents(self, groups):
+        """Inserts the documents from `groups`, and returns the set of their
+        names.
+        """
+        names = set()
+        rows = []
+        for key, content_hash, documents in groups:
+            for document in documents:
+                names.add(document['name'])
+                rows.append(dict(
+                    name=document['name'],
+                    display_name=document['display_name'],
+                    table_name=document['table'],
+                    table_order=document['table_order'],
+                    row_id=int(document['row_id']),
+                    language=document['language'],
+                    language_id=document['language_id'],
+                    iso639=document['iso639'],
+                    iso3166=document['iso3166'],
+                    key=document['key'],
+                    content_hash=document['content_hash'],
+                ))
+        for chunk in _chunks(rows):
+            self.session.execute(documents_table.insert(), chunk)
+        return names
+
+    def _index_names(self, names):
+        """Brings the bigrams up to date after the documents with the given
+        names have changed.
+        """
+        names = list(names)
+        for chunk in _chunks(names):
+            self.session.execute(bigrams_table.delete().where(
+                bigrams_table.c.name.in_(chunk)))
+
+        existing = set()
+        for chunk in _chunks(names):
+            existing.update(name for name, in self.session.execute(
+                select([documents_table.c.name]).distinct()
+                .where(documents_table.c.name.in_(chunk))))
+
+        rows = [dict(gram=gram, name=name)
+                for name in existing for gram in bigrams(name)]
+        for chunk in _chunks(rows):
+            self.session.execute(bigrams_table.insert(), chunk)
+
+    def _index_trigrams(self, condition, command=None):
+        """Adds the documents matching `condition` to the trigram table, or,
+        with the 'delete' command, removes them.  As the table has no copy of
+        the names, removing them needs the documents still there.
+        """
+        columns = [documents_table.c.id, documents_table.c.name]
+        names = ['rowid', 'name']
+        if command is not None:
+            columns.insert(0, literal(command))
+            names.insert(0, 'pokedex_lookup_trigrams')
+        self.session.execute(trigrams_table.insert().from_select(
+            names, select(columns).where(condition)))
+
+    def rebuild(self, groups, procs=1):
+        connection = self.session.connection()
+        self.session.execute(u"DROP TABLE IF EXISTS pokedex_lookup_trigrams")
+        metadata.drop_all(bind=connection)
+        metadata.create_all(bind=connection)
+        if HAVE_TRIGRAMS:
+            self.session.execute(TRIGRAMS_DDL)
+        self._has_trigrams = HAVE_TRIGRAMS
+
+        names = self._insert_documents(groups)
+        self._index_names(names)
+        if self._has_trigrams:
+            self.session.execute(
+                u"INSERT INTO pokedex_lookup_trigrams(pokedex_lookup_trigrams) "
+                u"VALUES ('rebuild')")
+        self.index = self.bind
+
+    def get_hashes(self, table_names):
+        return dict(self.session.execute(
+            select([documents_table.c.key, documents_table.c.content_hash])
+            .distinct()
+            .where(documents_table.c.table_name.in_(table_names))
+        ).fetchall())
+
+    def get_row_ids(self, table_names):
+        row_ids = {}
+        for table_name, row_id in self.session.execute(
+                select([documents_table.c.table_name, documents_table.c.row_id])
+                .distinct()
+                .where(documents_table.c.table_name.in_(table_names))
+                .order_by(documents_table.c.row_id)):
+            row_ids.setdefault(table_name, []).append(row_id)
+        return row_ids
+
+    def update(self, groups, deleted_keys):
+        names = set()
+        for chunk in _chunks(deleted_keys):
+            condition = documents_table.c.key.in_(chunk)
+            names.update(name for name, in self.session.execute(
+                select([documents_table.c.name]).where(condition)))
+            if self._has_trigrams:
+                self._index_trigrams(condition, u'delete')
+            self.session.execute(documents_table.delete().where(condition))
+
+        # New documents get ids past all the others
+        last_id = self.session.execute(
+            select([func.max(documents_table.c.id)])).scalar() or 0
+        names.update(self._insert_documents(groups))
+        self._index_names(names)
+        if self._has_trigrams:
+            self._index_trigrams(documents_table.c.id > last_id)
+
+    def _documents(self, rows):
+        """Converts documents table rows into documents."""
+        return [dict(
+            name=row.name,
+            display_name=row.display_name,
+            table=row.table_name,
+            table_order=row.table_order,
+            row_id=text_type(row.row_id),
+            language=row.language,
+            language_id=row.language_id,
+            iso639=row.iso639,
+            iso3166=row.iso3166,
+            key=row.key,
+            content_hash=row.content_hash,
+        ) for row in rows]
+
+    def iter_documents(self):
+        return iter(self._documents(self.session.execute(
+            documents_table.select().order_by(documents_table.c.id))))
+
+    def _condition(self, query):
+        """Returns a where clause on the documents table for `query`."""
+        name = documents_table.c.name
+        if query.kind == EXACT:
+            condition = name == query.text
+        elif query.kind == ANY:
+            if not query.text:
+                return None
+            condition = name.in_(list(query.text))
+        elif query.kind == PREFIX:
+            condition = and_(name >= query.text,
+                             name < query.text + u'\U0010ffff')
+        elif query.kind == WILDCARD:
+            pattern = _glob_pattern(query.text)
+            if query.text[:1] not in (u'*', u'?') or \
+                    not self._has_trigrams:
+                # GLOB can use the index on name for the literal prefix
+                condition = name.op('GLOB')(pattern)
+            else:
+                condition = documents_table.c.id.in_(
+                    select([trigrams_table.c.rowid])
+                    .where(trigrams_table.c.name.op('GLOB')(pattern)))
+        elif query.kind == ID:
+            try:
+                condition = documents_table.c.row_id == int(query.text)
+            except ValueError:
+                return None
+        else:
+            raise ValueError("Unknown query kind %r" % (query.kind,))
+
+        if query.tables:
+            condition &= documents_table.c.table_name.in_(list(query.tables))
+        if query.languages:
+            languages = list(query.languages)
+            condition &= or_(documents_table.c.iso639.in_(languages),
+                             documents_table.c.iso3166.in_(languages))
+        return condition
+
+    def search(self, query, ranking, limit=None):
+        condition = self._condition(query)
+        if condition is None:
+            return []
+
+        weight = case(
+            [(documents_table.c.language_id == language_id, float(weight))
+             for language_id, weight in ranking.weights.items()],
+            else_=1.0)
+        if ranking.extra_weights:
+            weight = weight * case(
+                [(documents_table.c.name == name, float(extra_weight))
+                 for name, extra_weight in ranking.extra_weights.items()],
+                else_=1.0)
+
+        rows = self.session.execute(
+            documents_table.select()
+            .where(condition)
+            .order_by(
+                weight.desc(),
+                documents_table.c.table_order,
+                documents_table.c.name,
+                documents_table.c.table_name,
+                documents_table.c.row_id,
+                documents_table.c.language_id,
+            )
+            .limit(limit)
+        )
+        return self._documents(rows)
+
+    def suggest(self, text, limit):
+        maxdist = 2
+        threshold = bigram_threshold(text, maxdist)
+        if threshold:
+            count = func.count(bigrams_table.c.gram)
+            candidates = [name for name, in self.session.execute(
+                select([bigrams_table.c.name])
+                .where(bigrams_table.c.gram.in_(list(bigrams(text))))
+                .group_by(bigrams_table.c.name)
+                .having(count >= threshold))]
+        else:
+            # Too short to say anything; check everything of about the
+            # right length
+            length = func.length(documents_table.c.name)
+            candidates = [name for name, in self.session.execute(
+                select([documents_table.c.name]).distinct()
+                .where(length.between(len(text) - maxdist,
+                                      len(text) + maxdist)))]
+
+        # Only count the documents of the names that are close enough
+        close = [name for name in candidates
+                 if damerau_levenshtein(text, name, limit=maxdist) <= maxdist]
+        frequencies = {}
+        for chunk in _chunks(close):
+            frequencies.update(self.session.execute(
+                select([documents_table.c.name,
+                        func.count(documents_table.c.id)])
+                .where(documents_table.c.name.in_(chunk))
+                .group_by(documents_table.c.name)
+            ).fetchall())
+
+        return best_suggestions(text, close, frequencies.get, limit,
+                                maxdist=maxdist)
+
+    def load_blob(self, name):
+        if not blobs_table.exists(self.session.connection()):
+            return None
+        return self.session.execute(
+            select([blobs_table.c.data]).where(blobs_table.c.name == name)
+        ).scalar()
+
+    def save_blob(self, name, data):
+        self.session.execute(
+            blobs_table.delete().where(blobs_table.c.name == name))
+        self.session.execute(blobs_table.insert(), dict(name=name, data=data))
@@ -0,0 +1,233 @@
+# encoding: utf8
+"""Lookup backend storing the names in a whoosh index."""
+from __future__ import absolute_import
+
+import os
+import re
+
+import whoosh
+import whoosh.fields
+import whoosh.index
+import whoosh.query
+import whoosh.sorting
+
+from pokedex.lookup.backend import (
+    LookupBackend, table_order, EXACT, WILDCARD, ID, PREFIX, ANY)
+
+
+class LanguageFacet(whoosh.sorting.FacetType):
+    """Sorts results by the weights of a `Ranking`, bubbling results from the
+    current locale to the top of the list.
+
+    The weights are looked up from the `language_id` (and `name`) columns
+    stored in the index, so no stored fields need to be fetched per hit.
+    """
+    def __init__(self, ranking):
+        self.ranking = ranking
+
+    def categorizer(self, global_searcher):
+        return _LanguageCategorizer(self.ranking)
+
+class _LanguageCategorizer(whoosh.sorting.Categorizer):
+    def __init__(self, ranking):
+        self.ranking = ranking
+        self._languages = None
+        self._names = None
+
+    def set_searcher(self, segment_searcher, docoffset):
+        reader = segment_searcher.reader()
+        self._languages = reader.column_reader('language_id')
+        if self.ranking.extra_weights:
+            self._names = reader.column_reader('name')
+
+    def key_for(self, matcher, segment_docnum):
+        if self._names is None:
+            name = None
+        else:
+            name = self._names[segment_docnum]
+
+        # Higher weights should come FIRST, but sorts are ascending.  Negate
+        # the weight to fix this
+        return -self.ranking.weight(self._languages[segment_docnum], name)
+
+table_facet = whoosh.sorting.FieldFacet('table_order')
+
+
+class WhooshBackend(LookupBackend):
+    """Keeps the names in a whoosh index, in files named `MAIN_*`."""
+
+    def __init__(self, directory, session=None):
+        super(WhooshBackend, self).__init__(directory, session=session)
+
+        # Opening a searcher means opening all the segments, so keep one
+        # around; see _get_searcher()
+        self._searcher = None
+
+        # Attempt to open or create the index.  Files belonging to other
+        # backends, like MEMORY_MAIN.idx, don't count
+        if not os.path.exists(directory) or not [
+                f for f in os.listdir(directory)
+                if not re.match('^[A-Z]+_MAIN[.]', f)]:
+            # Directory doesn't exist OR is empty; caller needs to use
+            # rebuild_index before doing anything.  Keep the dummy object that
+            # complains when used
+            return
+
+        # Otherwise, already exists; should be an index!  Bam, done.
+        # Note that this will explode if the directory exists but doesn't
+        # contain an index; that's a feature
+        try:
+            self.index = whoosh.index.open_dir(directory, indexname='MAIN')
+        except whoosh.index.EmptyIndexError:
+            raise IOError(
+                "The index directory already contains files.  "
+                "Please use a dedicated directory for the lookup index."
+            )
+
+    def _make_schema(self):
+        """Returns the whoosh schema used for the index."""
+        return whoosh.fields.Schema(
+            name=whoosh.fields.ID(sortable=True, stored=True, spelling=True),
+            table=whoosh.fields.ID(sortable=True, stored=True),
+            table_order=whoosh.fields.NUMERIC(sortable=True),
+            row_id=whoosh.fields.ID(sortable=True, stored=True),
+            language=whoosh.fields.STORED,
+            language_id=whoosh.fields.NUMERIC(sortable=True, stored=True),
+            iso639=whoosh.fields.ID(sortable=True, stored=True),
+            iso3166=whoosh.fields.ID(sortable=True, stored=True),
+            display_name=whoosh.fields.STORED,  # non-lowercased name
+            # Identifies all the documents for one (table, row_id, language),
+            # so incremental updates can replace them as a group
+            key=whoosh.fields.ID(stored=True),
+            content_hash=whoosh.fields.STORED,
+        )
+
+    def is_current(self):
+        return bool(self.index) and \
+            set(self.index.schema.names()) == set(self._make_schema().names())
+
+    def _get_searcher(self):
+        """Returns a searcher for the current state of the index.  The last
+        one is reused if the index hasn't changed since.
+        """
+        if self._searcher is None:
+            self._searcher = self.index.searcher()
+        else:
+            # The new searcher reuses what it can of the old one, and
+            # refresh() closes the rest, so the old one mustn't be closed
+            self._searcher = self._searcher.refresh()
+        return self._searcher
+
+    def _close_searcher(self):
+        if self._searcher is not None:
+            self._searcher.close()
+            self._searcher = None
+
+    def rebuild(self, groups, procs=1):
+        schema = self._make_schema()
+
+        # Let go of the old files before deleting them
+        self._close_searcher()
+
+        if os.path.exists(self.directory):
+            # create_in() isn't totally reliable, so just nuke whatever's there
+            # manually.  Try to be careful about this...
+            for f in os.listdir(self.directory):
+                if re.match('^_?(MAIN|SPELL)_', f):
+                    os.remove(os.path.join(self.directory, f))
+        else:
+            os.mkdir(self.directory)
+
+        self.index = whoosh.index.create_in(self.directory, schema=schema,
+                                                            indexname='MAIN')
+        if procs > 1:
+            writer = self.index.writer(procs=procs, multisegment=True)
+        else:
+            writer = self.index.writer()
+
+        for key, content_hash, documents in groups:
+            for document in documents:
+                writer.add_document(**document)
+
+        writer.commit()
+
+    def update(self, groups, deleted_keys):
+        writer = self.index.writer()
+        for key in deleted_keys:
+            writer.delete_by_term(u'key', key)
+
+        for key, content_hash, documents in groups:
+            for document in documents:
+                writer.add_document(**document)
+
+        writer.commit(optimize=True)
+
+    def iter_documents(self):
+        with self.index.reader() as reader:
+            for docnum, fields in reader.iter_docs():
+                # table_order is only kept as a column
+                fields['table_order'] = table_order[fields['table']]
+                yield fields
+
+    def get_row_ids(self, table_names):
+        searcher = self._get_searcher()
+        # Reading the whole column is much faster than a document at a time
+        row_ids = list(searcher.reader().column_reader('row_id'))
+        result = {}
+        for table_name in table_names:
+            docnums = searcher.docs_for_query(
+                whoosh.query.Term(u'table', table_name))
+            ids = sorted(set(int(row_ids[docnum]) for docnum in docnums))
+            if ids:
+                result[table_name] = ids
+        return result
+
+    def _make_query(self, query):
+        """Converts a `Query` into a whoosh query."""
+        if query.kind == EXACT:
+            whoosh_query = whoosh.query.Term(u'name', query.text)
+        elif query.kind == WILDCARD:
+            whoosh_query = whoosh.query.Wildcard(u'name', query.text)
+        elif query.kind == ID:
+            whoosh_query = whoosh.query.Term(u'row_id', query.text)
+        elif query.kind == PREFIX:
+            whoosh_query = whoosh.query.Prefix(u'name', query.text)
+        elif query.kind == ANY:
+            whoosh_query = whoosh.query.Or([
+                whoosh.query.Term(u'name', name) for name in query.text])
+        else:
+            raise ValueError("Unknown query kind %r" % (query.kind,))
+
+        # Combine both kinds of restriction
+        if query.tables:
+            whoosh_query = whoosh_query & whoosh.query.Or([
+                whoosh.query.Term(u'table', table_name)
+                for table_name in query.tables])
+        if query.languages:
+            # Allow for either country or language codes
+            lang_terms = []
+            for lang_code in query.languages:
+                lang_terms.append(whoosh.query.Term(u'iso639', lang_code))
+                lang_terms.append(whoosh.query.Term(u'iso3166', lang_code))
+            whoosh_query = whoosh_query & whoosh.query.Or(lang_terms)
+
+        return whoosh_query
+
+    def search(self, query, ranking, limit=None):
+        facet = whoosh.sorting.MultiFacet([
+            LanguageFacet(ranking),
+            table_facet,
+            "name",
+        ])
+        searcher = self._get_searcher()
+        results = searcher.search(
+            self._make_query(query),
+            limit=limit,
+            sortedby=facet,
+        )
+        return [hit.fields() for hit in results]
+
+    def suggest(self, text, limit):
+        searcher = self._get_searcher()
+        corrector = searcher.corrector('name')
+        return corrector.suggest(text, limit=limit)
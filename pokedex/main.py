@@ -5,11 +5,11 @@ import argparse
 import os
 import sys
 
+# Only what's needed to parse the arguments is imported here.  The database
+# and lookup modules take far longer to import than most commands take to
+# run, so each command imports what it uses
 import pokedex.cli.search
-import pokedex.db
-import pokedex.db.load
-import pokedex.db.tables
-import pokedex.lookup
+import pokedex.daemon
 from pokedex import defaults
 
 
@@ -18,6 +18,17 @@ def main(junk, *argv):
         command_help()
         return
 
+    command = pokedex.daemon.command_name(argv)
+    if command in pokedex.daemon.FORWARDED_COMMANDS:
+        status = pokedex.daemon.forward(argv)
+        if status is not None:
+            if status:
+                sys.exit(status)
+            return
+    elif command in pokedex.daemon.DATA_COMMANDS:
+        # It would keep using the old data
+        pokedex.daemon.stop()
+
     parser = create_parser()
     args = parser.parse_args(argv)
     args.func(parser, args)
@@ -46,6 +57,14 @@ def create_parser():
             u'POKEDEX_INDEX_DIR environment variable) to specify an '
             u'alternate loction.',
     )
+    common_parser.add_argument(
+        '--lookup-backend', dest='lookup_backend', default=None,
+        choices=sorted(defaults.lookup_backends),
+        help=u'Which engine stores and searches the lookup index.  '
+            u'Defaults to whoosh; use this option (or a '
+            u'POKEDEX_LOOKUP_BACKEND environment variable) to pick '
+            u'another.',
+    )
     common_parser.add_argument(
         '-q', '--quiet', dest='verbose', action='store_false',
         help=u'Don\'t print system output.  This is the default for '
@@ -74,6 +93,34 @@ def create_parser():
     cmd_lookup.set_defaults(func=command_lookup)
     cmd_lookup.add_argument('criteria', nargs='+')
 
+    cmd_serve = cmds.add_parser(
+        'serve', help=u'Serve lookups as JSON over HTTP',
+        parents=[common_parser])
+    cmd_serve.set_defaults(func=command_serve)
+    cmd_serve.add_argument(
+        '--host', dest='host', default='127.0.0.1',
+        help="address to listen on (default: 127.0.0.1)")
+    cmd_serve.add_argument(
+        '-p', '--port', dest='port', default=8000, type=int,
+        help="port to listen on (default: 8000)")
+    cmd_serve.add_argument(
+        '-t', '--threads', dest='threads', default=4, type=int,
+        help="number of lookups to run at once (default: 4)")
+
+    cmd_daemon = cmds.add_parser(
+        'daemon', help=u'Keep the database and index open for lookup and '
+            u'search',
+        parents=[common_parser])
+    cmd_daemon.set_defaults(func=command_daemon)
+    cmd_daemon.add_argument(
+        '--idle-timeout', dest='idle_timeout', type=float,
+        default=pokedex.daemon.DEFAULT_IDLE_TIMEOUT,
+        help="seconds to wait for a command before exiting (default: %d)"
+            % pokedex.daemon.DEFAULT_IDLE_TIMEOUT)
+    cmd_daemon.add_argument(
+        '--stop', dest='stop', default=False, action='store_true',
+        help="stop the running daemon instead")
+
     cmd_search = cmds.add_parser(
         'search', help=u'Find things by various criteria',
         parents=[common_parser])
@@ -100,6 +147,9 @@ def create_parser():
     cmd_load.add_argument(
         '-l', '--langs', dest='langs', default=None,
         help="comma-separated list of language codes to load, or 'none' (default: all)")
+    cmd_load.add_argument(
+        '--render', dest='render', default=False, action='store_true',
+        help="also render the Markdown prose ahead of time, like `pokedex render`")
     cmd_load.add_argument(
         'tables', nargs='*',
         help="list of database tables to load (default: all)")
@@ -122,6 +172,18 @@ def create_parser():
         'reindex', help=u'Rebuild the lookup index from the database',
         parents=[common_parser])
     cmd_reindex.set_defaults(func=command_reindex, verbose=True)
+    cmd_reindex.add_argument(
+        '-f', '--full', dest='full', default=False, action='store_true',
+        help="rebuild the whole index from scratch, instead of only updating "
+            "the names that changed")
+
+    cmd_render = cmds.add_parser(
+        'render', help=u'Render the Markdown prose in the database ahead of time',
+        parents=[common_parser])
+    cmd_render.set_defaults(func=command_render, verbose=True)
+    cmd_render.add_argument(
+        '-f', '--full', dest='full', default=False, action='store_true',
+        help="render everything again, instead of only the texts that changed")
 
     cmd_setup = cmds.add_parser(
         'setup', help=u'Combine load and reindex',
@@ -136,10 +198,16 @@ def create_parser():
     return parser
 
 
-def get_session(args):
+def get_session(args, engine_args=None):
     """Given a parsed options object, connects to the database and returns a
     session.
+
+    `engine_args` are passed on to `pokedex.db.connect()`.
+
+    In the daemon, `args.cache` is a dict that keeps the session around for
+    the next command.
     """
+    import pokedex.db
 
     engine_uri = args.engine_uri
     got_from = 'command line'
@@ -147,7 +215,20 @@ def get_session(args):
     if engine_uri is None:
         engine_uri, got_from = defaults.get_default_db_uri_with_origin()
 
-    session = pokedex.db.connect(engine_uri)
+    cache = getattr(args, 'cache', None)
+    key = 'session', os.getcwd(), engine_uri
+    if cache is not None and key in cache:
+        session = cache[key]
+    else:
+        if cache is not None and engine_args is None and \
+                engine_uri.startswith('sqlite:'):
+            # Keep the connection open between commands, too
+            from sqlalchemy.pool import SingletonThreadPool
+            engine_args = dict(poolclass=SingletonThreadPool)
+        session = pokedex.db.connect(engine_uri,
+                                     engine_args=engine_args or {})
+        if cache is not None:
+            cache[key] = session
 
     if args.verbose:
         print("Connected to database %(engine)s (from %(got_from)s)"
@@ -156,12 +237,28 @@ def get_session(args):
     return session
 
 
-def get_lookup(args, session=None, recreate=False):
-    """Given a parsed options object, opens the whoosh index and returns a
+def get_lookup_backend(args):
+    """Returns the name of the lookup backend to use, and where it came
+    from.
+    """
+    if args.lookup_backend is not None:
+        return args.lookup_backend, 'command line'
+
+    return defaults.get_default_lookup_backend_with_origin()
+
+
+def get_lookup(args, session=None, recreate=False, update=False):
+    """Given a parsed options object, opens the lookup index and returns a
     PokedexLookup object.
+
+    With `recreate`, the index is rebuilt from scratch; with `update`, it is
+    brought up to date with the database incrementally.  Otherwise, the
+    lookup is kept in `args.cache`, like the session in `get_session()`.
     """
 
-    if recreate and not session:
+    import pokedex.lookup
+
+    if (recreate or update) and not session:
         raise ValueError("get_lookup() needs an explicit session to regen the index")
 
     index_dir = args.index_dir
@@ -170,14 +267,36 @@ def get_lookup(args, session=None, recreate=False):
     if index_dir is None:
         index_dir, got_from = defaults.get_default_index_dir_with_origin()
 
+    backend, backend_from = get_lookup_backend(args)
+
     if args.verbose:
         print("Opened lookup index %(index_dir)s (from %(got_from)s)"
             % dict(index_dir=index_dir, got_from=got_from))
+        print("Using lookup backend %(backend)s (from %(backend_from)s)"
+            % dict(backend=backend, backend_from=backend_from))
+
+    cache = getattr(args, 'cache', None)
+    if recreate or update:
+        cache = None
+    key = 'lookup', os.getcwd(), index_dir, backend, id(session)
+    if cache is not None and key in cache:
+        return cache[key]
 
-    lookup = pokedex.lookup.PokedexLookup(index_dir, session=session)
+    lookup = pokedex.lookup.PokedexLookup(index_dir, session=session,
+                                          backend=backend)
+    if cache is not None:
+        cache[key] = lookup
 
     if recreate:
         lookup.rebuild_index()
+        session.commit()
+    elif update:
+        added, updated, deleted = lookup.update_index()
+        session.commit()
+        if args.verbose:
+            print("Index entries: %(added)d added, %(updated)d updated, "
+                "%(deleted)d deleted"
+                % dict(added=added, updated=updated, deleted=deleted))
 
     return lookup
 
@@ -203,6 +322,8 @@ def get_csv_directory(args):
 ### Plumbing commands
 
 def command_dump(parser, args):
+    import pokedex.db.load
+
     session = get_session(args)
     get_csv_directory(args)
 
@@ -221,7 +342,12 @@ def command_dump(parser, args):
 
 
 def command_load(parser, args):
-    if not args.engine_uri:
+    import pokedex.db.load
+
+    # The sqlite lookup backend lives in the database, so it's reloaded too
+    reindex = get_lookup_backend(args)[0] == 'sqlite'
+
+    if not args.engine_uri and not reindex:
         print("WARNING: You're reloading the default database, but not the lookup index.  They")
         print("         might get out of sync, and pokedex commands may not work correctly!")
         print("To fix this, run `pokedex reindex` when this command finishes.  Or, just use")
@@ -247,29 +373,48 @@ def command_load(parser, args):
         safe=args.safe,
         recursive=args.recursive,
         langs=langs,
+        reindex=reindex,
+        render_prose=args.render,
     )
 
 
 def command_reindex(parser, args):
     session = get_session(args)
-    get_lookup(args, session=session, recreate=True)
-    print("Recreated lookup index.")
+    if args.full:
+        get_lookup(args, session=session, recreate=True)
+        print("Recreated lookup index.")
+    else:
+        get_lookup(args, session=session, update=True)
+        print("Updated lookup index.")
+
+
+def command_render(parser, args):
+    import pokedex.db.render
+
+    session = get_session(args)
+    count = pokedex.db.render.render_prose(session, full=args.full)
+    print("Rendered %d texts." % count)
 
 
 def command_setup(parser, args):
+    import pokedex.db.load
+
     args.directory = None
 
     session = get_session(args)
     get_csv_directory(args)
     pokedex.db.load.load(
         session, directory=None, drop_tables=True,
-        verbose=args.verbose, safe=False)
+        verbose=args.verbose, safe=False,
+        reindex=get_lookup_backend(args)[0] == 'sqlite')
 
-    get_lookup(args, session=session, recreate=True)
-    print("Recreated lookup index.")
+    get_lookup(args, session=session, update=True)
+    print("Updated lookup index.")
 
 
 def command_status(parser, args):
+    import pokedex.db.tables
+
     args.directory = None
 
     # Database, and a lame check for whether it's been inited at least once
@@ -336,6 +481,71 @@ def command_lookup(parser, args):
             print()
 
 
+# The server uses asyncio's StreamReader.readuntil, new in Python 3.5.2.
+# setup.py leaves the module out of installs on older Pythons
+SERVE_MIN_PYTHON = (3, 5, 2)
+
+def command_serve(parser, args):
+    if sys.version_info < SERVE_MIN_PYTHON:
+        sys.exit("pokedex serve needs Python %s or later" %
+                 '.'.join(str(part) for part in SERVE_MIN_PYTHON))
+
+    # Only needed here
+    import pokedex.lookup
+    import pokedex.server
+
+    engine_uri = args.engine_uri or defaults.get_default_db_uri()
+    engine_args = {}
+    if engine_uri.startswith('sqlite:'):
+        # Keep a connection open for each thread, rather than reconnecting
+        # (and re-reading the schema) for every request
+        from sqlalchemy.pool import SingletonThreadPool
+        engine_args = dict(poolclass=SingletonThreadPool,
+                           pool_size=args.threads + 1)
+    session = get_session(args, engine_args=engine_args)
+
+    # Each thread gets its own lookup; the session is already thread-local
+    lookup = get_lookup(args, session=session)
+    server = pokedex.server.LookupServer(
+        lambda: pokedex.lookup.PokedexLookup(
+            lookup.directory, session=session, backend=type(lookup.backend)),
+        threads=args.threads)
+    server.warm_up()
+
+    def started(server):
+        print("Serving lookups on http://%s:%d/" % server.address)
+        sys.stdout.flush()
+
+    server.serve_forever(args.host, args.port, started=started)
+
+
+def command_daemon(parser, args):
+    daemon = pokedex.daemon.Daemon(idle_timeout=args.idle_timeout)
+    if args.stop:
+        if pokedex.daemon.stop(daemon.path):
+            print("Stopped the daemon at %s" % daemon.path)
+        else:
+            print("No daemon is running at %s" % daemon.path)
+        return
+
+    # Open the database and index given on the command line now, so the
+    # first command isn't slow
+    argv = []
+    for option, value in (('--engine', args.engine_uri),
+                          ('--index', args.index_dir),
+                          ('--lookup-backend', args.lookup_backend)):
+        if value is not None:
+            argv += [option, value]
+    daemon.run(argv + ['lookup', 'eevee'], os.getcwd(), dict(
+        (name, os.environ.get(name))
+        for name in pokedex.daemon.ENVIRONMENT))
+
+    print("Serving commands on %s" % daemon.path)
+    sys.stdout.flush()
+    if not daemon.serve():
+        sys.exit("A daemon is already running at %s" % daemon.path)
+
+
 def command_help(parser, args):
     parser.print_help()
 
@@ -0,0 +1,175 @@
+# encoding: utf8
+"""Provides `normalize_name()`, which strips irrelevant formatting junk from
+names so they can be compared, and `normalize_many()` for doing it in bulk.
+
+Specifically: everything is lowercased, and accents are removed.
+
+Doing that by the Unicode rules is slow, but most names are plain ASCII or
+Latin with accents, which are handled with a translation table instead.
+"""
+
+import re
+import unicodedata
+
+from six import text_type, unichr
+
+from pokedex.compatibility import lru_cache
+
+# Number of normalized names to remember
+CACHE_SIZE = 10000
+
+
+class _MarkRemover(dict):
+    """A `unicode.translate()` table that deletes nonspacing marks (category
+    Mn), and leaves everything else alone.  Fills itself in as characters are
+    looked up.
+    """
+    def __missing__(self, codepoint):
+        if unicodedata.category(unichr(codepoint)) == 'Mn':
+            value = None
+        else:
+            value = codepoint
+        self[codepoint] = value
+        return value
+
+_mark_remover = _MarkRemover()
+
+
+def _normalize_unicode(name):
+    """Normalizes `name` the slow but thorough way."""
+    # http://stackoverflow.com/questions/517923/what-is-the-best-way-to-remove-accents-in-a-python-unicode-string
+    # Makes sense to me.  Decompose by Unicode rules, then remove combining
+    # characters, then recombine.  I'm explicitly doing it this way instead
+    # of testing combining() because Korean characters apparently
+    # decompose!  But the results are considered letters, not combining
+    # characters, so testing for Mn works well, and combining them again
+    # makes them look right.
+    nkfd_form = unicodedata.normalize('NFKD', text_type(name))
+    name = nkfd_form.translate(_mark_remover)
+    name = unicodedata.normalize('NFC', name)
+
+    name = name.strip()
+    name = name.lower()
+
+    return name
+
+
+def _make_translation_table():
+    """Returns `(table, characters)`: a `unicode.translate()` table that
+    removes accents from Latin letters, and a string of every non-ASCII
+    character that's safe to normalize with it.
+
+    A character is safe if normalizing it by itself gives ASCII, or if it
+    doesn't change at all and is a letter that can't combine with anything.
+    Strings made of only safe characters normalize one character at a time,
+    so the table gives the same results as the Unicode rules.
+    """
+    table = {}
+    characters = []
+    for start, end in (
+            (0x00a0, 0x0250),  # Latin-1 Supplement, Latin Extended-A and B
+            (0x1e00, 0x1f00),  # Latin Extended Additional
+    ):
+        for codepoint in range(start, end):
+            char = unichr(codepoint)
+            nkfd_form = unicodedata.normalize('NFKD', char)
+            normalized = unicodedata.normalize('NFC', u"".join(
+                c for c in nkfd_form if unicodedata.category(c) != 'Mn'))
+
+            if all(ord(c) < 0x80 for c in normalized):
+                table[codepoint] = normalized
+                characters.append(char)
+            elif normalized == char and unicodedata.category(char)[0] == 'L' \
+                    and not unicodedata.combining(char):
+                characters.append(char)
+
+    return table, u"".join(characters)
+
+_translation_table, _safe_characters = _make_translation_table()
+
+# Finds anything that needs the slow path.  Newlines are included, so that
+# normalize_many() can use them as separators
+_unsafe_character = re.compile(
+    u'[^\x00-\x09\x0b-\x7f' + re.escape(_safe_characters) + u']').search
+
+
+def _normalize(name):
+    if _unsafe_character(name):
+        return _normalize_unicode(name)
+    return name.translate(_translation_table).strip().lower()
+
+_normalize_cached = lru_cache(maxsize=CACHE_SIZE)(_normalize)
+
+
+def normalize_name(name):
+    """Strips irrelevant formatting junk from name input.
+
+    Specifically: everything is lowercased, and accents are removed.
+    """
+    return _normalize_cached(text_type(name))
+
+
+def normalize_many(names):
+    """Normalizes a sequence of names, returning a list.
+
+    The common ones are normalized all together, as one big string.  The
+    cache isn't used, so that indexing thousands of names doesn't push out
+    everything useful.
+    """
+    names = [text_type(name) for name in names]
+    results = [None] * len(names)
+
+    simple = []
+    for i, name in enumerate(names):
+        if _unsafe_character(name):
+            results[i] = _normalize_unicode(name)
+        else:
+            simple.append(i)
+
+    joined = u"\n".join(names[i] for i in simple)
+    normalized = joined.translate(_translation_table).lower().split(u"\n")
+    for i, name in zip(simple, normalized):
+        results[i] = name.strip()
+
+    return results
+
+
+# Letters that some languages sort as letters of their own, after the one
+# they're based on, rather than as that letter with an accent.  In sort keys,
+# they become that letter followed by SORT_AFTER, which comes after every
+# letter.
+SORT_AFTER = u'\x7f'
+_separate_letters = {
+    u'cs': [(u'ch', u'h'), (u'č', u'c'), (u'ř', u'r'), (u'š', u's'),
+            (u'ž', u'z')],
+    u'es': [(u'ñ', u'n')],
+}
+
+# Japanese sorts katakana and hiragana together
+_katakana_to_hiragana = dict(
+    (codepoint, codepoint - 0x60) for codepoint in range(0x30a1, 0x30f7))
+
+
+def sort_keys(names, language=None):
+    """Returns a list of keys to sort `names` by, in the language with the
+    identifier `language`.  Names that are None get None.
+
+    Keys are normalized like `normalize_many()`, so case and accents don't
+    count, except where the language treats an accented letter as a letter of
+    its own.  German ß sorts as "ss", and Japanese kana sort together.
+    """
+    indexes = [i for i, name in enumerate(names) if name is not None]
+    prepared = []
+    for i in indexes:
+        name = text_type(names[i]).lower()
+        for letter, base in _separate_letters.get(language, ()):
+            name = name.replace(letter, base + SORT_AFTER)
+        prepared.append(name)
+
+    keys = [None] * len(names)
+    for i, key in zip(indexes, normalize_many(prepared)):
+        key = key.replace(u'ß', u'ss')
+        if language and language.startswith(u'ja'):
+            key = key.translate(_katakana_to_hiragana)
+        keys[i] = key
+    return keys
@@ -1,9 +1,25 @@
 # encoding: utf8
-"""Provides `romanize()` for romanizing simple Japanese text.
+"""Provides `romanize()` for romanizing simple Japanese text, and
+`romanize_many()` for doing it in bulk.
 
 Also provides available romanizers in a dictionary keyed by language identifier.
 """
 
+import re
+
+from six import unichr
+
+from pokedex.compatibility import lru_cache
+
+# Number of romanized strings each romanizer remembers
+CACHE_SIZE = 10000
+
+# What a character is, as far as `Romanizer.romanize` is concerned
+KANA, SMALL_KANA, YOUON, SOKUON, CHOONPU = range(5)
+OTHER = (None, None)
+
+VOWELS = ('a', 'e', 'i', 'o', 'u', 'y')
+
 class Romanizer(object):
     def __init__(self, parent=None, **tables):
         """Create a Romanizer
@@ -25,28 +41,98 @@ class Romanizer(object):
         for name, table in self.tables.items():
             setattr(self, name, table)
 
+        self._compile()
+        self._romanize_cached = lru_cache(maxsize=CACHE_SIZE)(self._romanize)
+
+    def _compile(self):
+        """Turns the tables into what `romanize()` actually uses.
+
+        That's a single dict saying what every character is, and a regex that
+        recognizes text made of only regular kana that don't affect each
+        other.  That text can be romanized with `unicode.translate()`.
+        """
+        characters = {}
+        for char, kana in self.roomaji_kana.items():
+            characters[char] = (KANA, kana)
+        for char, sound in self.roomaji_youon.items():
+            characters[char] = (YOUON, sound)
+        for char, vowel in self.roomaji_small_kana.items():
+            characters[char] = (SMALL_KANA, vowel)
+        characters[u'っ'] = characters[u'ッ'] = (SOKUON, None)
+        characters[u'ー'] = (CHOONPU, None)
+        self._characters = characters
+
+        def character_class(predicate):
+            chars = sorted(char for char, kana in self.roomaji_kana.items()
+                           if predicate(kana))
+            return u'[%s]' % u''.join(re.escape(char) for char in chars)
+
+        # Kana that change when next to each other: n before a vowel gets an
+        # apostrophe, and a vowel after the same vowel might get lengthened
+        pairs = [character_class(lambda kana: kana == 'n') +
+                 character_class(lambda kana: kana[0] in VOWELS)]
+        for vowel in sorted(self.lengthened_vowels):
+            pairs.append(
+                character_class(lambda kana: kana[-1] == vowel) +
+                character_class(lambda kana: kana == vowel))
+        self._plain = re.compile(u'(?!.*(?:%s))%s+$' % (
+            u'|'.join(pairs), character_class(lambda kana: True))).match
+        self._plain_table = dict(
+            (ord(char), kana) for char, kana in self.roomaji_kana.items())
+
     def romanize(self, string):
         """Convert a string of kana to roomaji."""
+        return self._romanize_cached(string)
+
+    def romanize_many(self, strings):
+        """Convert a sequence of strings of kana to roomaji, returning a
+        list.
+
+        Duplicates are only romanized once.  The cache isn't used, so that
+        romanizing thousands of names doesn't push out everything useful.
+        """
+        results = {}
+        for string in strings:
+            if string not in results:
+                results[string] = self._romanize(string)
+        return [results[string] for string in strings]
+
+    def _romanize(self, string):
+        if self._plain(string):
+            return string.translate(self._plain_table)
 
-        vowels = ['a', 'e', 'i', 'o', 'u', 'y']
+        kinds = self._characters
+        lengthened_vowels = self.lengthened_vowels
 
         characters = []
         last_kana = None  # Used for ー; っ or ッ; ん or ン
         last_char = None  # Used for small kana combos
         for char in string:
-            # Full-width Latin
-            if 0xff01 <= ord(char) <= 0xff5e:
+            kind, value = kinds.get(char, OTHER)
+
+            # Regular ol' kana
+            if kind == KANA:
+                kana = value
+
                 if last_kana == 'sokuon':
-                    raise ValueError("Sokuon cannot precede Latin characters.")
+                    if kana[0] in VOWELS:
+                        raise ValueError("Sokuon cannot precede a vowel.")
 
-                # XXX Real Unicode decomposition would be nicer
-                char = chr(ord(char) - 0xff01 + 0x21)
-                characters.append(char)
+                    characters.append(kana[0])
+                elif last_kana == 'n' and kana[0] in VOWELS:
+                    characters.append("'")
 
-                last_kana = None
+                # Special characters fo doubled kana
+                if kana[0] in lengthened_vowels and characters and kana == characters[-1][-1]:
+                    kana = lengthened_vowels[kana[0]]
+                    characters[-1] = characters[-1][:-1]
+
+                characters.append(kana)
+
+                last_kana = kana
 
             # Small vowel kana
-            elif char in self.roomaji_small_kana:
+            elif kind == SMALL_KANA:
                 combo = last_char + char
                 if combo in self.roomaji_small_kana_combos:
                     characters[-1] = self.roomaji_small_kana_combos[combo]
@@ -55,63 +141,51 @@ class Romanizer(object):
                     # If we don't know what it is...  act dumb and treat it as a
                     # full-size vowel.  Better than bailing, and seems to occur a
                     # lot, e.g. ピィ is "pii"
-                    characters.append(self.roomaji_small_kana[char])
+                    characters.append(value)
 
-                last_kana = self.roomaji_small_kana[char]
+                last_kana = value
 
             # Youon
-            elif char in self.roomaji_youon:
+            elif kind == YOUON:
                 if not last_kana or last_kana[-1] != 'i' or last_kana == 'i':
                     raise ValueError("Youon must follow an -i sound.")
 
                 # Drop the -i and append the ya/yu/yo sound
-                new_sound = self.roomaji_youon[char]
                 if last_kana in self.y_drop:
                     # Strip the y-
-                    new_char = self.y_drop[last_kana] + new_sound[1:]
+                    new_char = self.y_drop[last_kana] + value[1:]
                 else:
-                    new_char = last_kana[:-1] + new_sound
+                    new_char = last_kana[:-1] + value
 
                 characters[-1] = new_char
                 last_kana = new_char
 
             # Sokuon
-            elif char in (u'っ', u'ッ'):
+            elif kind == SOKUON:
                 # Remember it and double the consonant next time around
                 last_kana = 'sokuon'
 
             # Extended vowel or n
-            elif char == u'ー':
-                if last_kana[-1] not in vowels:
+            elif kind == CHOONPU:
+                if last_kana[-1] not in VOWELS:
                     raise ValueError(u"'ー' must follow by a vowel.")
-                if last_kana[-1] in self.lengthened_vowels:
+                if last_kana[-1] in lengthened_vowels:
                     characters[-1] = characters[-1][:-1]
-                    characters.append(self.lengthened_vowels[last_kana[-1]])
+                    characters.append(lengthened_vowels[last_kana[-1]])
                 else:
                     characters.append(last_kana[-1])
 
                 last_kana = None
 
-            # Regular ol' kana
-            elif char in self.roomaji_kana:
-                kana = self.roomaji_kana[char]
-
+            # Full-width Latin
+            elif 0xff01 <= ord(char) <= 0xff5e:
                 if last_kana == 'sokuon':
-                    if kana[0] in vowels:
-                        raise ValueError("Sokuon cannot precede a vowel.")
-
-                    characters.append(kana[0])
-                elif last_kana == 'n' and kana[0] in vowels:
-                    characters.append("'")
-
-                # Special characters fo doubled kana
-                if kana[0] in self.lengthened_vowels and characters and kana == characters[-1][-1]:
-                    kana = self.lengthened_vowels[kana[0]]
-                    characters[-1] = characters[-1][:-1]
+                    raise ValueError("Sokuon cannot precede Latin characters.")
 
-                characters.append(kana)
+                # XXX Real Unicode decomposition would be nicer
+                characters.append(unichr(ord(char) - 0xff01 + 0x21))
 
-                last_kana = kana
+                last_kana = None
 
             # Not Japanese?
             else:
@@ -234,11 +308,14 @@ romanizers['cs'] = Romanizer(parent=romanizers['en'],
     y_drop={u'či': u'č', u'ši': u'š', u'dži': u'dž', u'ni': u'ňj'},
 )
 
+def get_romanizer(lang='en'):
+    """Returns the romanizer for the given language; falls back to English."""
+    return romanizers.get(lang, romanizers['en'])
+
 def romanize(string, lang='en'):
     """Convert a string of kana to roomaji."""
+    return get_romanizer(lang).romanize(string)
 
-    # Get the correct romanizer; fall back to English
-    romanizer = romanizers.get(lang, 'en')
-
-    # Romanize away!
-    return romanizer.romanize(string)
+def romanize_many(strings, lang='en'):
+    """Convert a sequence of strings of kana to roomaji, returning a list."""
+    return get_romanizer(lang).romanize_many(list(strings))
@@ -0,0 +1,293 @@
+# encoding: utf8
+u"""A small HTTP server for lookups, so that the lookup index, its caches
+and the database connections only have to be loaded once.  Started by
+`pokedex serve`.
+
+Connections are handled by asyncio; the lookups themselves block, so they
+run on a fixed-size pool of threads, each with its own `PokedexLookup`.
+Needs Python 3.5 or later.
+
+Every endpoint takes GET requests and returns JSON:
+
+`/lookup?q=eevee`
+    Results of `PokedexLookup.lookup()`.  Add `exact=1` to turn off fuzzy
+    matching.
+
+`/prefix?q=pika`
+    Results of `PokedexLookup.prefix_lookup()`.
+
+`/autocomplete?q=pika`
+    Completions from `PokedexLookup.autocomplete()`.
+
+`/random`
+    A result of `PokedexLookup.random_lookup()`.  Add `uniform=1` to pick
+    each table equally often.
+
+All of them take any number of `type` parameters, which work like
+`valid_types`, and `/prefix` and `/autocomplete` take a `limit`.  Results
+are lists of objects with `name`, `table` and `id`, and for everything but
+`/autocomplete`, also `indexed_name`, `language`, `iso639`, `iso3166` and
+`exact`.  Errors are objects with an `error` message.
+"""
+from __future__ import print_function
+
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from six.moves.urllib.parse import parse_qs, urlsplit
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+DEFAULT_THREADS = 4
+
+# Largest `limit` a client can ask for
+MAX_LIMIT = 100
+
+# Longest request head accepted, in bytes
+MAX_HEAD_SIZE = 16 * 1024
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class BadRequest(Exception):
+    """Raised by the endpoints for unusable parameters."""
+
+
+def _result_json(result):
+    """Converts a `LookupResult` to something JSON can handle.
+
+    Only the table and id of the object are used, so it's never loaded.
+    """
+    return dict(
+        name=result.name,
+        indexed_name=result.indexed_name,
+        table=result.object.__tablename__,
+        id=result.object.id,
+        language=result.language.identifier if result.language else None,
+        iso639=result.iso639,
+        iso3166=result.iso3166,
+        exact=result.exact,
+    )
+
+
+class LookupServer(object):
+    """Serves lookups over HTTP.
+
+    `make_lookup` is called once in each worker thread, and should return a
+    `PokedexLookup` for that thread to use.  Sessions from
+    `pokedex.db.connect()` are already thread-local, so the lookups can all
+    share one.
+    """
+    def __init__(self, make_lookup, threads=DEFAULT_THREADS):
+        self.make_lookup = make_lookup
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.address = None
+
+        self._local = threading.local()
+        self._loop = None
+
+        self.endpoints = {
+            '/lookup': self.lookup,
+            '/prefix': self.prefix,
+            '/autocomplete': self.autocomplete,
+            '/random': self.random,
+        }
+
+    def _get_lookup(self):
+        lookup = getattr(self._local, 'lookup', None)
+        if lookup is None:
+            lookup = self._local.lookup = self.make_lookup()
+        return lookup
+
+    def warm_up(self):
+        """Creates every worker thread's lookup, and loads whatever it loads
+        lazily, so the first requests aren't slow.
+        """
+        barrier = threading.Barrier(self.threads)
+
+        def warm_up_thread():
+            try:
+                lookup = self._get_lookup()
+                lookup.lookup(u'eevee')
+                lookup.autocomplete(u'e')
+                lookup.random_lookup()
+                lookup.session.rollback()
+            finally:
+                # Don't finish until every thread has started, so that each
+                # one gets a job
+                barrier.wait()
+
+        futures = [self.executor.submit(warm_up_thread)
+                   for i in range(self.threads)]
+        for future in futures:
+            future.result()
+
+    ### Endpoints; these run in the worker threads
+
+    def _get_text(self, params):
+        text = params.get('q', [u''])[-1]
+        if not text.strip():
+            raise BadRequest("The q parameter is required")
+        return text
+
+    def _get_limit(self, params, default=10):
+        try:
+            limit = int(params.get('limit', [default])[-1])
+        except ValueError:
+            raise BadRequest("limit must be a number")
+        return max(1, min(limit, MAX_LIMIT))
+
+    def _get_flag(self, params, name):
+        return params.get(name, [u''])[-1] not in (u'', u'0', u'false')
+
+    def lookup(self, lookup, params):
+        results = lookup.lookup(
+            self._get_text(params), valid_types=params.get('type', []),
+            exact_only=self._get_flag(params, 'exact'), lazy=True)
+        return [_result_json(result) for result in results]
+
+    def prefix(self, lookup, params):
+        results = lookup.prefix_lookup(
+            self._get_text(params), valid_types=params.get('type', []),
+            limit=self._get_limit(params), lazy=True)
+        return [_result_json(result) for result in results]
+
+    def autocomplete(self, lookup, params):
+        completions = lookup.autocomplete(
+            self._get_text(params), valid_types=params.get('type', []),
+            limit=self._get_limit(params))
+        return [dict(name=completion.name, table=completion.table,
+                     id=completion.id)
+                for completion in completions]
+
+    def random(self, lookup, params):
+        results = lookup.random_lookup(
+            valid_types=params.get('type', []),
+            uniform=self._get_flag(params, 'uniform'), lazy=True)
+        return [_result_json(result) for result in results]
+
+    def handle(self, path, params):
+        """Runs the endpoint at `path` with the given query parameters, a
+        dict of lists of strings.  Returns `(status, data)`.
+        """
+        endpoint = self.endpoints.get(path)
+        if endpoint is None:
+            return 404, dict(error="No such endpoint: %s" % path)
+
+        lookup = self._get_lookup()
+        try:
+            return 200, endpoint(lookup, params)
+        except BadRequest as e:
+            return 400, dict(error=str(e))
+        except Exception as e:
+            return 500, dict(error="%s: %s" % (type(e).__name__, e))
+        finally:
+            # End the transaction, so nothing is held open between requests
+            lookup.session.rollback()
+
+    ### HTTP
+
+    async def _respond(self, writer, status, data, keep_alive, head=False):
+        body = json.dumps(data, ensure_ascii=False).encode('utf8')
+        headers = [
+            'HTTP/1.1 %d %s' % (status, REASONS[status]),
+            'Content-Type: application/json; charset=utf-8',
+            'Content-Length: %d' % len(body),
+            'Connection: %s' % ('keep-alive' if keep_alive else 'close'),
+        ]
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('ascii'))
+        if not head:
+            writer.write(body)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """Serves requests on one connection until either side closes it."""
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    # Closed by the client
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(
+                        writer, 431, dict(error="Request too large"), False)
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self._respond(
+                        writer, 400, dict(error="Bad request line"), False)
+                    break
+
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.0':
+                    keep_alive = connection == 'keep-alive'
+                else:
+                    keep_alive = connection != 'close'
+
+                # Nothing takes a body, but it has to be read anyway
+                length = int(headers.get('content-length') or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                if method not in ('GET', 'HEAD'):
+                    status, data = 405, dict(error="Only GET is supported")
+                else:
+                    url = urlsplit(target)
+                    params = parse_qs(url.query)
+                    status, data = await self._loop.run_in_executor(
+                        self.executor, self.handle, url.path, params)
+
+                await self._respond(writer, status, data, keep_alive,
+                                    head=(method == 'HEAD'))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                      started=None):
+        """Serves until `stop()` is called, or the process is interrupted.
+
+        `started` is called with the server once it's listening; the actual
+        address is in `address`, which is handy if `port` is 0.
+        """
+        loop = self._loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_HEAD_SIZE))
+        self.address = server.sockets[0].getsockname()[:2]
+        if started:
+            started(self)
+
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            self.executor.shutdown()
+            loop.close()
+
+    def stop(self):
+        """Makes `serve_forever()` return.  Can be called from any thread."""
+        self._loop.call_soon_threadsafe(self._loop.stop)
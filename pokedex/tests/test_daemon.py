@@ -0,0 +1,114 @@
+# encoding: utf8
+
+import os
+import socket
+import threading
+
+import pytest
+parametrize = pytest.mark.parametrize
+
+import pokedex.daemon
+import pokedex.main
+
+if not hasattr(socket, 'AF_UNIX'):
+    pytest.skip("the daemon needs Unix sockets", allow_module_level=True)
+
+
+@pytest.fixture
+def daemon(request, tmpdir, monkeypatch, session, lookup):
+    path = str(tmpdir.join('pokedex.sock'))
+    monkeypatch.setenv('POKEDEX_DAEMON_SOCKET', path)
+    monkeypatch.delenv('POKEDEX_DAEMON', raising=False)
+
+    daemon = pokedex.daemon.Daemon(path, idle_timeout=30)
+    thread = threading.Thread(target=daemon.serve)
+    thread.start()
+    while pokedex.daemon._connect(path) is None:
+        pass
+
+    yield daemon
+
+    pokedex.daemon.stop(path)
+    thread.join()
+    assert not os.path.exists(path)
+
+
+def common_argv(request):
+    """Returns options for the database and index the tests are using."""
+    argv = []
+    for option, name in (('--engine', 'engine'), ('--index', 'index'),
+                         ('--lookup-backend', 'lookup_backend')):
+        value = request.config.getvalue(name)
+        if value:
+            argv += [option, value]
+    return argv
+
+
+@parametrize(
+    ('argv', 'command'),
+    [
+        (['lookup', 'eevee'],                               'lookup'),
+        (['-e', 'sqlite://', '-v', 'lookup', 'eevee'],      'lookup'),
+        (['--engine=sqlite://', '-q', 'search'],            'search'),
+        (['-i', 'index', '--lookup-backend', 'memory', 'load'], 'load'),
+        (['-e', 'sqlite://'],                               None),
+        (['--help'],                                        None),
+    ]
+)
+def test_command_name(argv, command):
+    assert pokedex.daemon.command_name(argv) == command
+
+
+def test_data_commands():
+    """DATA_COMMANDS are commands, and none of them are forwarded"""
+    import argparse
+    parser = pokedex.main.create_parser()
+    subparsers, = [action for action in parser._actions
+                   if isinstance(action, argparse._SubParsersAction)]
+    data_commands = set(pokedex.daemon.DATA_COMMANDS)
+    assert data_commands <= set(subparsers.choices)
+    assert not data_commands & set(pokedex.daemon.FORWARDED_COMMANDS)
+
+
+def test_forward(request, daemon, session, lookup, capsys):
+    argv = ['lookup'] + common_argv(request) + ['eevee']
+
+    assert pokedex.daemon.forward(argv) == 0
+    forwarded = capsys.readouterr()
+
+    # Same again, without the daemon
+    parser = pokedex.main.create_parser()
+    args = parser.parse_args(argv)
+    args.func(parser, args)
+    local = capsys.readouterr()
+
+    assert forwarded.out == local.out
+    assert u'pokemon_species: Eevee' in forwarded.out
+
+    # The session and lookup are kept for next time
+    assert len(daemon.cache) == 2
+    assert pokedex.daemon.forward(argv) == 0
+    assert capsys.readouterr().out == local.out
+    assert len(daemon.cache) == 2
+
+
+def test_forward_errors(request, daemon, session, lookup, capsys):
+    status = pokedex.daemon.forward(
+        ['lookup'] + common_argv(request))
+    assert status == 2
+    assert u'arguments are required' in capsys.readouterr().err
+
+
+def test_no_daemon(tmpdir, monkeypatch):
+    monkeypatch.setenv('POKEDEX_DAEMON_SOCKET',
+                       str(tmpdir.join('pokedex.sock')))
+    monkeypatch.delenv('POKEDEX_DAEMON', raising=False)
+    assert pokedex.daemon.forward(['lookup', 'eevee']) is None
+    assert not pokedex.daemon.stop()
+
+
+def test_idle_timeout(tmpdir):
+    path = str(tmpdir.join('pokedex.sock'))
+    daemon = pokedex.daemon.Daemon(path, idle_timeout=0.1)
+    assert daemon.serve()
+    assert not os.path.exists(path)
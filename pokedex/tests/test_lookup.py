@@ -154,3 +154,407 @@ def test_crash_empty_prefix(lookup):
     """Searching for ':foo' used to crash, augh!"""
     results = lookup.lookup(u':Eevee')
     assert results[0].object.name == u'Eevee'
+
+
+def test_update_index_noop(lookup):
+    """A freshly built index has nothing to update"""
+    assert lookup.update_index(tables=['types', 'abilities']) == (0, 0, 0)
+
+
+@pytest.mark.slow
+def test_update_index(request, session, tmpdir):
+    import pokedex.lookup
+    lookup = pokedex.lookup.PokedexLookup(str(tmpdir), session,
+        backend=request.config.getvalue("lookup_backend"))
+    lookup.rebuild_index()
+
+    lookup.backend.update([(u'types/10000/en', u'x', [dict(
+        name=u'bogus', display_name=u'Bogus', table=u'types', table_order=5,
+        row_id=u'10000', language=u'en', language_id=9, iso639=u'en',
+        iso3166=u'us', key=u'types/10000/en', content_hash=u'x' * 40,
+    )])], [u'types/1/en'])
+    assert lookup.lookup(u'bogus')[0].exact
+
+    assert lookup.update_index(tables=['types']) == (1, 0, 1)
+    assert lookup.lookup(u'type:normal')[0].object.id == 1
+    assert not lookup.lookup(u'type:bogus', exact_only=True)
+
+
+def test_memory_ids(lookup, tmpdir):
+    """The memory backend finds documents by id through the id_docs
+    section"""
+    from pokedex.lookup.memory import MemoryBackend
+
+    backend = MemoryBackend(str(tmpdir))
+    backend.rebuild([(None, None, list(lookup.backend.iter_documents()))])
+    index = backend.index
+    assert backend.is_current()
+
+    for row_id in 1, 133, 10039, 99999:
+        expected = [doc for doc in range(index.doc_count)
+                    if index.doc_row_ids[doc] == row_id]
+        assert sorted(index.docs_with_row_id(row_id)) == expected
+        assert bool(expected) == (row_id != 99999)
+
+
+def test_whoosh_ordering(tmpdir):
+    """The whoosh backend orders results by language weight, then by table,
+    then by name"""
+    from pokedex.lookup.backend import (
+        Query, Ranking, table_order, ANY, EXACT)
+    from pokedex.lookup.whoosh_backend import WhooshBackend
+
+    languages = {5: (u'fr', u'fr', u'fr'), 6: (u'de', u'de', u'de'),
+                 9: (u'en', u'en', u'us')}
+    def group(name, table, row_id, language_id):
+        language, iso639, iso3166 = languages[language_id]
+        key = u'%s/%d/%s' % (table, row_id, language)
+        return key, u'x' * 40, [dict(
+            name=name, display_name=name.title(), table=table,
+            table_order=table_order[table], row_id=str(row_id),
+            language=language, language_id=language_id, iso639=iso639,
+            iso3166=iso3166, key=key, content_hash=u'x' * 40)]
+
+    backend = WhooshBackend(str(tmpdir))
+    backend.rebuild([
+        group(u'charge', u'abilities', 2, 5),
+        group(u'charge', u'pokemon_species', 4, 6),
+        group(u'charge', u'items', 3, 9),
+        group(u'charge', u'moves', 1, 5),
+        group(u'bide', u'moves', 5, 9),
+        group(u'bid', u'moves', 6, 9),
+    ])
+
+    def search(query, ranking):
+        return [(document['table'], document['language'])
+                for document in backend.search(query, ranking)]
+
+    charge = Query(EXACT, u'charge', None, None)
+    # Languages by weight; the rest get 1
+    assert search(charge, Ranking({9: 3.0, 5: 2.0})) == [
+        (u'items', u'en'), (u'moves', u'fr'), (u'abilities', u'fr'),
+        (u'pokemon_species', u'de')]
+    assert search(charge, Ranking({5: 2.0})) == [
+        (u'moves', u'fr'), (u'abilities', u'fr'),
+        (u'pokemon_species', u'de'), (u'items', u'en')]
+    # Then by table
+    assert search(charge, Ranking({})) == [
+        (u'pokemon_species', u'de'), (u'moves', u'fr'),
+        (u'abilities', u'fr'), (u'items', u'en')]
+
+    # Names' extra weights count too, and names come last
+    names = Query(ANY, [u'bid', u'bide'], None, None)
+    assert [document['name'] for document in backend.search(
+        names, Ranking({}))] == [u'bid', u'bide']
+    assert [document['name'] for document in backend.search(
+        names, Ranking({}, extra_weights={u'bide': 2.0}))] == \
+        [u'bide', u'bid']
+
+
+@pytest.mark.slow
+def test_rebuild_index_procs(session, tmpdir):
+    """An index built in several processes is the same as one built in one"""
+    import pokedex.lookup
+
+    lookups = []
+    for procs in 1, 2:
+        lookup = pokedex.lookup.PokedexLookup(
+            str(tmpdir.join('index-%d' % procs)), session, backend='whoosh')
+        # Small enough chunks for the pool to have several
+        lookup.INDEX_CHUNK_SIZE = 500
+        lookup.rebuild_index(procs=procs)
+        lookups.append(lookup)
+
+    def documents(lookup):
+        return sorted(tuple(sorted(document.items()))
+                      for document in lookup.backend.iter_documents())
+    single, multi = lookups
+    assert len(documents(single)) > 10000
+    assert documents(multi) == documents(single)
+
+    for input in u'eevee', u'Nidoran*', u'133', u'@fr:charge', u'eeve':
+        assert [(result.object.__tablename__, result.object.id, result.name)
+                for result in multi.lookup(input, lazy=True)] == \
+            [(result.object.__tablename__, result.object.id, result.name)
+             for result in single.lookup(input, lazy=True)]
+
+
+@pytest.fixture(scope="module", params=['memory', 'sqlite'])
+def other_lookup(request, lookup, session, tmpdir_factory):
+    """A lookup with the same documents as `lookup`, in another backend"""
+    import sqlalchemy
+    import sqlalchemy.orm
+    import pokedex.lookup
+
+    directory = tmpdir_factory.mktemp('other-index')
+    # The sqlite backend keeps the index in its own database here, rather
+    # than the one under test
+    engine = sqlalchemy.create_engine(
+        'sqlite:///' + str(directory.join('lookup.sqlite')))
+    backend_session = sqlalchemy.orm.sessionmaker(bind=engine)()
+
+    backend_class = pokedex.lookup.get_backend_class(request.param)
+    backend = backend_class(str(directory), session=backend_session)
+    backend.rebuild([(None, None, list(lookup.backend.iter_documents()))])
+    return pokedex.lookup.PokedexLookup(str(directory), session,
+                                        backend=backend)
+
+@parametrize(
+    'input',
+    [
+        u'eevee',
+        u'Nidoran*',
+        u'?evee',
+        u'133',
+        u'pokemon:133',
+        u'@fr:charge',
+        u'move,@fr:charge',
+        u'ibui',
+        u'eeve',
+        u'fire pnuch',
+        u'pokemon:sunflor',
+        u'Ho-Oh',
+        u'*chu',
+        u'*ee*',
+        u'ab?',
+    ]
+)
+def test_other_backends(lookup, other_lookup, input):
+    """Other backends find the same things as the default one"""
+    def summarize(results):
+        return [(result.object.__tablename__, result.object.id, result.name,
+                 result.exact) for result in results]
+
+    assert summarize(other_lookup.lookup(input)) == \
+        summarize(lookup.lookup(input))
+    assert summarize(other_lookup.prefix_lookup(input[:3])) == \
+        summarize(lookup.prefix_lookup(input[:3]))
+
+
+def test_other_backends_row_ids(lookup, other_lookup):
+    """Other backends index the same rows as the default one"""
+    table_names = list(lookup.indexed_tables)
+    assert other_lookup.backend.get_row_ids(table_names) == \
+        lookup.backend.get_row_ids(table_names)
+
+
+def test_sqlite_backend_transactions(lookup, session, tmpdir):
+    """The sqlite backend leaves committing to the session's owner, and
+    looking things up doesn't write"""
+    import sqlalchemy
+    import sqlalchemy.orm
+    import pokedex.lookup
+    from pokedex.lookup.sqlite_backend import SQLiteBackend
+
+    engine = sqlalchemy.create_engine(
+        'sqlite:///' + str(tmpdir.join('lookup.sqlite')))
+    backend_session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    backend = SQLiteBackend(str(tmpdir), session=backend_session)
+    documents = list(lookup.backend.iter_documents())
+
+    backend.rebuild([(None, None, documents)])
+    backend.save_blob(u'blob', b'data')
+    backend_session.rollback()
+    assert not list(backend.iter_documents())
+    assert backend.load_blob(u'blob') is None
+
+    # An index without autocompletion data gets it built in memory
+    backend.rebuild([(None, None, documents)])
+    backend_session.commit()
+    other_lookup = pokedex.lookup.PokedexLookup(str(tmpdir), session,
+                                                backend=backend)
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', count)
+    try:
+        assert other_lookup.autocomplete(u'Eev')[0].id == 133
+        assert other_lookup.lookup(u'*chu')
+    finally:
+        sqlalchemy.event.remove(engine, 'before_cursor_execute', count)
+    assert statements
+    assert all(statement.split()[0].upper() in ('SELECT', 'PRAGMA')
+               for statement in statements)
+    assert backend.load_blob(pokedex.lookup.AutocompleteIndex.filename) \
+        is None
+
+
+def test_sqlite_trigrams_update(lookup, tmpdir):
+    """Updating the sqlite backend changes the trigram table a row at a time,
+    rather than rebuilding it"""
+    import sqlalchemy
+    import sqlalchemy.orm
+    from pokedex.lookup import sqlite_backend
+    from pokedex.lookup.backend import Query, WILDCARD
+
+    if not sqlite_backend.HAVE_TRIGRAMS:
+        pytest.skip("this SQLite has no trigram tokenizer")
+    engine = sqlalchemy.create_engine(
+        'sqlite:///' + str(tmpdir.join('lookup.sqlite')))
+    backend_session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    backend = sqlite_backend.SQLiteBackend(str(tmpdir), session=backend_session)
+    documents = [document for document in lookup.backend.iter_documents()
+                 if document['table'] == u'types']
+    backend.rebuild([(None, None, documents)])
+    normal, = [document for document in documents
+               if document['key'] == u'types/1/en']
+
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', count)
+    try:
+        backend.update([(u'types/1/en', u'x', [dict(
+            normal, name=u'bogusnormal', display_name=u'Bogusnormal',
+            content_hash=u'x' * 40)])], [u'types/1/en'])
+    finally:
+        sqlalchemy.event.remove(engine, 'before_cursor_execute', count)
+    assert not any('rebuild' in statement for statement in statements)
+
+    def wildcard(pattern):
+        query = Query(WILDCARD, pattern, None, None)
+        documents = sqlite_backend.documents_table
+        return backend_session.execute(
+            sqlalchemy.select([documents.c.key, documents.c.name])
+            .where(backend._condition(query))).fetchall()
+    assert wildcard(u'*gusnorm*') == [(u'types/1/en', u'bogusnormal')]
+    assert (u'types/1/en', u'normal') not in wildcard(u'*orma*')
+    # Checks the trigrams against the documents table
+    backend_session.execute(
+        u"INSERT INTO pokedex_lookup_trigrams(pokedex_lookup_trigrams, rank) "
+        u"VALUES ('integrity-check', 1)")
+
+
+def test_uniform_random(lookup):
+    for i in range(5):
+        results = lookup.random_lookup(uniform=True)
+        assert len(results) == 1
+
+    results = lookup.random_lookup(valid_types=['type'], uniform=True)
+    assert results[0].object.__tablename__ == 'types'
+
+
+def test_random_indexed_ids(lookup):
+    """Random lookups only pick rows that are in the index, and only load
+    the ids of the tables they can pick from"""
+    from pokedex.db import tables
+
+    lookup._random_ids = None
+    try:
+        assert lookup.random_lookup()
+        assert 'pokemon_forms' not in lookup._random_ids
+
+        # Most forms have no name of their own, so aren't indexed
+        indexed = set(int(document['row_id'])
+                      for document in lookup.backend.iter_documents()
+                      if document['table'] == u'pokemon_forms')
+        random_ids = lookup._get_random_ids(['pokemon_forms'])
+        assert set(random_ids['pokemon_forms']) == indexed
+        assert len(indexed) < lookup.session.query(tables.PokemonForm).count()
+    finally:
+        lookup._random_ids = None
+
+
+@parametrize('uniform', [False, True])
+def test_random_empty(lookup, uniform):
+    """Picking from empty tables gives nothing, either way"""
+    import array
+    lookup._random_ids = dict((table_name, array.array('l'))
+                              for table_name in lookup.indexed_tables)
+    try:
+        assert lookup.random_lookup(uniform=uniform) == []
+        assert lookup.lookup(u'random') == []
+    finally:
+        lookup._random_ids = None
+
+
+@parametrize(
+    ('prefix', 'table', 'id'),
+    [
+        (u'Eev',            'pokemon_species', 133),
+        (u'move:thunderb',  'moves',           85),
+        (u'@fr:chenit',     'pokemon_species', 412),
+        (u'イーブ',         'pokemon_species', 133),
+    ]
+)
+def test_autocomplete(lookup, prefix, table, id):
+    completions = lookup.autocomplete(prefix)
+    assert completions[0].table == table
+    assert completions[0].id == id
+
+    results = lookup.autocomplete(prefix, hydrate=True)
+    assert results[0].object.__tablename__ == table
+    assert results[0].object.id == id
+
+
+def test_eager_objects(lookup, session):
+    """Results have the actual objects by default"""
+    from pokedex.db import tables
+
+    results = lookup.lookup(u'1')
+    assert results
+    for result in results:
+        assert type(result.object) is lookup.indexed_tables[
+            result.object.__tablename__]
+    species = lookup.lookup(u'eevee', valid_types=['pokemon'])[0].object
+    assert species is session.query(tables.PokemonSpecies).get(133)
+
+
+def test_lazy_objects(lookup, session):
+    import pickle
+    import sqlalchemy
+    import pokedex.lookup
+    from pokedex.db import tables
+
+    statements = []
+    def count(*args):
+        statements.append(args)
+
+    results = lookup.lookup(u'1', lazy=True)
+    engine = session.get_bind()
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', count)
+    try:
+        # Known without loading anything
+        assert all(result.object.id == 1 for result in results)
+        assert isinstance(results[0].object, lookup.indexed_tables[
+            results[0].object.__tablename__])
+        assert not statements
+
+        # Loaded one table at a time
+        pokedex.lookup.hydrate(results)
+        table_count = len(set(
+            result.object.__tablename__ for result in results))
+        assert len(statements) == table_count
+
+        species = [result.object for result in results
+                   if result.object.__tablename__ == 'pokemon_species']
+        assert species[0].name == u'Bulbasaur'
+        assert species[0] == session.query(tables.PokemonSpecies).get(1)
+        assert len(statements) == table_count
+    finally:
+        sqlalchemy.event.remove(engine, 'before_cursor_execute', count)
+
+    # Pickling gives the object itself.  (Evolution chains have no
+    # translations, whose classes can't be pickled.)
+    obj = pokedex.lookup.LazyObject(session, tables.EvolutionChain, 67)
+    unpickled = pickle.loads(pickle.dumps(obj))
+    assert type(unpickled) is tables.EvolutionChain
+    assert unpickled.id == 67
+
+
+def test_autocomplete_limit(lookup):
+    assert len(lookup.autocomplete(u'p', limit=7)) == 7
+    assert len(lookup.prefix_lookup(u'p', limit=7)) == 7
+    assert lookup.autocomplete(u'zzzzzz') == []
+
+
+@parametrize(
+    'pattern',
+    [u'*chu', u'*ite', u'p*chu', u'*ar?e*', u'?', u'*', u'*[*', u'*zzzz'],
+)
+def test_ngram_wildcards(lookup, pattern):
+    """Wildcards narrowed down by the n-gram index find the same things"""
+    from pokedex.lookup.backend import Query, WILDCARD
+    ranking = lookup._ranking()
+    assert lookup.backend.search(lookup._wildcard_query(pattern), ranking) == \
+        lookup.backend.search(Query(WILDCARD, pattern, None, None), ranking)
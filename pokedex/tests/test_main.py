@@ -0,0 +1,59 @@
+# encoding: utf8
+
+import subprocess
+import sys
+
+import pytest
+parametrize = pytest.mark.parametrize
+
+# Modules that take far longer to import than the CLI takes to start, so only
+# the commands that need them should import them
+HEAVY_MODULES = ('sqlalchemy', 'pokedex.db', 'pokedex.lookup', 'pokedex.search',
+                 'markdown', 'whoosh')
+
+
+def import_times(*args):
+    """Runs Python with `-X importtime` and the given arguments, and returns
+    a list of `(module, cumulative seconds, depth)` for every import.
+    """
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime'] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    assert process.returncode == 0, stderr
+
+    times = []
+    for line in stderr.decode('utf8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), int(cumulative) / 1e6, depth))
+    return times
+
+
+@pytest.fixture(scope='module')
+def help_imports():
+    if sys.version_info < (3, 7):
+        pytest.skip("-X importtime needs Python 3.7")
+
+    # Whatever Python imports when it starts up isn't the CLI's fault.  (How
+    # long the rest takes is measured by benchmarks/cli_help.py.)
+    startup = set(name for name, seconds, depth in import_times('-c', 'pass'))
+    return [(name, seconds, depth)
+            for name, seconds, depth in import_times('-m', 'pokedex', 'help')
+            if name not in startup]
+
+
+@parametrize('module', HEAVY_MODULES)
+def test_help_skips_heavy_imports(help_imports, module):
+    imported = set(name for name, seconds, depth in help_imports)
+    assert module not in imported
+
+
+def test_serve_needs_newer_python(monkeypatch):
+    import pokedex.main
+    monkeypatch.setattr(sys, 'version_info', (2, 7, 18))
+    with pytest.raises(SystemExit) as excinfo:
+        pokedex.main.command_serve(None, None)
+    assert 'needs Python 3.5.2' in str(excinfo.value)
@@ -0,0 +1,85 @@
+# encoding: utf8
+
+import pytest
+parametrize = pytest.mark.parametrize
+
+from six import unichr
+
+import pokedex.normalize
+from pokedex.db import tables
+
+@parametrize(
+    ('name', 'normalized'),
+    [
+        (u'Pikachu',            u'pikachu'),
+        (u'  Mr. Mime ',        u'mr. mime'),
+
+        # Accents
+        (u'Pokémon',            u'pokemon'),
+        (u'Flabébé',            u'flabebe'),
+        (u'ÉCRASEMENT',         u'ecrasement'),
+        (u'Ŝŭŝo',               u'suso'),
+
+        # Letters that don't decompose are left alone
+        (u'Straße',             u'straße'),
+        (u'Ærøskøbing',         u'ærøskøbing'),
+
+        # Everything else goes by the Unicode rules
+        (u'ガーディ',           u'カーティ'),
+        (u'ﾋﾟｶﾁｭｳ',             u'ヒカチュウ'),
+        (u'피카츄',             u'피카츄'),
+        (u'Ｐｉｋａ',           u'pika'),
+        (u'Pokémon ガ',         u'pokemon カ'),
+        (u'é',            u'e'),
+    ]
+)
+def test_normalize_name(name, normalized):
+    assert pokedex.normalize.normalize_name(name) == normalized
+    assert pokedex.normalize.normalize_many([name]) == [normalized]
+
+
+def test_translation_table():
+    """The translation table has to agree with the Unicode rules"""
+    normalize_unicode = pokedex.normalize._normalize_unicode
+    for codepoint in range(0x2000):
+        char = unichr(codepoint)
+        names = [char, u'x' + char, u'x' + char + u'o']
+        for name in names:
+            assert pokedex.normalize._normalize(name) == \
+                normalize_unicode(name)
+        assert pokedex.normalize.normalize_many(names) == [
+            normalize_unicode(name) for name in names]
+
+
+def test_normalize_many(session):
+    names = []
+    for table in tables.PokemonSpecies.names_table, tables.Move.names_table:
+        names.extend(name for name, in session.query(table.name))
+    assert pokedex.normalize.normalize_many(names) == [
+        pokedex.normalize._normalize_unicode(name) for name in names]
+
+
+@parametrize(
+    ('language', 'names'),
+    [
+        # In order
+        (u'en',     [u'éclair', u'Eevee', u'Flabébé', u'Straße', u'Strasse', u'Stratus']),
+        (u'es',     [u'Nube', u'Nuez', u'Ñandú', u'Ozono']),
+        (u'cs',     [u'Cukr', u'Čepel', u'Dub', u'Hrom', u'Chvost', u'Iskra']),
+        (u'ja',     [u'イーブイ', u'ぴかちゅう', u'ピカチュウ', u'ふしぎだね']),
+    ]
+)
+def test_sort_keys(language, names):
+    keys = pokedex.normalize.sort_keys(names, language)
+    assert keys == sorted(keys)
+    assert pokedex.normalize.sort_keys([None], language) == [None]
+
+
+def test_loaded_sort_keys(session):
+    table = tables.Move.names_table
+    for language in session.query(tables.Language):
+        rows = session.query(table.name, table.sort_key) \
+            .filter_by(local_language=language).all()
+        names = [name for name, sort_key in rows]
+        assert [sort_key for name, sort_key in rows] == \
+            pokedex.normalize.sort_keys(names, language.identifier)
@@ -57,3 +57,37 @@ def test_roomaji(kana, roomaji):
 def test_roomaji_cs(kana, roomaji):
     result = pokedex.roomaji.romanize(kana, 'cs')
     assert result == roomaji
+
+
+@parametrize(
+    ('kana', 'roomaji', 'roomaji_cs'),
+    [
+        # Plain kana that can be translated all at once
+        (u'ヤドン',             u'yadon',       u'jadon'),
+        (u'ネイティオ',         u'neitio',      u'neitio'),
+
+        # Plain kana that affect each other
+        (u'シンオウ',           u"shin'ou",     u"šin'ou"),
+        (u'オオタチ',           u'ootachi',     u'ótači'),
+
+        # Full-width Latin
+        (u'ポリゴン２',         u'porigon2',    u'porigon2'),
+    ]
+)
+def test_romanize_many(kana, roomaji, roomaji_cs):
+    names = [kana, u'ゲンガー', kana]
+    assert pokedex.roomaji.romanize_many(names) == [
+        roomaji, u'gengaa', roomaji]
+    assert pokedex.roomaji.romanize_many(names, 'cs') == [
+        roomaji_cs, u'gengá', roomaji_cs]
+    assert pokedex.roomaji.romanize(kana) == roomaji
+    assert pokedex.roomaji.romanize(kana, 'cs') == roomaji_cs
+
+
+@parametrize(
+    'kana',
+    [u'ッ', u'ッア', u'ッa', u'ッＡ', u'ャ', u'アャ'],
+)
+def test_romanize_invalid(kana):
+    with pytest.raises(ValueError):
+        pokedex.roomaji.romanize(kana)
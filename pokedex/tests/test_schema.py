@@ -2,11 +2,13 @@
 
 import pytest
 
-from sqlalchemy import Column, Integer, String, create_engine
-from sqlalchemy.orm import joinedload, sessionmaker
+from sqlalchemy import (
+    Column, ForeignKey, Integer, String, create_engine, event, inspect)
+from sqlalchemy.orm import joinedload, relationship, sessionmaker
+from sqlalchemy.orm.instrumentation import manager_of_class
 from sqlalchemy.ext.declarative import declarative_base
 
-from pokedex.db import tables
+from pokedex.db import multilang, tables
 from pokedex.db.multilang import MultilangScopedSession, MultilangSession, \
     create_translation_table
 
@@ -158,6 +160,246 @@ def test_i18n_table_creation():
     assert foo.name_map[lang_en] == 'different english'
     assert foo.name_map[lang_ru] == 'new russian'
 
+def test_i18n_table_lazy_mapping():
+    """Translation classes are mapped when they're first used, and the names
+    that are joined eagerly are joined on the very first query.
+    """
+    if not multilang.LAZY_MAPPING:
+        pytest.skip("lazy mapping isn't used on this SQLAlchemy version")
+    Base = declarative_base()
+    engine = create_engine("sqlite:///:memory:")
+
+    class Language(Base):
+        __tablename__ = 'languages'
+        id = Column(Integer, primary_key=True, nullable=False)
+        identifier = Column(String(2), nullable=False, unique=True)
+
+    def make_foo_class(name):
+        return type(name, (Base,), dict(
+            __tablename__=name.lower() + 's',
+            __singlename__=name.lower(),
+            id=Column(Integer, primary_key=True, nullable=False),
+            translation_classes=[],
+        ))
+
+    Foo = make_foo_class('Foo')
+    FooText = create_translation_table('foo_text', Foo, 'texts',
+        language_class=Language, relation_lazy='joined',
+        name = Column(String(100)),
+    )
+    Bar = make_foo_class('Bar')
+    BarText = create_translation_table('bar_text', Bar, 'texts',
+        language_class=Language,
+        name = Column(String(100)),
+    )
+    Baz = make_foo_class('Baz')
+    BazText = create_translation_table('baz_text', Baz, 'texts',
+        language_class=Language,
+        name = Column(String(100)),
+    )
+    Qux = make_foo_class('Qux')
+    QuxText = create_translation_table('qux_text', Qux, 'texts',
+        language_class=Language,
+        name = Column(String(100)),
+    )
+
+    # The tables exist right away; the mappers don't
+    for cls in FooText, BarText, BazText, QuxText:
+        assert cls.__table__.metadata is Base.metadata
+        assert manager_of_class(cls) is None
+
+    Base.metadata.create_all(engine)
+    engine.execute(Language.__table__.insert(), id=1, identifier='en')
+    engine.execute(Foo.__table__.insert(), id=1)
+    engine.execute(FooText.__table__.insert(),
+                   foo_id=1, local_language_id=1, name='english')
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda *args: statements.append(args[2]))
+
+    sess = MultilangScopedSession(sessionmaker(
+        bind=engine, class_=MultilangSession, default_language_id=1))
+
+    # Querying for Foo maps its translations and joins the names
+    foo = sess.query(Foo).one()
+    assert manager_of_class(FooText) is not None
+    assert foo.name == 'english'
+    assert len(statements) == 1
+
+    # So does looking up the relationship, or a column of the class
+    assert inspect(Bar.texts).property.mapper.class_ is BarText
+    assert BazText.name.property.columns[0].name == 'name'
+
+    assert sess.query(BarText).all() == []
+
+    # As does using the column proxies, before anything else has
+    assert sess.query(Qux).filter(Qux.name == u'english').all() == []
+    assert manager_of_class(QuxText) is not None
+
+@parametrize('by_name', [False, True])
+def test_i18n_table_lazy_mapping_options(by_name):
+    """Translations joined eagerly from a class that's only reached through
+    joinedload() are joined on the first query too
+    """
+    Base = declarative_base()
+    engine = create_engine("sqlite:///:memory:")
+
+    class Language(Base):
+        __tablename__ = 'languages'
+        id = Column(Integer, primary_key=True, nullable=False)
+        identifier = Column(String(2), nullable=False, unique=True)
+
+    class Species(Base):
+        __tablename__ = 'species'
+        __singlename__ = 'species'
+        id = Column(Integer, primary_key=True, nullable=False)
+        translation_classes = []
+
+    class Pet(Base):
+        __tablename__ = 'pets'
+        id = Column(Integer, primary_key=True, nullable=False)
+        species_id = Column(Integer, ForeignKey(Species.id))
+        species = relationship(Species)
+
+    SpeciesText = create_translation_table('species_text', Species, 'texts',
+        language_class=Language, relation_lazy='joined',
+        name = Column(String(100)),
+    )
+
+    Base.metadata.create_all(engine)
+    engine.execute(Language.__table__.insert(), id=1, identifier='en')
+    engine.execute(Species.__table__.insert(), id=1)
+    engine.execute(Pet.__table__.insert(), id=1, species_id=1)
+    engine.execute(SpeciesText.__table__.insert(),
+                   species_id=1, local_language_id=1, name='eevee')
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda *args: statements.append(args[2]))
+
+    sess = MultilangScopedSession(sessionmaker(
+        bind=engine, class_=MultilangSession, default_language_id=1))
+
+    option = joinedload('species' if by_name else Pet.species)
+    pet = sess.query(Pet).options(option).one()
+    assert manager_of_class(SpeciesText) is not None
+    assert pet.species.name == 'eevee'
+    assert len(statements) == 1
+
+def test_i18n_table_eager_mapping(monkeypatch):
+    """On SQLAlchemy versions lazy mapping wasn't written for, translation
+    classes are mapped right away, with no placeholder relationships"""
+    monkeypatch.setattr(multilang, 'LAZY_MAPPING', False)
+    Base = declarative_base()
+
+    class Language(Base):
+        __tablename__ = 'languages'
+        id = Column(Integer, primary_key=True, nullable=False)
+
+    class Foo(Base):
+        __tablename__ = 'foos'
+        __singlename__ = 'foo'
+        id = Column(Integer, primary_key=True, nullable=False)
+        translation_classes = []
+
+    FooText = create_translation_table('foo_text', Foo, 'texts',
+        language_class=Language, name = Column(String(100)),
+    )
+    assert manager_of_class(FooText) is not None
+    assert not isinstance(Foo.__dict__['texts'],
+                          multilang._UnmappedRelationship)
+    assert inspect(Foo.texts).property.mapper.class_ is FooText
+
+def test_preload_language(session):
+    """Preloading takes one query per translation table, and none after"""
+    session.expunge_all()
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+    event.listen(session.bind, 'before_cursor_execute', count)
+    try:
+        # More moves than fit in an IN clause, and fewer species
+        moves = session.query(tables.Move).all()
+        species = session.query(tables.PokemonSpecies) \
+            .filter(tables.PokemonSpecies.id <= 20).all()
+        japanese = session.query(tables.Language) \
+            .filter_by(identifier=u'ja').one()
+        classes = [tables.Move, tables.PokemonSpecies]
+
+        del statements[:]
+        session.preload_language(classes=classes)
+        assert len(statements) == sum(
+            len(cls.translation_classes) for cls in classes)
+
+        del statements[:]
+        assert moves[0].name == u'Pound'
+        assert species[0].genus == u'Seed Pokémon'
+        for obj in moves + species:
+            obj.name
+        assert statements == []
+
+        # Another language goes into the maps, with a query per table
+        del statements[:]
+        session.preload_language(japanese, classes=[tables.Move])
+        assert len(statements) == len(tables.Move.translation_classes)
+        del statements[:]
+        assert moves[0].name_map[japanese] == u'はたく'
+        assert [move.name_map.get(japanese) for move in moves[:20]]
+        assert statements == []
+
+        session.preload_language(classes=[tables.Move], maps=True)
+        del statements[:]
+        assert moves[0].name_map[japanese] == u'はたく'
+        assert len(moves[0].names) > 2
+        assert statements == []
+    finally:
+        event.remove(session.bind, 'before_cursor_execute', count)
+        session.expunge_all()
+
+def test_map_languages(session):
+    """Only some languages are loaded into the maps, and others on demand"""
+    session.expunge_all()
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+    event.listen(session.bind, 'before_cursor_execute', count)
+    try:
+        english, japanese, french = [
+            session.query(tables.Language).filter_by(identifier=identifier).one()
+            for identifier in (u'en', u'ja', u'fr')]
+
+        del statements[:]
+        moves = session.query(tables.Move).with_languages(english, japanese) \
+            .filter(tables.Move.id <= 20).all()
+        assert len(statements) == 1 + len(tables.Move.translation_classes)
+
+        del statements[:]
+        assert moves[0].name_map[japanese] == u'はたく'
+        assert len(moves[0].names) == 2
+        assert statements == []
+
+        # Other languages are loaded one at a time, and only looked for once
+        assert moves[0].name_map[french] == u'Écras’Face'
+        assert french in moves[0].names
+        assert len(statements) == 1
+        assert moves[0].name_map.get(tables.Language()) is None
+
+        # Or, for the whole session, when the maps are first used
+        session.expunge_all()
+        english = session.query(tables.Language).filter_by(identifier=u'en').one()
+        session.map_languages = [english]
+        moves = session.query(tables.Move).filter(tables.Move.id <= 20).all()
+        del statements[:]
+        assert [move.name_map[english] for move in moves] == \
+            [move.name for move in moves]
+        assert len(statements) == 1
+        assert len(moves[1].names) == 1
+    finally:
+        session.map_languages = None
+        event.remove(session.bind, 'before_cursor_execute', count)
+        session.expunge_all()
+
 classes = []
 for cls in tables.mapped_classes:
     classes.append(cls)
@@ -186,7 +428,8 @@ def test_texts(cls):
                 pytest.fail('%s: identifier column name/type mismatch' % column)
             if column.info.get('official', None) and format not in 'gametext plaintext':
                 pytest.fail('%s: official text with bad format' % column)
-            text_columns.append(column)
+            if not column.info.get('derived', None):
+                text_columns.append(column)
         else:
             if isinstance(column.type, tables.Unicode):
                 pytest.fail('%s: text column without format' % column)
@@ -0,0 +1,112 @@
+# encoding: utf8
+
+import json
+import sys
+import threading
+
+import pytest
+parametrize = pytest.mark.parametrize
+
+from six.moves import http_client
+from six.moves.urllib.parse import quote
+
+if sys.version_info < (3, 5):
+    pytest.skip("the server needs asyncio", allow_module_level=True)
+
+import pokedex.lookup
+import pokedex.server
+
+
+@pytest.fixture(scope='module')
+def server(request, session, lookup):
+    server = pokedex.server.LookupServer(
+        lambda: pokedex.lookup.PokedexLookup(
+            lookup.directory, session, backend=type(lookup.backend)),
+        threads=2)
+    server.warm_up()
+
+    started = threading.Event()
+    thread = threading.Thread(target=server.serve_forever, kwargs=dict(
+        port=0, started=lambda server: started.set()))
+    thread.start()
+    started.wait()
+
+    yield server
+
+    server.stop()
+    thread.join()
+
+
+def get(server, path, method='GET'):
+    connection = http_client.HTTPConnection(*server.address)
+    try:
+        connection.request(method, path)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf8'))
+    finally:
+        connection.close()
+
+
+@parametrize(
+    ('path', 'table', 'id'),
+    [
+        (u'/lookup?q=eevee',                        'pokemon_species', 133),
+        (u'/lookup?q=%s' % quote(u'イーブイ'.encode('utf8')),
+                                                    'pokemon_species', 133),
+        (u'/lookup?q=eevey',                        'pokemon_species', 133),
+        (u'/lookup?q=1&type=pokemon_species',       'pokemon_species', 1),
+        (u'/prefix?q=eev',                          'pokemon_species', 133),
+        (u'/autocomplete?q=eev',                    'pokemon_species', 133),
+        (u'/random?type=moves',                     'moves',           None),
+    ]
+)
+def test_endpoints(server, path, table, id):
+    status, results = get(server, path)
+    assert status == 200
+    assert results[0]['table'] == table
+    if id is not None:
+        assert results[0]['id'] == id
+
+
+def test_lookup_result(server):
+    status, results = get(server, u'/lookup?q=eevee')
+    assert results == [dict(
+        name=u'Eevee', indexed_name=u'eevee', table=u'pokemon_species',
+        id=133, language=u'en', iso639=u'en', iso3166=u'us', exact=True,
+    )]
+
+    status, results = get(server, u'/lookup?q=eevey&exact=1')
+    assert results == []
+
+
+def test_limit(server):
+    status, results = get(server, u'/autocomplete?q=p&limit=3')
+    assert len(results) == 3
+    status, results = get(server, u'/prefix?q=p&limit=1000')
+    assert len(results) == pokedex.server.MAX_LIMIT
+
+
+@parametrize(
+    ('path', 'method', 'status'),
+    [
+        (u'/lookup',                'GET',  400),
+        (u'/prefix?q=p&limit=lots', 'GET',  400),
+        (u'/nothing',               'GET',  404),
+        (u'/lookup?q=eevee',        'POST', 405),
+    ]
+)
+def test_errors(server, path, method, status):
+    assert get(server, path, method)[0] == status
+
+
+def test_keep_alive(server):
+    connection = http_client.HTTPConnection(*server.address)
+    try:
+        for name in (u'eevee', u'pikachu', u'mew'):
+            connection.request('GET', u'/lookup?q=' + name)
+            response = connection.getresponse()
+            assert response.status == 200
+            assert json.loads(response.read().decode('utf8'))[0]['name'] \
+                .lower() == name
+    finally:
+        connection.close()
@@ -3,7 +3,9 @@
 import pytest
 parametrize = pytest.mark.parametrize
 
-from pokedex.db import tables, connect, util, markdown
+from sqlalchemy import event
+
+from pokedex.db import tables, connect, util, markdown, render
 
 @pytest.fixture(scope="module")
 def session(request):
@@ -114,6 +116,182 @@ def test_markdown_string(session):
     assert md.as_html(extension=IdentifierTestExtension(session)) == (
             '<p><a href="move/thunderbolt">Thunderbolt</a> <a href="mechanic/paralysis">paralyzes</a> <a href="form/sky shaymin">Sky Shaymin</a>. <a href="pokemon/mewthree">mewthree</a> does not exist.</p>')
 
+def test_markdown_cache(session, tmpdir):
+    en = util.get(session, tables.Language, u'en')
+    md = markdown.MarkdownString(u'[]{move:thunderbolt} may [paralyze]{mechanic:paralysis}.', session, en)
+    expected = '<p><span>Thunderbolt</span> may <span>paralyze</span>.</p>'
+
+    # Caching is off by default
+    assert session.markdown_extension.render_cache is None
+
+    cache = markdown.RenderCache(size=10, directory=str(tmpdir))
+    extension = markdown.PokedexLinkExtension(session)
+    extension.render_cache = cache
+    assert md.as_html(extension=extension) == expected
+    assert (cache.hits, cache.disk_hits, cache.misses) == (0, 0, 1)
+    assert md.as_html(extension=extension) == expected
+    assert (cache.hits, cache.disk_hits, cache.misses) == (1, 0, 1)
+
+    # Another extension class gets its own HTML
+    class LinkExtension(markdown.PokedexLinkExtension):
+        render_cache = cache
+        def identifier_url(self, category, ident):
+            return "%s/%s" % (category, ident)
+    assert md.as_html(extension=LinkExtension(session)) == (
+            '<p><a href="move/thunderbolt">Thunderbolt</a> may <a href="mechanic/paralysis">paralyze</a>.</p>')
+    assert cache.misses == 2
+
+    # What's on disk survives the memory
+    cache.memory.clear()
+    assert md.as_html(extension=extension) == expected
+    assert (cache.hits, cache.disk_hits, cache.misses) == (1, 1, 2)
+    assert len(tmpdir.listdir()) == 2
+
+    # Clearing the extension's cache, as `pokedex load` does, clears both
+    extension.clear_cache()
+    assert not any(subdirectory.listdir() for subdirectory in tmpdir.listdir())
+    assert md.as_html(extension=extension) == expected
+    assert cache.misses == 3
+
+def test_markdown_pool(session):
+    extension = markdown.PokedexLinkExtension(session)
+    md = extension.get_markdown()
+    assert md.convert(u'*a*') == '<p><em>a</em></p>'
+    extension.release_markdown(md)
+    assert extension.get_markdown() is md
+    assert md.convert(u'[]{move:tackle}') == '<p><span>Tackle</span></p>'
+
+def test_resolve_links(session):
+    """Links are looked up with a query per category, and none after"""
+    en = util.get(session, tables.Language, u'en')
+    strings = [
+        markdown.MarkdownString(source_text, session, en)
+        for source_text in [
+            u'[]{move:thunderbolt} and []{move:tackle}; []{move:bogus}.',
+            u'[]{form:sky shaymin} uses []{move:seed-flare}.',
+            u'[]{type:grass}, []{type:electric}, [Static]{ability:static}',
+        ]
+    ]
+
+    # A subclass, so the HTML isn't taken from `pokedex render`'s table
+    class LinkExtension(markdown.PokedexLinkExtension):
+        pass
+    extension = LinkExtension(session)
+
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+    event.listen(session.bind, 'before_cursor_execute', count)
+    try:
+        markdown.resolve_links(strings, extension)
+        assert len(statements) == 4
+        del statements[:]
+        html = [string.as_html(extension=extension) for string in strings]
+        assert not statements
+    finally:
+        event.remove(session.bind, 'before_cursor_execute', count)
+
+    assert html == [
+        '<p><span>Thunderbolt</span> and <span>Tackle</span>; <span>bogus</span>.</p>',
+        '<p><span>Sky Shaymin</span> uses <span>Seed Flare</span>.</p>',
+        '<p><span>Grass</span>, <span>Electric</span>, <span>Static</span></p>',
+    ]
+    assert extension.get_link(u'move', u'bogus') is None
+    obj, name = extension.get_link(u'type', u'grass')
+    assert (obj.identifier, name) == (u'grass', u'Grass')
+
+def test_as_text_names(session):
+    """as_text() loads each category's names once, and no objects"""
+    en = util.get(session, tables.Language, u'en')
+    de = util.get(session, tables.Language, u'de')
+    session.markdown_extension.clear_cache()
+    session.expunge_all()
+
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+    event.listen(session.bind, 'before_cursor_execute', count)
+    try:
+        md = markdown.MarkdownString(u'[]{move:thunderbolt}, []{move:tackle}, [a label]{move:surf}, []{move:bogus}, []{form:sky shaymin}, []{mechanic:hp}', session, en)
+        assert md.as_text() == u'Thunderbolt, Tackle, a label, bogus, Sky Shaymin, hp'
+        assert len(statements) == 2
+        assert md.as_text() == u'Thunderbolt, Tackle, a label, bogus, Sky Shaymin, hp'
+        assert len(statements) == 2
+
+        # Types are named in the text's language
+        md = markdown.MarkdownString(u'[]{type:grass}, []{move:tackle}', session, de)
+        assert md.as_text() == u'Pflanze, Tackle'
+        assert len(statements) == 3
+    finally:
+        event.remove(session.bind, 'before_cursor_execute', count)
+    assert not session.identity_map
+
+def test_content_hash(session):
+    en = util.get(session, tables.Language, u'en')
+    fr = util.get(session, tables.Language, u'fr')
+    text = u'[]{type:grass}'
+    # No language means the default one
+    assert (markdown.MarkdownString(text, session, None).content_hash() ==
+            markdown.MarkdownString(text, session, en).content_hash())
+    assert (markdown.MarkdownString(text, session, fr).content_hash() !=
+            markdown.MarkdownString(text, session, en).content_hash())
+
+@pytest.mark.slow
+def test_render_prose(session):
+    """Rendered prose is served in place of rendering, for the default
+    extension only"""
+    # Rendering commits, so drop the other tests' changes first
+    session.rollback()
+    count = render.render_prose(session, procs=1)
+    try:
+        assert count > 1000
+        assert render.render_prose(session, procs=1) == 0
+
+        move = util.get(session, tables.Move, u'thunderbolt')
+        effect = move.effect
+        extension = session.markdown_extension
+        html, text = extension.get_stored_prose(effect.content_hash())
+        assert html == effect._render_html(extension)
+        assert text == effect.as_text()
+
+        # Serve something recognizable, to see where it comes from
+        session.execute(render.rendered_prose_table.update().where(
+            render.rendered_prose_table.c.content_hash ==
+            effect.content_hash()).values(html=u'<p>stored</p>',
+                                          text=u'stored'))
+        assert effect.as_html() == u'<p>stored</p>'
+        assert effect.as_text() == text
+
+        class LinkExtension(markdown.PokedexLinkExtension):
+            pass
+        assert effect.as_html(extension=LinkExtension(session)) == html
+    finally:
+        session.rollback()
+        render.metadata.drop_all(bind=session.connection())
+        session.commit()
+        session.markdown_extension.clear_cache()
+
+class WorkerLinkExtension(markdown.PokedexLinkExtension):
+    pass
+
+def test_render_worker_extension(session):
+    """Render workers use the session's extension class, if they can import
+    it"""
+    class LocalLinkExtension(markdown.PokedexLinkExtension):
+        pass
+    assert render._class_path(LocalLinkExtension) is None
+
+    path = render._class_path(WorkerLinkExtension)
+    assert path == (__name__, 'WorkerLinkExtension')
+    render._init_worker(str(session.bind.url), 9, path)
+    try:
+        assert type(render._worker_session.markdown_extension) is \
+            WorkerLinkExtension
+        assert render._worker_session.default_language_id == 9
+    finally:
+        render._worker_session.close()
+        render._worker_session = None
+
 def markdown_column_params():
     """Check all markdown values
 
@@ -4,6 +4,7 @@ import pytest
 parametrize = pytest.mark.parametrize
 
 from pokedex.db import tables, util
+from pokedex.db.multilang import FallbackColumn
 
 def test_get_item_identifier(session):
     item = util.get(session, tables.Item, identifier=u'master-ball')
@@ -42,6 +43,121 @@ def test_types_french_order(session):
     # Postgres doesn't have this problem.
     assert types[-1].name_map[french] in (u'Électrik', u'Vol'), types[-1].name_map[french]
 
+def test_order_by_name_without_sort_keys(session, tmpdir):
+    """Databases loaded before there were sort keys fall back to the names"""
+    import shutil
+    import sqlite3
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from pokedex.db.multilang import MultilangSession
+
+    url = session.bind.url
+    if url.get_backend_name() != 'sqlite' or not url.database:
+        pytest.skip("needs an SQLite database file to copy")
+    if sqlite3.sqlite_version_info < (3, 35):
+        pytest.skip("needs SQLite 3.35 to drop columns")
+    path = str(tmpdir.join('old.sqlite'))
+    shutil.copy(url.database, path)
+    connection = sqlite3.connect(path)
+    connection.execute('DROP INDEX ix_type_names_sort_key')
+    connection.execute('ALTER TABLE type_names DROP COLUMN sort_key')
+    connection.commit()
+    connection.close()
+
+    old_session = sessionmaker(
+        bind=create_engine('sqlite:///' + path), class_=MultilangSession,
+        default_language_id=session.default_language_id)()
+    try:
+        french = util.get(old_session, tables.Language, u'fr')
+        types = old_session.query(tables.Type).filter(tables.Type.id < 10000)
+        types = util.order_by_name(types, tables.Type, language=french)
+        names = [type_.name_map[french] for type_ in types]
+        assert names[0] == u'Acier'
+        assert names == sorted(names, key=lambda name: name.lower())
+    finally:
+        old_session.close()
+
+def test_get_pokemon_names(session):
+    query = session.query(tables.PokemonSpecies)
+    query = util.filter_name(query, tables.PokemonSpecies, (u'Eevee', u'Mew'), None)
+    query = util.order_by_name(query, tables.PokemonSpecies)
+    assert [poke.name for poke in query] == [u'Eevee', u'Mew']
+
+def test_with_local_names(session):
+    query = session.query(tables.Move).with_local_names(tables.Move)
+    query = query.filter(tables.Move.names_table.name == u'Tackle')
+    assert 'EXISTS' not in str(query)
+    assert query.one().identifier == u'tackle'
+
+    # Joining again in the same language is a no-op; in another, an error
+    assert query.with_local_names(tables.Move) is query
+    french = util.get(session, tables.Language, u'fr')
+    with pytest.raises(ValueError):
+        query.with_local_names(tables.Move, french)
+
+def test_with_local_names_outer(session):
+    query = session.query(tables.Type)
+    count = query.count()
+    # Not every type has a Korean name
+    unnamed = util.get(session, tables.Language, u'ko')
+    assert query.with_local_names(tables.Type, unnamed).count() < count
+    assert query.with_local_names(tables.Type, unnamed, outer=True).count() == count
+
+def test_fallback_column(session):
+    # Not every move has a Czech name; those fall back to English
+    czech = util.get(session, tables.Language, u'cs')
+    name = FallbackColumn(tables.Move, 'name', [czech])
+    query = session.query(tables.Move.identifier, name.column)
+    query = query.with_fallback(name).filter(name.like(u'Hyper%'))
+    query = query.order_by(name)
+    assert query.all() == [
+        (u'hyper-beam', u'Hyperpaprsek'),
+        (u'hyperspace-fury', u'Hyperspace Fury'),
+        (u'hyperspace-hole', u'Hyperspace Hole'),
+        (u'hyper-fang', u'Hypertesák'),
+    ]
+
+    with pytest.raises(ValueError):
+        FallbackColumn(tables.Move, 'nonsense', [czech])
+
+def test_get_cached(session):
+    cache = util.bakery.cache
+    french = util.get(session, tables.Language, u'fr')
+    util.get(session, tables.Move, name=u'Tackle')
+    util.get(session, tables.Move, name=u'Charge', language=french)
+    cache.reset_stats()
+
+    # Same shapes, other values: built and compiled once, above
+    assert util.get(session, tables.Move, name=u'Surf').identifier == u'surf'
+    assert util.get(session, tables.Move, name=u'Surf', language=french).identifier == u'surf'
+    assert cache.hits == dict(queries=2, compiled=2, clauses=0)
+    assert cache.misses == dict(queries=0, compiled=0, clauses=0)
+    assert cache.hit_rate() == 1
+
+def test_plain_filter_and_order_cached(session):
+    cache = util.bakery.cache
+    french = util.get(session, tables.Language, u'fr')
+    def query(names):
+        query = session.query(tables.PokemonSpecies)
+        query = util.filter_name(query, tables.PokemonSpecies, names, None)
+        query = util.order_by_name(query, tables.PokemonSpecies, french)
+        return [poke.identifier for poke in query]
+    query((u'Eevee', ))
+    cache.reset_stats()
+
+    # The same clauses, with other names
+    assert query((u'Pikachu', u'Eevee')) == [u'eevee', u'pikachu']
+    assert query((u'Mew', )) == [u'mew']
+    assert cache.hits['clauses'] == 4
+    assert cache.misses['clauses'] == 0
+
+def test_baked_filter_and_order(session):
+    query = util.bakery(lambda session: session.query(tables.PokemonSpecies))
+    query = util.filter_name(query, tables.PokemonSpecies, (), None)
+    query = util.order_by_name(query, tables.PokemonSpecies)
+    result = query(session.registry()).params(name=[u'Mew', u'Eevee'])
+    assert [poke.name for poke in result] == [u'Eevee', u'Mew']
+
 @parametrize('id', range(1, 10))
 def test_get_pokemon_id(session, id):
     result = util.get(session, tables.Pokemon, id=id)
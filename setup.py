@@ -1,17 +1,32 @@
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 import sys
 
+# Modules that need a newer Python than the rest, with the version they need.
+# Older Pythons would fail to byte-compile them, so they're left out there
+NEWER_PYTHON_MODULES = {
+    ('pokedex', 'server'): (3, 5, 2),
+}
+
+class BuildPy(build_py):
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        return [(package, module, path) for package, module, path in modules
+                if sys.version_info >= NEWER_PYTHON_MODULES.get(
+                    (package, module), (0,))]
+
 setup(
     name = 'Pokedex',
     version = '0.1',
     zip_safe = False,
+    cmdclass = {'build_py': BuildPy},
     packages = find_packages(),
     package_data = {
         'pokedex': ['data/csv/*.csv']
     },
     install_requires = [
-        'SQLAlchemy>=0.9.7',
+        'SQLAlchemy>=1.2,<1.4',
         'whoosh>=2.5,<2.7',
         'markdown',
         'construct',